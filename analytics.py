@@ -0,0 +1,226 @@
+"""
+Analytics Layer - Vectorized rate statistics
+Loads a currency's series into NumPy arrays once and computes returns, moving averages,
+volatility, bid/ask spread statistics and drawdowns without Python-level loops
+"""
+
+import math
+from datetime import date
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from cache import RateSeries
+
+# Trading days per year used to annualize volatility
+TRADING_DAYS = 252
+
+DEFAULT_WINDOWS = (20, 50)
+
+
+def to_list(values: np.ndarray, digits: int = 6) -> List[Optional[float]]:
+    """Convert an array to a JSON-friendly list (NaN -> None)"""
+    return [None if math.isnan(v) else round(v, digits) for v in values.tolist()]
+
+
+def to_float(value) -> Optional[float]:
+    value = float(value)
+    return None if math.isnan(value) else value
+
+
+class RateAnalytics:
+    """Vectorized statistics over one currency's rate series"""
+
+    FIELDS = ('mid', 'bid', 'ask')
+
+    def __init__(self, series: RateSeries):
+        self.currency = series.currency
+        # Zero-copy views over the compact array-backed series
+        self.days = np.frombuffer(series.days, dtype=np.int32) if len(series) else np.empty(0, np.int32)
+        self.columns = {
+            field: np.frombuffer(getattr(series, field), dtype=np.float64) if len(series) else np.empty(0)
+            for field in self.FIELDS
+        }
+
+    def __len__(self) -> int:
+        return len(self.days)
+
+    def column(self, field: str = 'mid') -> np.ndarray:
+        """Values of a field; mid falls back to the bid/ask midpoint on rows Table A has not filled yet"""
+        values = self.columns[field]
+        if field == 'mid':
+            missing = np.isnan(values)
+            if missing.any():
+                values = np.where(missing, (self.columns['bid'] + self.columns['ask']) / 2, values)
+        return values
+
+    def values(self, field: str = 'mid'):
+        """Valid (non-NaN) values of a field and their day ordinals"""
+        values = self.column(field)
+        valid = ~np.isnan(values)
+        return values[valid], self.days[valid]
+
+    @staticmethod
+    def day_string(ordinal) -> str:
+        return date.fromordinal(int(ordinal)).isoformat()
+
+    @staticmethod
+    def log_returns(values: np.ndarray) -> np.ndarray:
+        """Daily log returns (one element shorter than the input)"""
+        if len(values) < 2:
+            return np.empty(0)
+        return np.diff(np.log(values))
+
+    @staticmethod
+    def sma(values: np.ndarray, window: int) -> np.ndarray:
+        """Simple moving average (NaN until the window is filled)"""
+        out = np.full(len(values), np.nan)
+        if window <= 0 or len(values) < window:
+            return out
+        cumsum = np.cumsum(np.insert(values, 0, 0.0))
+        out[window - 1:] = (cumsum[window:] - cumsum[:-window]) / window
+        return out
+
+    @staticmethod
+    def ema(values: np.ndarray, window: int) -> np.ndarray:
+        """Exponential moving average (alpha = 2 / (window + 1)), seeded with the first value
+
+        Evaluated in closed form per block: the recursion is rewritten as a scaled cumulative
+        sum, with block length chosen so the decay powers stay within float range.
+        """
+        n = len(values)
+        out = np.empty(n)
+        if n == 0:
+            return out
+        alpha = 2.0 / (window + 1)
+        decay = 1.0 - alpha
+        block = n if decay <= 0 else max(1, int(-250 / math.log10(decay)))
+
+        previous = values[0]
+        for start in range(0, n, block):
+            chunk = values[start:start + block]
+            powers = decay ** np.arange(1, len(chunk) + 1)
+            if decay > 0:
+                out[start:start + len(chunk)] = powers * (previous + alpha * np.cumsum(chunk / powers))
+            else:
+                out[start:start + len(chunk)] = chunk
+            previous = out[start + len(chunk) - 1]
+        return out
+
+    @staticmethod
+    def rolling_std(values: np.ndarray, window: int) -> np.ndarray:
+        """Rolling sample standard deviation (NaN until the window is filled)"""
+        out = np.full(len(values), np.nan)
+        if window < 2 or len(values) < window:
+            return out
+        padded = np.insert(values, 0, 0.0)
+        sums = np.cumsum(padded)
+        squares = np.cumsum(padded ** 2)
+        window_sum = sums[window:] - sums[:-window]
+        window_squares = squares[window:] - squares[:-window]
+        variance = (window_squares - window_sum ** 2 / window) / (window - 1)
+        out[window - 1:] = np.sqrt(np.maximum(variance, 0.0))
+        return out
+
+    def rolling_volatility(self, window: int = 20, field: str = 'mid') -> np.ndarray:
+        """Annualized rolling volatility of daily log returns"""
+        values, _ = self.values(field)
+        return self.rolling_std(self.log_returns(values), window) * math.sqrt(TRADING_DAYS)
+
+    def spread_stats(self) -> Dict:
+        """Bid/ask spread statistics (absolute in PLN and relative to the mid price in %)"""
+        bid, ask = self.columns['bid'], self.columns['ask']
+        valid = ~(np.isnan(bid) | np.isnan(ask))
+        if not valid.any():
+            return {}
+        spread = ask[valid] - bid[valid]
+        relative = spread / ((ask[valid] + bid[valid]) / 2) * 100
+        return {
+            'last': to_float(spread[-1]),
+            'mean': to_float(spread.mean()),
+            'min': to_float(spread.min()),
+            'max': to_float(spread.max()),
+            'mean_percent': to_float(relative.mean()),
+            'last_percent': to_float(relative[-1])
+        }
+
+    def drawdown(self, field: str = 'mid') -> Dict:
+        """Maximum drawdown with its peak and trough dates"""
+        values, days = self.values(field)
+        if len(values) < 2:
+            return {}
+        running_max = np.maximum.accumulate(values)
+        drawdowns = values / running_max - 1
+        trough = int(np.argmin(drawdowns))
+        peak = int(np.argmax(values[:trough + 1]))
+        return {
+            'max_drawdown_percent': to_float(drawdowns[trough] * 100),
+            'peak_date': self.day_string(days[peak]),
+            'trough_date': self.day_string(days[trough]),
+            'current_drawdown_percent': to_float(drawdowns[-1] * 100)
+        }
+
+    def min_max(self, field: str = 'mid') -> Dict:
+        values, days = self.values(field)
+        if not len(values):
+            return {}
+        low, high = int(np.argmin(values)), int(np.argmax(values))
+        return {
+            'min': to_float(values[low]), 'min_date': self.day_string(days[low]),
+            'max': to_float(values[high]), 'max_date': self.day_string(days[high]),
+            'mean': to_float(values.mean())
+        }
+
+    def summary(self, field: str = 'mid', windows: Sequence[int] = DEFAULT_WINDOWS) -> Dict:
+        """All statistics for a field, as JSON-friendly scalars"""
+        values, days = self.values(field)
+        if not len(values):
+            return {'currency': self.currency, 'field': field, 'points': 0}
+
+        returns = self.log_returns(values)
+        first, last = values[0], values[-1]
+        result = {
+            'currency': self.currency,
+            'field': field,
+            'points': int(len(values)),
+            'first_date': self.day_string(days[0]),
+            'last_date': self.day_string(days[-1]),
+            'current': to_float(last),
+            'change': to_float(last - first),
+            'change_percent': to_float((last / first - 1) * 100) if first else None,
+            'range': self.min_max(field),
+            'returns': {
+                'mean_daily_log': to_float(returns.mean()) if len(returns) else None,
+                'volatility_annualized': (to_float(returns.std(ddof=1) * math.sqrt(TRADING_DAYS))
+                                          if len(returns) > 1 else None),
+                'best_day': to_float(returns.max()) if len(returns) else None,
+                'worst_day': to_float(returns.min()) if len(returns) else None
+            },
+            'drawdown': self.drawdown(field),
+            'spread': self.spread_stats(),
+            'sma': {},
+            'ema': {},
+            'volatility': {}
+        }
+        for window in windows:
+            result['sma'][str(window)] = to_float(self.sma(values, window)[-1])
+            result['ema'][str(window)] = to_float(self.ema(values, window)[-1])
+            volatility = self.rolling_std(returns, window) * math.sqrt(TRADING_DAYS)
+            result['volatility'][str(window)] = to_float(volatility[-1]) if len(volatility) else None
+        return result
+
+    def indicator_series(self, field: str = 'mid', windows: Sequence[int] = DEFAULT_WINDOWS) -> Dict:
+        """Full indicator series aligned with the valid dates of a field (for charts)"""
+        values, days = self.values(field)
+        returns = self.log_returns(values)
+        result = {
+            'dates': [self.day_string(d) for d in days.tolist()],
+            'values': to_list(values)
+        }
+        for window in windows:
+            result[f'sma_{window}'] = to_list(self.sma(values, window))
+            result[f'ema_{window}'] = to_list(self.ema(values, window))
+            volatility = self.rolling_std(returns, window) * math.sqrt(TRADING_DAYS)
+            # Returns start on the second day - align volatility with the dates
+            result[f'volatility_{window}'] = [None] + to_list(volatility) if len(values) else []
+        return result
@@ -1,102 +1,347 @@
 """
 Presentation Layer - Flask routes and user interface
 Handles HTTP requests, routing, and template rendering
+
+Applications are built by create_app(). `from app import app` (and the module-level
+scheduler, crypto_snapshots, init_db and start_scheduler used by the entry points) refer
+to a default application created on first use.
 """
 
+import os
 import json
-from flask import Flask, render_template, jsonify, request
-from datetime import datetime, timedelta
+import threading
+import time
+from datetime import datetime
+from flask import (Blueprint, Flask, Response, current_app, render_template, jsonify, request, make_response,
+                   stream_with_context, g, before_render_template, template_rendered)
 
 # Import our custom modules
 from models import DatabaseManager, CurrencyRatesModel
-from services import CurrencyDataService, CryptocurrencyService, ChartDataService
+from services import (CryptocurrencyService, ChartDataService, PayloadService, RatesExportService, AnalyticsService,
+                      RollupService, ConversionService, FreshnessService, CurrencyRegistry, crypto_cache,
+                      CRYPTO_SNAPSHOT_INTERVAL)
+from scheduler import IngestionScheduler, PeriodicJob
+from cache import series_cache, payload_cache, response_cache
+from snapshots import snapshot_store
+import metrics
+
+# Build the chart payloads of the tracked currencies on a background thread when serving starts,
+# so the first page views are answered from memory (WARM_CACHE=0 to skip, e.g. in tests)
+WARM_CACHE = os.environ.get('WARM_CACHE', '1') != '0'
 
-app = Flask(__name__)
+views = Blueprint('views', __name__)
+
+_default_app = None
+_default_app_lock = threading.Lock()
 
-# Setup database teardown
-@app.teardown_appcontext
 def close_connection(exception):
     DatabaseManager.close_connection(exception)
 
-@app.route('/check_and_fetch_data')
-def check_and_fetch_data():
-    """Check if we have enough data and fetch only missing data if needed"""
-    result = CurrencyDataService.check_and_fetch_missing_data()
-    return jsonify(result), 200
+# Request instrumentation: latency per route, plus db/upstream/render phases for Server-Timing
+@views.before_app_request
+def start_request_timer():
+    if metrics.METRICS_ENABLED:
+        g.request_started = time.perf_counter()
+        g.timings_token = metrics.start_request()
+
+@views.after_app_request
+def record_request_metrics(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        # Streamed bodies are still being generated here - their time is not included
+        elapsed = time.perf_counter() - started
+        route = request.url_rule.rule if request.url_rule else '<unmatched>'
+        metrics.observe_request(route, request.method, response.status_code, elapsed)
+        if metrics.SERVER_TIMING:
+            response.headers['Server-Timing'] = metrics.server_timing(elapsed)
+    return response
+
+@views.teardown_app_request
+def end_request_timer(exception):
+    token = g.pop('timings_token', None)
+    if token is not None:
+        metrics.end_request(token)
+
+def start_render_timer(sender, template, context, **extra):
+    g.render_started = time.perf_counter()
+
+def record_render_time(sender, template, context, **extra):
+    started = g.pop('render_started', None)
+    if started is not None:
+        metrics.add_timing('render', time.perf_counter() - started)
+
+if metrics.METRICS_ENABLED:
+    metrics.registry.add_collector(metrics.cache_collector({
+        'series': series_cache.stats,
+        'payloads': payload_cache.stats,
+        'responses': response_cache.stats,
+        'crypto': crypto_cache.stats,
+        'snapshots': snapshot_store.stats
+    }))
 
-@app.route('/api/rates')
+def not_modified(etag, last_modified=None):
+    """Return a 304 response if the client already holds the current representation"""
+    if not PayloadService.is_not_modified(etag, last_modified, request.headers.get('If-None-Match'),
+                                          request.headers.get('If-Modified-Since')):
+        return None
+    return add_cache_headers(Response(status=304), etag, last_modified)
+
+def add_cache_headers(response, etag, last_modified=None):
+    """Attach the validators built by PayloadService.cache_headers"""
+    response.headers.update(PayloadService.cache_headers(etag, last_modified))
+    return response
+
+@views.route('/api/sync/status')
+def sync_status():
+    """Return background sync status and last-run timing"""
+    return jsonify(current_app.extensions['ingestion'].status())
+
+@views.route('/api/sync', methods=['POST'])
+def trigger_sync():
+    """Request an immediate background sync without blocking the request"""
+    scheduler = current_app.extensions['ingestion']
+    started = scheduler.trigger()
+    status = scheduler.status()
+    status['message'] = "Synchronizacja uruchomiona w tle." if started else "Synchronizacja już trwa."
+    return jsonify(status), 202
+
+@views.route('/api/freshness')
+def api_freshness():
+    """Return per-currency row counts, date bounds and staleness against the NBP calendar"""
+    return jsonify(FreshnessService.status(CurrencyRegistry.tracked()))
+
+@views.route('/api/latest')
+def api_latest():
+    """Return the latest stored rates of the tracked (or the requested) currencies"""
+    codes = request.args.get('currencies')
+    codes = [code.strip().upper() for code in codes.split(',') if code.strip()] if codes else CurrencyRegistry.tracked()
+    rates = CurrencyRatesModel.get_latest_rates(codes)
+    return jsonify({'status': 'success', 'data': [RatesExportService.to_dict(row) for row in rates]})
+
+@views.route('/api/rates')
 def api_rates():
-    """Return currency rates data in JSON format"""
+    """Return currency rates data as JSON, columnar JSON, or streamed NDJSON/CSV"""
     # Get query parameters
     currency_code = request.args.get('currency')
     limit = request.args.get('limit', type=int, default=30)
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
+    output_format = request.args.get('format', 'json')
+    cursor = request.args.get('cursor')
+    
+    if output_format not in RatesExportService.FORMATS:
+        return jsonify({'status': 'error', 'message': f"Unsupported format: {output_format}"}), 400
+    try:
+        after = CurrencyRatesModel.decode_cursor(cursor) if cursor else None
+    except ValueError:
+        return jsonify({'status': 'error', 'message': "Invalid cursor"}), 400
     
-    # Get rates using model
-    rates = CurrencyRatesModel.get_rates_with_filters(currency_code, limit, start_date, end_date)
-    
-    # Convert to list of dictionaries
-    rates_list = []
-    for rate in rates:
-        rates_list.append({
-            'id': rate['id'] if 'id' in rate.keys() else None,
-            'currency_code': rate['currency_code'],
-            'currency_name': rate['currency_name'],
-            'mid_rate': rate['mid_rate'],
-            'bid_rate': rate['bid_rate'],
-            'ask_rate': rate['ask_rate'],
-            'date': rate['date']
-        })
+    # Conditional GET - answered from the in-memory latest dates without touching the database
+    query = '&'.join(f"{key}={value}" for key, value in sorted(request.args.items()))
+    etag = PayloadService.rates_etag(currency_code, query)
+    last_modified = PayloadService.last_modified(currency_code.upper() if currency_code else None)
+    cached = not_modified(etag, last_modified)
+    if cached is not None:
+        return cached
+    
+    if output_format in ('ndjson', 'csv'):
+        # Streamed exports walk the database cursor lazily and run in constant memory
+        rows = CurrencyRatesModel.iter_rates(currency_code, limit, start_date, end_date, after)
+        if output_format == 'ndjson':
+            response = Response(stream_with_context(RatesExportService.stream_ndjson(rows)),
+                                mimetype='application/x-ndjson')
+        else:
+            response = Response(stream_with_context(RatesExportService.stream_csv(rows)), mimetype='text/csv')
+            response.headers['Content-Disposition'] = 'attachment; filename=rates.csv'
+        return add_cache_headers(response, etag, last_modified)
+    
+    body = RatesExportService.get_body(currency_code, limit, start_date, end_date, after, output_format, etag)
+    response = Response(body, mimetype='application/json')
+    return add_cache_headers(response, etag, last_modified)
+
+@views.route('/api/chart')
+def api_chart():
+    """Return the precomputed chart payload of a currency and period as JSON"""
+    currency = request.args.get('currency', 'USD').upper()
+    period = request.args.get('period', '1month')
+    if period not in ChartDataService.PERIODS:
+        return jsonify({'status': 'error', 'message': f"Unsupported period: {period}"}), 400
+    
+    etag = PayloadService.chart_etag(currency, period, 'json')
+    cached = not_modified(etag)
+    if cached is not None:
+        return cached
+    
+    body = PayloadService.get_chart_json(currency, period, etag)
+    return add_cache_headers(Response(body, mimetype='application/json'), etag)
+
+@views.route('/api/analytics')
+def api_analytics():
+    """Return vectorized rate analytics for one or more currencies"""
+    currencies = [code.strip().upper() for code in request.args.get('currency', 'USD').split(',') if code.strip()]
+    period = request.args.get('period', '1year')
+    field = request.args.get('field', 'mid')
+    include_series = request.args.get('series', '0') in ('1', 'true')
+    try:
+        windows = tuple(int(w) for w in request.args.get('windows', '20,50').split(','))
+    except ValueError:
+        return jsonify({'status': 'error', 'message': "Invalid windows"}), 400
+    
+    if field not in ('mid', 'bid', 'ask') or not windows or min(windows) < 2:
+        return jsonify({'status': 'error', 'message': "Invalid field or windows"}), 400
+    
+    data = {code: AnalyticsService.get_analytics(code, period, field, windows, include_series)
+            for code in currencies}
+    return jsonify({'status': 'success', 'data': data})
+
+@views.route('/api/rollups')
+def api_rollups():
+    """Return weekly/monthly/yearly rollups of a currency with range statistics"""
+    currency = request.args.get('currency', 'USD').upper()
+    granularity = request.args.get('granularity', 'auto')
+    end_date = request.args.get('end_date') or datetime.now().strftime('%Y-%m-%d')
+    start_date = request.args.get('start_date') or ChartDataService.get_period_start('1year')
+    try:
+        for day in (start_date, end_date):
+            datetime.strptime(day, '%Y-%m-%d')
+        max_points = int(request.args.get('points', 500))
+    except ValueError:
+        return jsonify({'status': 'error', 'message': "Invalid date or points"}), 400
+    
+    if granularity not in ('auto',) + RollupService.GRANULARITIES or start_date > end_date or max_points < 1:
+        return jsonify({'status': 'error', 'message': "Invalid granularity or date range"}), 400
+    
+    data = RollupService.get_rollups(currency, granularity, start_date, end_date, max_points)
+    return jsonify({'status': 'success', 'data': data})
+
+@views.route('/api/convert', methods=['GET', 'POST'])
+def api_convert():
+    """Convert amounts between currencies on historical dates
+
+    GET:  /api/convert?from=EUR&to=USD&amount=100,250&date=2024-05-10
+    POST: {"from": "EUR", "to": "USD", "amounts": [...], "dates": [...] | "date": "...", "method": "mid"}
+    """
+    from conversion import METHODS
     
+    params = (request.get_json(silent=True) or {}) if request.method == 'POST' else request.args
+    source = params.get('from', 'EUR')
+    target = params.get('to', 'PLN')
+    method = params.get('method', 'mid')
+    today = datetime.now().strftime('%Y-%m-%d')
+    try:
+        if request.method == 'POST':
+            amounts = [float(a) for a in params.get('amounts', [params.get('amount', 1)])]
+            dates = params.get('dates') or params.get('date') or today
+        else:
+            amounts = [float(a) for a in str(params.get('amount', '1')).split(',')]
+            dates = params.get('date', today).split(',')
+            dates = dates if len(dates) > 1 else dates[0]
+        if not isinstance(dates, str) and len(dates) != len(amounts) and 1 not in (len(dates), len(amounts)):
+            raise ValueError("amounts and dates must have equal lengths (or one of them a single value)")
+        if method not in METHODS:
+            raise ValueError(f"Unsupported method: {method}")
+        data = ConversionService.convert(source, target, amounts, dates, method)
+    except (TypeError, ValueError) as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    return jsonify({'status': 'success', 'data': data})
+
+@views.route('/api/cross')
+def api_cross():
+    """Return a cross rate (e.g. EUR/USD) on given dates or over a date range"""
+    base = request.args.get('base', 'EUR')
+    quote = request.args.get('quote', 'USD')
+    dates = request.args.get('date')
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+    try:
+        if dates is None and start_date is None and end_date is None:
+            dates = datetime.now().strftime('%Y-%m-%d')
+        data = ConversionService.cross(base, quote, dates.split(',') if dates else None, start_date, end_date)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    return jsonify({'status': 'success', 'data': data})
+
+@views.route('/api/crypto/markets')
+def api_crypto_markets():
+    """Return the latest cryptocurrency market data"""
+    limit = min(max(request.args.get('limit', type=int, default=10), 1), 250)
+    crypto_data, info = CryptocurrencyService.get_market_data(limit)
+    if not crypto_data:
+        return jsonify({'status': 'error', 'message': "Cryptocurrency data unavailable"}), 503
+    return jsonify({'status': 'success', 'data': crypto_data, 'info': info})
+
+@views.route('/api/crypto/history')
+def api_crypto_history():
+    """Return the locally recorded price history of a cryptocurrency"""
+    coin_id = request.args.get('coin', 'bitcoin').lower()
+    period = request.args.get('period', '7days')
+    points = request.args.get('points', type=int, default=500)
+    
+    if period not in CryptocurrencyService.HISTORY_PERIODS or points < 3:
+        return jsonify({'status': 'error', 'message': "Invalid period or points"}), 400
+    
+    data = CryptocurrencyService.get_history(coin_id, period, points)
+    if data is None:
+        return jsonify({'status': 'error', 'message': f"No history for {coin_id}"}), 404
+    return jsonify({'status': 'success', 'data': data})
+
+@views.route('/api/crypto/status')
+def api_crypto_status():
+    """Return the status of the crypto snapshot job"""
+    return jsonify(current_app.extensions['crypto_snapshots'].status())
+
+@views.route('/api/cache/stats')
+def cache_stats():
+    """Return cache counters"""
     return jsonify({
-        'status': 'success',
-        'count': len(rates_list),
-        'data': rates_list
+        'series': series_cache.stats(),
+        'payloads': payload_cache.stats(),
+        'responses': response_cache.stats(),
+        'crypto': crypto_cache.stats(),
+        'snapshots': snapshot_store.stats()
     })
 
-@app.route('/cryptocurrencies')
+@views.route('/metrics')
+def prometheus_metrics():
+    """Expose request, SQL, upstream and cache metrics of this process (Prometheus text format)"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@views.route('/cryptocurrencies')
 def cryptocurrencies():
     """Display top cryptocurrencies"""
-    crypto_data = CryptocurrencyService.fetch_data(10)
+    crypto_data, info = CryptocurrencyService.get_market_data(10)
     
     if not crypto_data:
         return render_template('crypto.html', 
                              crypto_data=[],
                              error_message="Nie udało się pobrać danych o kryptowalutach")
     
-    return render_template('crypto.html', crypto_data=crypto_data)
+    # Data older than the cache TTL comes from the cache or the last good snapshot
+    stale_since = None
+    if info['source'] == 'stale':
+        stale_since = datetime.fromtimestamp(info['fetched_at']).strftime('%Y-%m-%d %H:%M')
+    return render_template('crypto.html', crypto_data=crypto_data, stale_since=stale_since)
 
-@app.route('/')
-@app.route('/currencies')
+@views.route('/')
+@views.route('/currencies')
 def index():
-    # Automatically check and fetch missing data (only if not explicitly skipped)
+    # Data is kept up to date by the ingestion scheduler - this view only reads the database
     init_skip = request.args.get('init', '') == 'skip'
-    if not init_skip:
-        # If data needs update, do it silently in background
-        if CurrencyDataService.check_data_needs_update():
-            try:
-                CurrencyDataService.check_and_fetch_missing_data()
-                print("Auto-update completed successfully")
-            except Exception as e:
-                print(f"Auto-update failed: {e}")
-    
-    # Check if we need to show initialization message
+    
+    # Check if we need to show initialization message (latest dates are kept in memory)
     show_init_message = False
     try:
-        count = CurrencyRatesModel.get_rates_count()
-        if count < 10:  # If almost no data, show a message
+        if not PayloadService.latest_dates():  # If there is no data yet, show a message
             show_init_message = True
     except Exception as e:
         print(f"Error checking database: {e}")
         show_init_message = True
-        count = 0
     
-    # Check for initialization status from query parameter (already handled above)
+    # Check for initialization status from query parameter
     if init_skip:
         show_init_message = False  # Hide initialization message if explicitly skipped
 
-    popular_currencies = ('USD', 'EUR', 'GBP', 'CHF')
+    popular_currencies = CurrencyRegistry.tracked() or CurrencyRegistry.POPULAR
     selected_currency = request.args.get('currency', popular_currencies[0])  # Default to first currency
     selected_period = request.args.get('period', '1month')  # Default to 1 month
     
@@ -104,79 +349,137 @@ def index():
         selected_currency = popular_currencies[0]  # Fallback if invalid currency is provided
     
     # Define time periods
-    time_periods = {
-        '7days': '7 Dni',
-        '1month': '1 Miesiąc', 
-        '6months': '6 Miesięcy',
-        '1year': '1 Rok'
-    }
-    
-    # Calculate date filter based on selected period
-    today = datetime.now().date()
-    date_filter_start = None
-    
-    if selected_period == '7days':
-        date_filter_start = today - timedelta(days=7)
-    elif selected_period == '1year':
-        date_filter_start = today - timedelta(days=365)
-    elif selected_period == '1month':
-        date_filter_start = today - timedelta(days=30)
-    elif selected_period == '6months':
-        date_filter_start = today - timedelta(days=180)
-    
-    # Fetch historical data for the selected currency with date filter
-    start_date_str = date_filter_start.strftime('%Y-%m-%d') if date_filter_start else None
-    rates_history = CurrencyRatesModel.get_historical_rates(selected_currency, start_date_str)
-
-    if not rates_history:
-        return render_template('index.html',
+    time_periods = {key: label for key, (label, _) in ChartDataService.PERIODS.items()}
+    
+    # Conditional GET - repeat visitors get a 304 without any rendering or database work
+    etag = PayloadService.chart_etag(selected_currency, selected_period, show_init_message, *popular_currencies)
+    cached = not_modified(etag)
+    if cached is not None:
+        return cached
+    
+    # Chart payload serialized at ingest time (or on first use) and served from memory
+    payload = PayloadService.get_chart_payload(selected_currency, selected_period)
+
+    if not payload['points']:
+        response = make_response(render_template('index.html',
                                chart_data=json.dumps({"dates": [], "mid": [], "bid": [], "ask": []}),
                                date_info=f"Brak danych historycznych dla {selected_currency} w wybranym okresie.",
                                popular_currencies=popular_currencies,
+                               currency_names=CurrencyRegistry.names(),
+                               has_bid_ask=CurrencyRegistry.has_bid_ask(selected_currency),
                                selected_currency=selected_currency,
                                time_periods=time_periods,
                                selected_period=selected_period,
                                show_init_message=True,
-                               error_message=f"Nie znaleziono danych dla {selected_currency} w wybranym okresie czasu.")
+                               error_message=f"Nie znaleziono danych dla {selected_currency} w wybranym okresie czasu."))
+        return add_cache_headers(response, etag)
 
-    # Prepare chart data using service
-    chart_data = ChartDataService.prepare_chart_data(rates_history, selected_currency)
-    
-    # Calculate rates and changes
-    current_rate, change, change_percent = ChartDataService.calculate_rate_changes(
-        chart_data['mid'], chart_data['bid'], chart_data['ask']
-    )
-    
-    # Get current bid/ask values
-    current_bid = ChartDataService.get_last_valid_value(chart_data['bid'])
-    current_ask = ChartDataService.get_last_valid_value(chart_data['ask'])
-    
     # Prepare date info
-    data_points = len(rates_history)
-    if data_points > 0:
-        date_range = f"Od {chart_data['dates'][0]} do {chart_data['dates'][-1]} ({data_points} punktów danych)"
-    else:
-        date_range = "Brak dostępnych danych dla wybranego okresu."
-
-    return render_template('index.html',
-                           chart_data=json.dumps(chart_data),
+    date_range = f"Od {payload['first_date']} do {payload['last_date']} ({payload['points']} punktów danych)"
+    if payload['resolution'] != 'daily':
+        resolution = {'weekly': 'tygodniowe', 'monthly': 'miesięczne', 'yearly': 'roczne'}[payload['resolution']]
+        date_range += f", wykres: {payload['chart_points']} punktów, świece {resolution}"
+
+    response = make_response(render_template('index.html',
+                           chart_data=payload['chart_json'],
                            date_info=date_range,
                            popular_currencies=popular_currencies,
+                           currency_names=CurrencyRegistry.names(),
+                           has_bid_ask=CurrencyRegistry.has_bid_ask(selected_currency),
                            selected_currency=selected_currency,
                            time_periods=time_periods,
                            selected_period=selected_period,
-                           current_rate=current_rate,
-                           change=change,
-                           change_percent=change_percent,
-                           current_bid=current_bid,
-                           current_ask=current_ask,
-                           show_init_message=show_init_message)
-
-# Application initialization and startup
+                           current_rate=payload['current_rate'],
+                           change=payload['change'],
+                           change_percent=payload['change_percent'],
+                           current_bid=payload['current_bid'],
+                           current_ask=payload['current_ask'],
+                           analytics=payload['analytics'],
+                           show_init_message=show_init_message))
+    return add_cache_headers(response, etag)
+
+# Application factory and startup
+def create_app(init_schema: bool = True, warm_cache: bool = None) -> Flask:
+    """Build a Flask application serving the views
+
+    The schema check only applies pending migrations (a PRAGMA read when the schema is
+    current) and never touches stored data. Background jobs are created but not started
+    (see start_scheduler). With warm_cache (default WARM_CACHE) chart payloads are built
+    from the database on a background thread, without delaying the first request.
+    """
+    app = Flask(__name__)
+    app.register_blueprint(views)
+    app.teardown_appcontext(close_connection)
+    if metrics.METRICS_ENABLED:
+        before_render_template.connect(start_render_timer, app)
+        template_rendered.connect(record_render_time, app)
+    
+    # Background NBP ingestion and crypto market snapshots - page requests only read the database
+    app.extensions['ingestion'] = IngestionScheduler(app)
+    app.extensions['crypto_snapshots'] = PeriodicJob(app, CryptocurrencyService.record_snapshot,
+                                                     CRYPTO_SNAPSHOT_INTERVAL, 'crypto-snapshots')
+    if init_schema:
+        DatabaseManager.init_db(app)
+    if WARM_CACHE if warm_cache is None else warm_cache:
+        start_warm_up(app)
+    return app
+
+def default_app() -> Flask:
+    """The application of the entry points, created (without schema check) on first use"""
+    global _default_app
+    if _default_app is None:
+        with _default_app_lock:
+            if _default_app is None:
+                _default_app = create_app(init_schema=False, warm_cache=False)
+    return _default_app
+
+def __getattr__(name):
+    # `from app import app, scheduler, crypto_snapshots` resolve to the default application
+    if name == 'app':
+        return default_app()
+    if name == 'scheduler':
+        return default_app().extensions['ingestion']
+    if name == 'crypto_snapshots':
+        return default_app().extensions['crypto_snapshots']
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def warm_up(app: Flask) -> int:
+    """Load the stats and build the chart payloads of the tracked currencies"""
+    started = time.perf_counter()
+    with app.app_context():
+        count = PayloadService.precompute(CurrencyRegistry.tracked())
+    print(f"Cache warm-up: {count} chart payloads in {time.perf_counter() - started:.2f}s")
+    return count
+
+def start_warm_up(app: Flask = None) -> None:
+    """Run warm_up on a background thread"""
+    def run():
+        try:
+            warm_up(app or default_app())
+        except Exception as e:
+            print(f"Cache warm-up failed: {e}")
+    threading.Thread(target=run, name='cache-warm-up', daemon=True).start()
+
 def init_db():
     """Initialize database schema"""
-    DatabaseManager.init_db(app)
+    DatabaseManager.init_db(default_app())
+
+def start_scheduler(snapshots: bool = True):
+    """Start the in-process ingestion scheduler and snapshot job unless a separate worker is used"""
+    if os.environ.get('INGESTION_WORKER') == 'external':
+        return
+    app = default_app()
+    # With the debug reloader only the serving child process runs the scheduler
+    if not app.debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        app.extensions['ingestion'].start()
+        if snapshots:
+            app.extensions['crypto_snapshots'].start()
 
 if __name__ == '__main__':
-    init_db()  # Initialize DB schema if it doesn't exist
+    init_db()  # Apply pending migrations (existing data is kept)
+    app = default_app()
+    app.debug = True
+    if WARM_CACHE:
+        start_warm_up(app)
+    start_scheduler()
     app.run(debug=True)
@@ -0,0 +1,373 @@
+"""
+Ingestion Layer - Offline import and export of NBP rate archives
+Seeds or inspects the database from local files, without network access:
+
+    python archive.py import archiwum_tab_a_2023.csv archiwum_tab_c_2023.csv tables_2002-2023.json
+    python archive.py verify --start 2020-01-01
+    python archive.py export rates.json --currencies USD,EUR
+
+Supported inputs (detected from the file name and contents):
+    *.json / *.ndjson  NBP Web API tables ([{"table": "A", "effectiveDate": ..., "rates": [...]}, ...]),
+                       as a JSON array, one table per line, or concatenated - parsed incrementally
+    *.csv              NBP yearly archives (archiwum_tab_a_YYYY.csv / archiwum_tab_c_YYYY.csv:
+                       semicolon-separated, decimal commas, a "data" column and one "<units><CODE>"
+                       column per currency - two, buy then sell, in Table C), or the CSV written by
+                       `export` and /api/rates?format=csv
+"""
+
+import argparse
+import csv
+import json
+import os
+import re
+import socket
+import sys
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+from scheduler import SyncLease
+from services import NBPService
+
+# Rates written per transaction
+IMPORT_BATCH_SIZE = int(os.environ.get('IMPORT_BATCH_SIZE', 5000))
+
+CURRENCY_COLUMN = re.compile(r'^(\d+)\s*([A-Z]{3})$')
+DATE_VALUE = re.compile(r'^(\d{4})-?(\d{2})-?(\d{2})$')
+JSON_SEPARATORS = re.compile(r'[\s,]*')
+
+
+def open_text(path: str) -> TextIO:
+    """Open a text file; NBP archives are Windows-1250 encoded, exports UTF-8"""
+    if path == '-':
+        return sys.stdin
+    with open(path, 'rb') as f:
+        head = f.read(1 << 16)
+    try:
+        head.decode('utf-8')
+        encoding = 'utf-8-sig'
+    except UnicodeDecodeError as e:
+        # A multi-byte character cut at the end of the sample is still UTF-8
+        encoding = 'utf-8-sig' if len(head) == 1 << 16 and e.start >= len(head) - 3 else 'cp1250'
+    return open(path, encoding=encoding, newline='')
+
+
+def iter_json_values(f: TextIO, chunk_size: int = 1 << 16) -> Iterator:
+    """Yield the items of a top-level JSON array (or line-delimited / concatenated values) incrementally"""
+    decoder = json.JSONDecoder()
+    buffer, pos, eof = '', 0, False
+    while True:
+        pos = JSON_SEPARATORS.match(buffer, pos).end()
+        if pos < len(buffer) and buffer[pos] in '[]':
+            pos += 1  # the enclosing array
+            continue
+        if pos < len(buffer):
+            try:
+                value, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            else:
+                if end < len(buffer) or eof:
+                    yield value
+                    pos = end
+                    continue
+        if eof:
+            return
+        chunk = f.read(chunk_size)
+        eof = not chunk
+        buffer, pos = buffer[pos:] + chunk, 0
+
+
+def iter_json_rates(f: TextIO) -> Iterator[Tuple[str, Dict]]:
+    """(table, rate) records of NBP Web API tables"""
+    for value in iter_json_values(f):
+        for table in value if isinstance(value, list) else [value]:
+            for rate in NBPService.parse_table_rates([(table.get('rates'), table.get('effectiveDate'))]):
+                yield table.get('table', ''), rate
+
+
+def parse_number(value: str) -> Optional[float]:
+    value = value.strip().replace(',', '.')
+    return float(value) if value else None
+
+
+def parse_date(value: str) -> Optional[str]:
+    match = DATE_VALUE.match(value.strip())
+    return '-'.join(match.groups()) if match else None
+
+
+def iter_csv_rates(f: TextIO, table: str = None) -> Iterator[Tuple[str, Dict]]:
+    """(table, rate) records of an NBP archive CSV or of an exported rates CSV"""
+    header_line = f.readline()
+    delimiter = ';' if header_line.count(';') > header_line.count(',') else ','
+    header = [cell.strip() for cell in next(csv.reader([header_line], delimiter=delimiter), [])]
+    reader = csv.reader(f, delimiter=delimiter)
+    if 'currency_code' in header:
+        yield from _iter_export_rows(reader, header)
+    else:
+        yield from _iter_archive_rows(reader, header, table)
+
+
+def _iter_export_rows(reader, header: List[str]) -> Iterator[Tuple[str, Dict]]:
+    column = {name: i for i, name in enumerate(header)}
+    for row in reader:
+        if not row:
+            continue
+        yield '', {
+            'code': row[column['currency_code']],
+            'name': row[column['currency_name']] or None,
+            'date': row[column['date']],
+            'mid': parse_number(row[column['mid_rate']]),
+            'bid': parse_number(row[column['bid_rate']]),
+            'ask': parse_number(row[column['ask_rate']])
+        }
+
+
+def _iter_archive_rows(reader, header: List[str], table: str = None) -> Iterator[Tuple[str, Dict]]:
+    """Rates of an NBP yearly archive: one row per day, rates quoted per <units> of a currency"""
+    columns = []  # (index, code, units, field)
+    for i, cell in enumerate(header):
+        match = CURRENCY_COLUMN.match(cell)
+        if match:
+            units, code = int(match.group(1)), match.group(2)
+            # In Table C a currency's buy column is followed by an unlabelled sell column
+            paired = table == 'C' or (table is None and i + 1 < len(header) and not header[i + 1])
+            columns.append((i, code, units, 'bid' if paired else 'mid'))
+            if paired:
+                columns.append((i + 1, code, units, 'ask'))
+    if not columns:
+        raise ValueError("No <units><CODE> currency columns in the CSV header")
+    table = table or ('C' if any(field == 'bid' for _, _, _, field in columns) else 'A')
+    names = {}
+
+    for row in reader:
+        day = parse_date(row[0]) if row else None
+        if day is None:
+            # Currency names come in a header-like row with an empty (or "nazwa waluty") first cell
+            if row and (not row[0].strip() or row[0].strip().lower().startswith('nazwa')):
+                names.update({code: row[i].strip() for i, code, _, _ in columns if i < len(row) and row[i].strip()})
+            continue
+        rates = {}
+        for i, code, units, field in columns:
+            value = parse_number(row[i]) if i < len(row) else None
+            if value is not None:
+                rates.setdefault(code, {})[field] = value / units
+        for code, values in rates.items():
+            yield table, {'code': code, 'name': names.get(code), 'date': day, 'mid': values.get('mid'),
+                          'bid': values.get('bid'), 'ask': values.get('ask')}
+
+
+def read_archive(path: str, table: str = None) -> Iterator[Tuple[str, Dict]]:
+    """(table, rate) records of an archive file, streamed"""
+    name = os.path.basename(path).lower()
+    with open_text(path) as f:
+        if name.endswith(('.json', '.ndjson', '.jsonl')):
+            yield from iter_json_rates(f)
+        else:
+            # NBP names its yearly archives archiwum_tab_a_YYYY.csv / archiwum_tab_c_YYYY.csv
+            table = table or ('C' if 'tab_c' in name else 'A' if 'tab_a' in name else None)
+            yield from iter_csv_rates(f, table)
+
+
+class ImportStats:
+    """Records seen by an import, with duplicates among the inputs"""
+
+    def __init__(self):
+        self.records = 0
+        self.duplicates = 0
+        self.conflicts = []  # (code, date, skipped (mid, bid, ask)) of repeats with other values
+        self._seen = {}
+
+    def accept(self, records: Iterable[Tuple[str, Dict]], currencies: Optional[set]) -> Iterator[Dict]:
+        """Pass on the first record of every (currency, date, table); count the repeats"""
+        for table, rate in records:
+            if currencies is not None and rate['code'] not in currencies:
+                continue
+            if rate['name'] is None:
+                rate['name'] = rate['code']
+            self.records += 1
+            # Compact keys: decades of history across all currencies stay in memory
+            key = f"{rate['code']}{rate['date']}{table or ('A' if rate['mid'] is not None else 'C')}"
+            values = (rate['mid'], rate['bid'], rate['ask'])
+            seen = self._seen.get(key)
+            if seen is None:
+                self._seen[key] = hash(values)
+                yield rate
+                continue
+            self.duplicates += 1
+            if seen != hash(values):
+                self.conflicts.append((rate['code'], rate['date'], values))
+
+
+def merge_batches(rates: Iterable[Dict], batch_size: int) -> Iterator[Dict]:
+    """Merge the Table A and C records of a (currency, date) met within the same batch
+
+    Archives list both tables day by day, so most rows are written once instead of being
+    inserted with the mid rate and then updated with bid/ask.
+    """
+    batch = {}
+    for rate in rates:
+        key = (rate['code'], rate['date'])
+        record = batch.get(key)
+        if record is None:
+            batch[key] = rate
+            if len(batch) >= batch_size:
+                yield from batch.values()
+                batch = {}
+        else:
+            for field in ('mid', 'bid', 'ask'):
+                if rate[field] is not None:
+                    record[field] = rate[field]
+    yield from batch.values()
+
+
+def import_files(paths: List[str], table: str = None, currencies: List[str] = None,
+                 batch_size: int = IMPORT_BATCH_SIZE) -> Dict:
+    """Stream archive files into the database in batched transactions, then refresh derived data"""
+    from models import CurrencyRatesModel
+    from services import CurrencyDataService
+
+    stats = ImportStats()
+    records = (record for path in paths for record in read_archive(path, table))
+    rates = stats.accept(records, set(currencies) if currencies else None)
+    counts = CurrencyRatesModel.upsert_rates(merge_batches(rates, batch_size), batch_size)
+    CurrencyDataService.after_ingest(counts['currencies'], counts['ranges'])
+    return dict(counts, records=stats.records, duplicates=stats.duplicates, conflicts=stats.conflicts)
+
+
+def export_tables(rows: Iterable) -> Iterator[Dict]:
+    """Group date-ordered rate rows into NBP Web API tables (A: mid, C: bid/ask)"""
+    def tables(day, day_rows):
+        mid = [{'currency': row['currency_name'], 'code': row['currency_code'], 'mid': row['mid_rate']}
+               for row in day_rows if row['mid_rate'] is not None]
+        bid_ask = [{'currency': row['currency_name'], 'code': row['currency_code'],
+                    'bid': row['bid_rate'], 'ask': row['ask_rate']}
+                   for row in day_rows if row['bid_rate'] is not None and row['ask_rate'] is not None]
+        for name, rates in (('A', mid), ('C', bid_ask)):
+            if rates:
+                yield {'table': name, 'no': None, 'effectiveDate': day, 'rates': rates}
+
+    day, day_rows = None, []
+    for row in rows:
+        if row['date'] != day:
+            yield from tables(day, day_rows)
+            day, day_rows = row['date'], []
+        day_rows.append(row)
+    yield from tables(day, day_rows)
+
+
+def export_rates(output: TextIO, output_format: str, currencies: List[str] = None, start_date: str = None,
+                 end_date: str = None) -> int:
+    """Stream stored rates to a file; returns the number of rows written"""
+    from models import CurrencyRatesModel
+    from services import RatesExportService
+
+    count = 0
+
+    def counted(rows):
+        nonlocal count
+        for row in rows:
+            count += 1
+            yield row
+
+    rows = counted(CurrencyRatesModel.iter_all_rates(currencies, start_date, end_date))
+    if output_format == 'csv':
+        for chunk in RatesExportService.stream_csv(rows):
+            output.write(chunk)
+    elif output_format == 'ndjson':
+        for table in export_tables(rows):
+            output.write(json.dumps(table, ensure_ascii=False) + '\n')
+    else:
+        output.write('[')
+        for i, table in enumerate(export_tables(rows)):
+            output.write((',\n' if i else '\n') + json.dumps(table, ensure_ascii=False))
+        output.write('\n]\n')
+    return count
+
+
+def print_report(report: Dict, limit: int = 10) -> None:
+    for code, result in report['currencies'].items():
+        gaps = [first if first == last else f"{first}..{last}" for first, last in result['gaps']]
+        print(f"{code}: {result['rows']} rows {result['first_date']}..{result['last_date']}, "
+              f"{len(result['missing_dates'])} missing business days, {result['off_calendar']} off-calendar rows, "
+              f"{result['missing_mid']} without mid, {result['missing_bid_ask']} without bid/ask")
+        if gaps:
+            print(f"    missing: {', '.join(gaps[:limit])}{' ...' if len(gaps) > limit else ''}")
+    print(f"{report['problems']} problems found")
+
+
+def codes(value: Optional[str]) -> Optional[List[str]]:
+    return [code.strip().upper() for code in value.split(',') if code.strip()] if value else None
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description='Offline import, verification and export of NBP rate archives')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    import_parser = commands.add_parser('import', help='load archive files into the database')
+    import_parser.add_argument('files', nargs='+', help='JSON/NDJSON tables or NBP archive CSV files')
+    import_parser.add_argument('--table', choices=('A', 'C'), help='table of CSV archives (default: detected)')
+    import_parser.add_argument('--currencies', type=codes, help='only these currencies (comma-separated)')
+    import_parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE, help='rates per transaction')
+    import_parser.add_argument('--verify', action='store_true', help='verify the imported currencies afterwards')
+
+    verify_parser = commands.add_parser('verify', help='check stored rates against the NBP calendar')
+    verify_parser.add_argument('--currencies', type=codes)
+    verify_parser.add_argument('--start', help='first date (YYYY-MM-DD)')
+    verify_parser.add_argument('--end', help='last date (YYYY-MM-DD)')
+
+    export_parser = commands.add_parser('export', help='write stored rates to a file')
+    export_parser.add_argument('output', help="output file ('-' for stdout)")
+    export_parser.add_argument('--format', choices=('json', 'ndjson', 'csv'),
+                               help='output format (default: from the file extension, else json)')
+    export_parser.add_argument('--currencies', type=codes)
+    export_parser.add_argument('--start', help='first date (YYYY-MM-DD)')
+    export_parser.add_argument('--end', help='last date (YYYY-MM-DD)')
+
+    args = parser.parse_args(argv)
+
+    from app import app, init_db
+    from services import IntegrityService
+
+    init_db()
+    with app.app_context():
+        started = time.perf_counter()
+        if args.command == 'import':
+            # Held like a sync, so no process starts syncing while the import writes
+            lease = SyncLease(owner=f"archive:{socket.gethostname()}:{os.getpid()}")
+            if not lease.acquire():
+                print("A sync is running, retry when it has finished", file=sys.stderr)
+                return 2
+            try:
+                result = import_files(args.files, args.table, args.currencies, args.batch_size)
+            finally:
+                lease.release()
+            print(f"Imported {result['records']} records: {result['inserted']} inserted, {result['updated']} updated, "
+                  f"{result['duplicates']} duplicates ({len(result['conflicts'])} conflicting) "
+                  f"in {time.perf_counter() - started:.1f}s")
+            for code, day, skipped in result['conflicts'][:10]:
+                print(f"    conflicting repeat of {code} {day} skipped: {skipped}")
+            if args.verify:
+                report = IntegrityService.verify(result['currencies'])
+                print_report(report)
+                return 1 if report['problems'] else 0
+            return 0
+
+        if args.command == 'verify':
+            report = IntegrityService.verify(args.currencies, args.start, args.end)
+            print_report(report)
+            return 1 if report['problems'] else 0
+
+        output_format = args.format or os.path.splitext(args.output)[1].lstrip('.').replace('jsonl', 'ndjson')
+        output_format = output_format if output_format in ('json', 'ndjson', 'csv') else 'json'
+        if args.output == '-':
+            count = export_rates(sys.stdout, output_format, args.currencies, args.start, args.end)
+        else:
+            with open(args.output, 'w', encoding='utf-8', newline='') as output:
+                count = export_rates(output, output_format, args.currencies, args.start, args.end)
+        print(f"Exported {count} rates to {args.output} in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+        return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
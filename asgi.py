@@ -0,0 +1,283 @@
+"""
+Presentation Layer - Async (ASGI) serving mode
+Serves the read API (/api/rates, /api/chart, /api/crypto/*) from Starlette with blocking
+SQLite work on a thread-pool executor and upstream calls over async HTTP; every other
+route is delegated to the Flask application.
+
+    uvicorn asgi:app --workers 4        (or: python serve.py --workers 4)
+"""
+
+import asyncio
+import contextvars
+import functools
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Optional
+
+import httpx
+from starlette.applications import Starlette
+from starlette.concurrency import iterate_in_threadpool
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Mount, Route
+
+try:
+    from a2wsgi import WSGIMiddleware
+except ImportError:  # a2wsgi not installed - Starlette's (deprecated) adapter works the same
+    import warnings
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        from starlette.middleware.wsgi import WSGIMiddleware
+
+import metrics
+from app import app as flask_app, init_db, start_scheduler, start_warm_up, scheduler, crypto_snapshots, WARM_CACHE
+from models import CurrencyRatesModel, POOL_SIZE
+from services import (ChartDataService, PayloadService, RatesExportService, CryptocurrencyService,
+                      CRYPTO_API_URL, CRYPTO_TIMEOUT, CRYPTO_SNAPSHOT_INTERVAL, CRYPTO_TRACKED_COINS)
+
+# Threads running blocking database work; more than the connection pool would only queue on it
+DB_THREADS = int(os.environ.get('DB_THREADS', POOL_SIZE))
+db_executor = ThreadPoolExecutor(max_workers=DB_THREADS, thread_name_prefix='db')
+
+# Coalesces cold-start crypto fetches (before the first snapshot is recorded)
+crypto_fetch_lock = asyncio.Lock()
+
+
+def _in_app_context(func, *args):
+    # Models keep their pooled connection on flask.g, released when the context ends
+    with flask_app.app_context():
+        return func(*args)
+
+
+async def run_db(func, *args):
+    """Run blocking (database) work on the executor, inside a Flask application context"""
+    loop = asyncio.get_running_loop()
+    # The copied context carries the request's phase timings to the worker thread
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(db_executor, context.run, _in_app_context, func, *args)
+
+
+def instrumented(route: str):
+    """Record the latency of an async route (and add Server-Timing when enabled)"""
+    def decorator(endpoint):
+        if not metrics.METRICS_ENABLED:
+            return endpoint
+
+        @functools.wraps(endpoint)
+        async def wrapper(request: Request) -> Response:
+            started = time.perf_counter()
+            token = metrics.start_request()
+            status = 500
+            try:
+                response = await endpoint(request)
+                status = response.status_code
+                if metrics.SERVER_TIMING:
+                    response.headers['Server-Timing'] = metrics.server_timing(time.perf_counter() - started)
+                return response
+            finally:
+                metrics.observe_request(route, request.method, status, time.perf_counter() - started)
+                metrics.end_request(token)
+        return wrapper
+    return decorator
+
+
+def error(message: str, status_code: int = 400) -> JSONResponse:
+    return JSONResponse({'status': 'error', 'message': message}, status_code=status_code)
+
+
+def add_cache_headers(response: Response, etag: str, last_modified=None) -> Response:
+    """Attach the validators built by PayloadService.cache_headers"""
+    response.headers.update(PayloadService.cache_headers(etag, last_modified))
+    return response
+
+
+def not_modified(request: Request, etag: str, last_modified=None) -> Optional[Response]:
+    """Return a 304 response if the client already holds the current representation"""
+    if not PayloadService.is_not_modified(etag, last_modified, request.headers.get('if-none-match'),
+                                          request.headers.get('if-modified-since')):
+        return None
+    return add_cache_headers(Response(status_code=304), etag, last_modified)
+
+
+class RowStreamResponse(StreamingResponse):
+    """Body produced on worker threads from a lazy row generator holding a pooled connection
+
+    The generator is closed once the response ends - also when the client disconnects
+    mid-stream - so the connection goes back to the pool right away, not at garbage collection.
+    """
+
+    def __init__(self, chunks, rows, media_type: str):
+        super().__init__(iterate_in_threadpool(chunks), media_type=media_type)
+        self.rows = rows
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            # Worker threads are not abandoned on cancellation, so the generator is suspended here
+            self.rows.close()
+
+
+@instrumented('/api/rates')
+async def api_rates(request: Request) -> Response:
+    """Async /api/rates: JSON, columnar JSON, or streamed NDJSON/CSV"""
+    params = request.query_params
+    currency_code = params.get('currency')
+    start_date = params.get('start_date')
+    end_date = params.get('end_date')
+    output_format = params.get('format', 'json')
+    cursor = params.get('cursor')
+    try:
+        limit = int(params.get('limit', 30))
+    except ValueError:
+        limit = 30
+
+    if output_format not in RatesExportService.FORMATS:
+        return error(f"Unsupported format: {output_format}")
+    try:
+        after = CurrencyRatesModel.decode_cursor(cursor) if cursor else None
+    except ValueError:
+        return error("Invalid cursor")
+
+    query = '&'.join(f"{key}={value}" for key, value in sorted(params.items()))
+
+    def validators():
+        return (PayloadService.rates_etag(currency_code, query),
+                PayloadService.last_modified(currency_code.upper() if currency_code else None))
+
+    etag, last_modified = await run_db(validators)
+    cached = not_modified(request, etag, last_modified)
+    if cached is not None:
+        return cached
+
+    if output_format in ('ndjson', 'csv'):
+        # The database cursor is walked on worker threads, batch by batch
+        rows = CurrencyRatesModel.iter_rates(currency_code, limit, start_date, end_date, after)
+        if output_format == 'ndjson':
+            response = RowStreamResponse(RatesExportService.stream_ndjson(rows), rows, 'application/x-ndjson')
+        else:
+            response = RowStreamResponse(RatesExportService.stream_csv(rows), rows, 'text/csv')
+            response.headers['Content-Disposition'] = 'attachment; filename=rates.csv'
+        return add_cache_headers(response, etag, last_modified)
+
+    body = await run_db(RatesExportService.get_body, currency_code, limit, start_date, end_date, after,
+                        output_format, etag)
+    return add_cache_headers(Response(body, media_type='application/json'), etag, last_modified)
+
+
+@instrumented('/api/chart')
+async def api_chart(request: Request) -> Response:
+    """Async /api/chart: precomputed chart payload of a currency and period"""
+    currency = request.query_params.get('currency', 'USD').upper()
+    period = request.query_params.get('period', '1month')
+    if period not in ChartDataService.PERIODS:
+        return error(f"Unsupported period: {period}")
+
+    etag = await run_db(PayloadService.chart_etag, currency, period, 'json')
+    cached = not_modified(request, etag)
+    if cached is not None:
+        return cached
+
+    body = await run_db(PayloadService.get_chart_json, currency, period, etag)
+    return add_cache_headers(Response(body, media_type='application/json'), etag)
+
+
+async def fetch_markets(client: httpx.AsyncClient, limit: int):
+    """Fetch CoinGecko market data over async HTTP and keep it as the last good snapshot"""
+    with metrics.upstream('coingecko') as call:
+        response = await client.get(CRYPTO_API_URL, params=CryptocurrencyService.market_params(limit))
+        call.status = response.status_code
+    response.raise_for_status()
+    return await run_db(CryptocurrencyService.accept_market_data, response.json(), limit)
+
+
+@instrumented('/api/crypto/markets')
+async def api_crypto_markets(request: Request) -> Response:
+    """Async /api/crypto/markets: latest recorded market data"""
+    try:
+        limit = min(max(int(request.query_params.get('limit', 10)), 1), 250)
+    except ValueError:
+        return error("Invalid limit")
+
+    coins, info = await run_db(CryptocurrencyService.get_market_data_local, limit)
+    if not coins:
+        # Nothing recorded yet: one request fetches and records, concurrent ones wait for it
+        async with crypto_fetch_lock:
+            coins, info = await run_db(CryptocurrencyService.get_market_data_local, limit)
+            if not coins:
+                try:
+                    fetched = await fetch_markets(request.app.state.http, max(limit, CRYPTO_TRACKED_COINS))
+                    await run_db(CryptocurrencyService.store_snapshot, fetched)
+                except (httpx.HTTPError, ValueError) as e:
+                    print(f"Error fetching cryptocurrency data: {e}")
+                coins, info = await run_db(CryptocurrencyService.get_market_data_local, limit)
+    if not coins:
+        return error("Cryptocurrency data unavailable", 503)
+    return JSONResponse({'status': 'success', 'data': coins, 'info': info})
+
+
+@instrumented('/api/crypto/history')
+async def api_crypto_history(request: Request) -> Response:
+    """Async /api/crypto/history: locally recorded price history of a coin"""
+    coin_id = request.query_params.get('coin', 'bitcoin').lower()
+    period = request.query_params.get('period', '7days')
+    try:
+        points = int(request.query_params.get('points', 500))
+    except ValueError:
+        points = 0
+    if period not in CryptocurrencyService.HISTORY_PERIODS or points < 3:
+        return error("Invalid period or points")
+
+    data = await run_db(CryptocurrencyService.get_history, coin_id, period, points)
+    if data is None:
+        return error(f"No history for {coin_id}", 404)
+    return JSONResponse({'status': 'success', 'data': data})
+
+
+async def crypto_snapshot_loop(client: httpx.AsyncClient) -> None:
+    """Record a crypto market snapshot every CRYPTO_SNAPSHOT_INTERVAL seconds (async HTTP)"""
+    while True:
+        started = time.perf_counter()
+        try:
+            coins = await fetch_markets(client, CRYPTO_TRACKED_COINS)
+            await run_db(CryptocurrencyService.store_snapshot, coins)
+            crypto_snapshots.record_run(started)
+        except Exception as e:
+            print(f"crypto-snapshots failed: {e}")
+            crypto_snapshots.record_run(started, str(e))
+        await asyncio.sleep(max(CRYPTO_SNAPSHOT_INTERVAL - (time.perf_counter() - started), 0))
+
+
+@asynccontextmanager
+async def lifespan(application: Starlette):
+    await asyncio.get_running_loop().run_in_executor(db_executor, init_db)
+    if WARM_CACHE:
+        start_warm_up(flask_app)
+    async with httpx.AsyncClient(timeout=CRYPTO_TIMEOUT, limits=httpx.Limits(max_connections=8)) as client:
+        application.state.http = client
+        tasks = []
+        # The NBP ingestion scheduler keeps its own thread; crypto snapshots run on the event loop
+        start_scheduler(snapshots=False)
+        if os.environ.get('INGESTION_WORKER') != 'external':
+            tasks.append(asyncio.create_task(crypto_snapshot_loop(client)))
+        try:
+            yield
+        finally:
+            for task in tasks:
+                task.cancel()
+            scheduler.stop()
+
+
+app = Starlette(
+    routes=[
+        Route('/api/rates', api_rates),
+        Route('/api/chart', api_chart),
+        Route('/api/crypto/markets', api_crypto_markets),
+        Route('/api/crypto/history', api_crypto_history),
+        # Pages, sync control, analytics and everything else stay on Flask
+        Mount('/', WSGIMiddleware(flask_app)),
+    ],
+    lifespan=lifespan,
+)
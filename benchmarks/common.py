@@ -0,0 +1,161 @@
+"""
+Shared benchmark helpers: timing statistics, synthetic databases and result files
+"""
+
+import json
+import math
+import os
+import platform
+import sqlite3
+import subprocess
+import time
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, List
+
+import numpy as np
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(BENCHMARKS_DIR, '.data')
+RESULTS_DIR = os.path.join(BENCHMARKS_DIR, 'results')
+
+# Currencies read by the dashboard come first; larger databases add synthetic codes
+BENCH_CURRENCIES = ['USD', 'EUR', 'GBP', 'CHF']
+# At most ~30 years of business days per currency
+MAX_DAYS_PER_CURRENCY = 8000
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Nearest-rank percentile of an ascending list"""
+    if not sorted_values:
+        return float('nan')
+    rank = max(math.ceil(q / 100 * len(sorted_values)) - 1, 0)
+    return sorted_values[rank]
+
+
+def summarize(samples: List[float]) -> Dict:
+    """Latency statistics of samples given in seconds, reported in milliseconds"""
+    ordered = sorted(samples)
+    return {
+        'runs': len(ordered),
+        'min_ms': round(ordered[0] * 1000, 4),
+        'p50_ms': round(percentile(ordered, 50) * 1000, 4),
+        'p90_ms': round(percentile(ordered, 90) * 1000, 4),
+        'p99_ms': round(percentile(ordered, 99) * 1000, 4),
+        'mean_ms': round(sum(ordered) / len(ordered) * 1000, 4),
+    }
+
+
+def measure(func: Callable, repeat: int = 20, warmup: int = 2, min_time: float = 0.0) -> Dict:
+    """Time repeated calls of func; keeps going until both repeat and min_time are reached"""
+    for _ in range(warmup):
+        func()
+    samples = []
+    started = time.perf_counter()
+    while len(samples) < repeat or time.perf_counter() - started < min_time:
+        t0 = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - t0)
+    return summarize(samples)
+
+
+def business_days(count: int, end: date = None) -> List[str]:
+    """The last `count` weekdays up to `end` (default today), oldest first"""
+    day = end or date.today()
+    days = []
+    while len(days) < count:
+        if day.weekday() < 5:
+            days.append(day.strftime('%Y-%m-%d'))
+        day -= timedelta(days=1)
+    return days[::-1]
+
+
+def synthetic_db(rows: int, rebuild: bool = False) -> str:
+    """Path of a synthetic rates database with about `rows` rows (built once and reused)
+
+    Rates follow the same smooth curves as the fake NBP server, with Table A and C values.
+    """
+    from models import DatabaseManager
+
+    os.makedirs(DATA_DIR, exist_ok=True)
+    path = os.path.join(DATA_DIR, f"rates_{rows}.db")
+    if os.path.exists(path) and not rebuild:
+        return path
+    if os.path.exists(path):
+        os.remove(path)
+
+    currencies = max(len(BENCH_CURRENCIES), math.ceil(rows / MAX_DAYS_PER_CURRENCY))
+    codes = BENCH_CURRENCIES + [f"X{i:03d}" for i in range(currencies - len(BENCH_CURRENCIES))]
+    days = business_days(rows // currencies)
+    ordinals = np.array([datetime.strptime(d, '%Y-%m-%d').toordinal() for d in days], dtype=np.float64)
+
+    started = time.perf_counter()
+    db = sqlite3.connect(path)
+    DatabaseManager.migrate(db)
+    db.execute('PRAGMA journal_mode = WAL')
+    db.execute('PRAGMA synchronous = OFF')
+    for i, code in enumerate(codes):
+        phase = sum(ord(c) for c in code)
+        base = 1.0 + (i % 50) / 10
+        mid = base * (1 + 0.05 * np.sin(ordinals / 90.0 + phase) + 0.01 * np.sin(ordinals / 7.0 + phase))
+        db.executemany(
+            "INSERT INTO rates (currency_code, currency_name, mid_rate, bid_rate, ask_rate, date) VALUES (?, ?, ?, ?, ?, ?)",
+            zip([code] * len(days), [f"waluta {code}"] * len(days), np.round(mid, 6).tolist(),
+                np.round(mid * 0.99, 4).tolist(), np.round(mid * 1.01, 4).tolist(), days)
+        )
+        db.commit()
+    db.execute('ANALYZE')
+    db.close()
+    print(f"Built {path}: {len(codes)} currencies x {len(days)} days in {time.perf_counter() - started:.1f}s")
+    return path
+
+
+def use_database(path: str) -> None:
+    """Point the data layer (and its connection pool) at another database file
+
+    Pending migrations and derived tables (stats, rollups) are brought up to date as at
+    application start, and in-process caches are emptied so no result is served from the
+    previous database.
+    """
+    import models
+    from app import app
+    from cache import series_cache, payload_cache, response_cache
+    from services import FreshnessService, ConversionService
+
+    models.DATABASE = path
+    models.DatabaseManager.init_db(app)
+    series_cache.clear()
+    payload_cache.clear()
+    response_cache.clear()
+    FreshnessService.invalidate()
+    ConversionService.invalidate()
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCHMARKS_DIR,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def save_results(suite: str, results: Dict, options: Dict, output: str = None) -> str:
+    """Write results with environment metadata to benchmarks/results (or `output`)"""
+    commit = git_commit()
+    document = {
+        'suite': suite,
+        'commit': commit,
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'options': options,
+        'results': results,
+    }
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{datetime.now():%Y%m%d-%H%M%S}-{commit}-{suite}.json")
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(document, f, indent=2)
+    print(f"Results saved to {output}")
+    return output
@@ -0,0 +1,73 @@
+"""
+Compare two benchmark result files and flag regressions
+
+    python -m benchmarks.compare benchmarks/results/base.json benchmarks/results/new.json --threshold 10
+"""
+
+import argparse
+import json
+import sys
+from typing import Dict
+
+# Metrics where larger is better; every other tracked metric is a duration
+HIGHER_IS_BETTER = {'requests_per_sec'}
+METRICS = ('p50_ms', 'p99_ms', 'seconds', 'requests_per_sec')
+
+
+def flatten(results: Dict, prefix: str = '') -> Dict[str, float]:
+    """{'micro': {'x@10000': {'p50_ms': 1}}} -> {'micro/x@10000/p50_ms': 1}"""
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}/{key}" if prefix else key
+        if isinstance(value, dict):
+            flat.update(flatten(value, name))
+        elif key in METRICS and isinstance(value, (int, float)):
+            flat[name] = value
+    return flat
+
+
+def load_results(path: str) -> Dict:
+    with open(path, encoding='utf-8') as f:
+        document = json.load(f)
+    # Single-suite files are compared under their suite name, like the combined ones
+    if document.get('suite') != 'suite':
+        return {document.get('suite', 'results'): document['results']}, document
+    return document['results'], document
+
+
+def compare(base: Dict[str, float], new: Dict[str, float], threshold: float):
+    """Rows of (metric, base, new, change %, verdict) for metrics present in both files"""
+    rows = []
+    for name in sorted(base.keys() & new.keys()):
+        old_value, new_value = base[name], new[name]
+        change = (new_value / old_value - 1) * 100 if old_value else 0.0
+        worse = -change if name.rsplit('/', 1)[-1] in HIGHER_IS_BETTER else change
+        verdict = 'REGRESSION' if worse > threshold else 'improved' if worse < -threshold else ''
+        rows.append((name, old_value, new_value, change, verdict))
+    return rows
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Compare two benchmark result files')
+    parser.add_argument('base')
+    parser.add_argument('new')
+    parser.add_argument('--threshold', type=float, default=10.0, help='change (in %%) reported as a regression')
+    args = parser.parse_args()
+
+    base_results, base_doc = load_results(args.base)
+    new_results, new_doc = load_results(args.new)
+    print(f"base {base_doc.get('commit')} ({base_doc.get('timestamp')})  ->  "
+          f"new {new_doc.get('commit')} ({new_doc.get('timestamp')})")
+
+    rows = compare(flatten(base_results), flatten(new_results), args.threshold)
+    width = max((len(row[0]) for row in rows), default=10)
+    for name, old_value, new_value, change, verdict in rows:
+        print(f"{name:{width}s} {old_value:12.3f} {new_value:12.3f} {change:+8.1f}%  {verdict}")
+
+    regressions = sum(1 for row in rows if row[4] == 'REGRESSION')
+    print(f"{len(rows)} metrics compared, {regressions} regressions above {args.threshold}%")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
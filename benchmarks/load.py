@@ -0,0 +1,158 @@
+"""
+Load test of the /currencies dashboard: closed-loop clients, p50/p99 latency and req/s
+
+    python -m benchmarks.load --rows 100000 --concurrency 8 --duration 20
+    python -m benchmarks.load --url http://127.0.0.1:8000     (an already running server)
+"""
+
+import argparse
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+
+import requests
+
+from benchmarks.common import BENCHMARKS_DIR, BENCH_CURRENCIES, summarize, synthetic_db, save_results
+
+PERIODS = ('7days', '1month', '6months', '1year', '5years', 'all')
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def serve(path: str, port: int) -> None:
+    """Serve the Flask app on a synthetic database (threaded server, no scheduler)"""
+    from werkzeug.serving import WSGIRequestHandler, make_server
+    from benchmarks.common import use_database
+    from app import app, init_db
+
+    class QuietHandler(WSGIRequestHandler):
+        # Per-request access logging would dominate the measured latency
+        def log_request(self, *args, **kwargs):
+            pass
+
+    use_database(path)
+    init_db()
+    make_server('127.0.0.1', port, app, threaded=True, request_handler=QuietHandler).serve_forever()
+
+
+def start_server(path: str) -> tuple:
+    """Run the server in a child process so clients and server do not share the GIL"""
+    port = free_port()
+    process = subprocess.Popen([sys.executable, '-m', 'benchmarks.load', '--serve-only', path, '--port', str(port)],
+                               cwd=os.path.dirname(BENCHMARKS_DIR))
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 120
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError('Benchmark server exited during startup')
+        try:
+            requests.get(f"{url}/api/sync/status", timeout=1)
+            return process, url
+        except requests.exceptions.ConnectionError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError('Benchmark server did not start')
+
+
+def run_load(url: str, concurrency: int, duration: float, revalidate: bool, seed: int = 0) -> dict:
+    """Closed loop: every client sends its next request as soon as the previous one completes"""
+    latencies, statuses, errors = [], Counter(), Counter()
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client(index: int) -> None:
+        rng = random.Random(seed + index)
+        session = requests.Session()
+        etags = {}
+        local_latencies, local_statuses, local_errors = [], Counter(), Counter()
+        while time.perf_counter() < deadline:
+            params = {'currency': rng.choice(BENCH_CURRENCIES), 'period': rng.choice(PERIODS)}
+            key = (params['currency'], params['period'])
+            headers = {'If-None-Match': etags[key]} if revalidate and key in etags else {}
+            started = time.perf_counter()
+            try:
+                response = session.get(f"{url}/currencies", params=params, headers=headers, timeout=30)
+                response.content
+            except requests.exceptions.RequestException as e:
+                local_errors[type(e).__name__] += 1
+                continue
+            local_latencies.append(time.perf_counter() - started)
+            local_statuses[response.status_code] += 1
+            if 'ETag' in response.headers:
+                etags[key] = response.headers['ETag']
+        with lock:
+            latencies.extend(local_latencies)
+            statuses.update(local_statuses)
+            errors.update(local_errors)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    result = summarize(latencies) if latencies else {'runs': 0}
+    result.update({
+        'requests_per_sec': round(len(latencies) / elapsed, 2),
+        'statuses': {str(code): count for code, count in sorted(statuses.items())},
+        'errors': dict(errors),
+        'elapsed': round(elapsed, 2),
+    })
+    return result
+
+
+def run(rows: int = 100_000, concurrency: int = 8, duration: float = 20, url: str = None,
+        warmup: float = 2, revalidate: bool = False) -> dict:
+    process = None
+    if url is None:
+        process, url = start_server(synthetic_db(rows))
+    try:
+        # Warm the payload caches so the measured phase reflects steady state
+        run_load(url, concurrency, warmup, revalidate=False, seed=1000)
+        results = {'currencies': run_load(url, concurrency, duration, revalidate=False)}
+        if revalidate:
+            results['currencies_revalidate'] = run_load(url, concurrency, duration, revalidate=True)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    for name, stats in results.items():
+        print(f"  {name:22s} {stats['requests_per_sec']:9.1f} req/s  p50 {stats.get('p50_ms', 0):8.2f} ms  "
+              f"p99 {stats.get('p99_ms', 0):8.2f} ms  statuses {stats['statuses']}  errors {stats['errors']}")
+    return results
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument('--rows', type=int, default=100_000, help='synthetic database size')
+    parser.add_argument('--concurrency', type=int, default=8, help='concurrent clients')
+    parser.add_argument('--duration', type=float, default=20, help='measured seconds')
+    parser.add_argument('--url', help='test a running server instead of starting one')
+    parser.add_argument('--revalidate', action='store_true',
+                        help='also measure clients revalidating with If-None-Match')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load test of the /currencies dashboard')
+    add_arguments(parser)
+    parser.add_argument('--serve-only', metavar='DB', help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--output', help='result file (default: benchmarks/results/...)')
+    args = parser.parse_args()
+    if args.serve_only:
+        serve(args.serve_only, args.port)
+    else:
+        results = run(args.rows, args.concurrency, args.duration, args.url, revalidate=args.revalidate)
+        options = {key: value for key, value in vars(args).items() if key not in ('serve_only', 'port')}
+        save_results('load', results, options, args.output)
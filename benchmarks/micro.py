@@ -0,0 +1,85 @@
+"""
+Micro-benchmarks of the read path on synthetic databases
+
+    python -m benchmarks.micro --rows 10000 100000 1000000
+"""
+
+import argparse
+import json
+
+from benchmarks.common import measure, synthetic_db, use_database, save_results
+
+DEFAULT_ROWS = [10_000, 100_000, 1_000_000]
+PERIODS = ('1month', '1year', 'all')
+EXPORT_LIMITS = (100, 1000, 10000)
+
+
+def bench_database(path: str, repeat: int) -> dict:
+    """Time every read-path step against one database"""
+    from app import app
+    from cache import series_cache
+    from models import CurrencyRatesModel
+    from services import ChartDataService, RatesExportService
+
+    use_database(path)
+    results = {}
+    with app.app_context():
+        for period in PERIODS:
+            start_date = ChartDataService.get_period_start(period)
+            rows = CurrencyRatesModel.get_historical_rates('USD', start_date)
+            results[f'get_historical_rates[{period}]'] = dict(
+                measure(lambda: CurrencyRatesModel.get_historical_rates('USD', start_date), repeat),
+                rows=len(rows))
+
+            chart_data = ChartDataService.prepare_chart_data(rows, 'USD')
+            results[f'prepare_chart_data[{period}]'] = dict(
+                measure(lambda: ChartDataService.prepare_chart_data(rows, 'USD'), repeat), rows=len(rows))
+            results[f'calculate_rate_changes[{period}]'] = dict(
+                measure(lambda: ChartDataService.calculate_rate_changes(chart_data['mid'], chart_data['bid'],
+                                                                        chart_data['ask']), repeat),
+                rows=len(rows))
+
+            # Series as charts and analytics load it: snapshot slice, or SQLite with the series cache cleared
+            def load_series():
+                series_cache.clear()
+                return ChartDataService.get_series('USD', period)
+            results[f'get_series[{period}]'] = dict(measure(load_series, repeat), rows=len(rows))
+
+        # /api/rates bodies without the response cache: query plus serialization
+        for limit in EXPORT_LIMITS:
+            rows = CurrencyRatesModel.get_rates_with_filters(None, limit)
+            results[f'api_rates_query[{limit}]'] = dict(
+                measure(lambda: CurrencyRatesModel.get_rates_with_filters(None, limit), repeat), rows=len(rows))
+            results[f'api_rates_json[{limit}]'] = dict(
+                measure(lambda: json.dumps(RatesExportService.to_json(rows, None)), repeat), rows=len(rows))
+            results[f'api_rates_columnar[{limit}]'] = dict(
+                measure(lambda: json.dumps(RatesExportService.to_columnar(rows, None)), repeat), rows=len(rows))
+            results[f'api_rates_csv[{limit}]'] = dict(
+                measure(lambda: ''.join(RatesExportService.stream_csv(iter(rows))), repeat), rows=len(rows))
+    return results
+
+
+def run(rows_list, repeat: int = 20, rebuild: bool = False) -> dict:
+    results = {}
+    for rows in rows_list:
+        path = synthetic_db(rows, rebuild)
+        print(f"Micro-benchmarks on {rows} rows")
+        for name, stats in bench_database(path, repeat).items():
+            results[f'{name}@{rows}'] = stats
+            print(f"  {name:36s} p50 {stats['p50_ms']:10.3f} ms  p99 {stats['p99_ms']:10.3f} ms")
+    return results
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument('--rows', type=int, nargs='+', default=DEFAULT_ROWS,
+                        help='synthetic database sizes (10k-10M rows)')
+    parser.add_argument('--repeat', type=int, default=20, help='timed runs per benchmark')
+    parser.add_argument('--rebuild', action='store_true', help='regenerate cached synthetic databases')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Read path micro-benchmarks')
+    add_arguments(parser)
+    parser.add_argument('--output', help='result file (default: benchmarks/results/...)')
+    args = parser.parse_args()
+    save_results('micro', run(args.rows, args.repeat, args.rebuild), vars(args), args.output)
@@ -0,0 +1,42 @@
+"""
+Run the whole benchmark suite and save one result file
+
+    python -m benchmarks.run                              (micro + sync + load)
+    python -m benchmarks.run --suites micro --rows 10000 10000000
+"""
+
+import argparse
+
+from benchmarks import micro, sync, load
+from benchmarks.common import save_results
+
+SUITES = ('micro', 'sync', 'load')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Benchmark suite for the ingest and read paths')
+    parser.add_argument('--suites', nargs='+', choices=SUITES, default=list(SUITES))
+    parser.add_argument('--output', help='result file (default: benchmarks/results/...)')
+    micro.add_arguments(parser)
+    parser.add_argument('--years', type=int, default=10, help='sync: backfilled history length')
+    parser.add_argument('--latency', type=float, default=0.0, help='sync: fake server delay per request (s)')
+    parser.add_argument('--load-rows', type=int, default=100_000, help='load: synthetic database size')
+    parser.add_argument('--concurrency', type=int, default=8, help='load: concurrent clients')
+    parser.add_argument('--duration', type=float, default=20, help='load: measured seconds')
+    parser.add_argument('--revalidate', action='store_true', help='load: also measure 304 revalidation')
+    args = parser.parse_args()
+
+    results = {}
+    if 'micro' in args.suites:
+        results['micro'] = micro.run(args.rows, args.repeat, args.rebuild)
+    if 'sync' in args.suites:
+        print('Sync benchmarks')
+        results['sync'] = sync.run(args.years, args.latency)
+    if 'load' in args.suites:
+        print('Load test')
+        results['load'] = load.run(args.load_rows, args.concurrency, args.duration, revalidate=args.revalidate)
+    save_results('suite', results, vars(args), args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""
+End-to-end ingest benchmarks against the local fake NBP server
+
+    python -m benchmarks.sync --years 10 --latency 0.02
+"""
+
+import argparse
+import os
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.common import DATA_DIR, use_database, save_results
+
+
+def timed(server, func) -> dict:
+    """Wall time and upstream requests of one ingest step"""
+    requests_before = server.requests_served
+    started = time.perf_counter()
+    result = func()
+    return {
+        'seconds': round(time.perf_counter() - started, 4),
+        'upstream_requests': server.requests_served - requests_before,
+        'result': result,
+    }
+
+
+def run(years: int = 10, latency: float = 0.0, fail_rate: float = 0.0, workers: int = None) -> dict:
+    import fake_nbp_server
+    import services
+    from app import app
+    from models import DatabaseManager, CurrencyRatesModel
+    from services import CurrencyDataService, NBPBackfillEngine, NBPService, NBP_MAX_WORKERS
+
+    server = fake_nbp_server.start_background(latency=latency, fail_rate=fail_rate)
+    services.NBP_API_URL = server.base_url
+
+    os.makedirs(DATA_DIR, exist_ok=True)
+    path = os.path.join(DATA_DIR, 'sync.db')
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    use_database(path)
+
+    results = {}
+    try:
+        with app.app_context():
+            DatabaseManager.migrate(DatabaseManager.get_db())
+
+            # First start on an empty database: one year of tables A and C
+            results['initial_sync'] = timed(server, CurrencyDataService.check_and_fetch_missing_data)
+            # Scheduled sync with nothing new to fetch
+            results['incremental_noop'] = timed(server, CurrencyDataService.check_and_fetch_missing_data)
+
+            def backfill():
+                end = datetime.now().date()
+                start = end - timedelta(days=365 * years)
+                engine = NBPBackfillEngine(max_workers=workers or NBP_MAX_WORKERS)
+                tables = engine.fetch(start, end, ('A', 'C'))
+                counts = CurrencyRatesModel.upsert_rates(NBPService.merge_tables(tables))
+                CurrencyDataService.after_ingest(counts['currencies'], counts['ranges'])
+                return dict(engine.stats.to_dict(), inserted=counts['inserted'], updated=counts['updated'])
+
+            # Every currency over the whole range, re-upserting the rows of the initial sync
+            results[f'backfill_{years}y'] = timed(server, backfill)
+
+            def repair_gaps():
+                # Holes in the middle of the history are found and only their ranges refetched
+                db = DatabaseManager.get_db()
+                end = datetime.now().date()
+                for days_back in (300, 120, 45):
+                    hole_end = end - timedelta(days=days_back)
+                    db.execute("DELETE FROM rates WHERE date BETWEEN ? AND ?",
+                               ((hole_end - timedelta(days=10)).isoformat(), hole_end.isoformat()))
+                db.commit()
+                return CurrencyDataService.check_and_fetch_missing_data()
+
+            results['gap_repair'] = timed(server, repair_gaps)
+            results['rows_total'] = CurrencyRatesModel.get_rates_count()
+    finally:
+        server.shutdown()
+
+    for name, step in results.items():
+        if isinstance(step, dict):
+            print(f"  {name:20s} {step['seconds']:8.3f} s  {step['upstream_requests']:5d} requests")
+    return results
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument('--years', type=int, default=10, help='backfilled history length')
+    parser.add_argument('--latency', type=float, default=0.0, help='fake server delay per request (s)')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='fraction of failed upstream requests')
+    parser.add_argument('--workers', type=int, help='concurrent backfill requests (default NBP_MAX_WORKERS)')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='End-to-end sync benchmarks against a fake NBP server')
+    add_arguments(parser)
+    parser.add_argument('--output', help='result file (default: benchmarks/results/...)')
+    args = parser.parse_args()
+    save_results('sync', run(args.years, args.latency, args.fail_rate, args.workers), vars(args), args.output)
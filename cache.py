@@ -0,0 +1,288 @@
+"""
+Cache Layer - In-process caches for rate series and upstream data
+Keeps compact, array-backed time series in memory between ingests
+"""
+
+import math
+import os
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from datetime import date
+from typing import Dict, Hashable, Iterable, List, Optional
+
+# Memory cap and maximum entry age of the series cache; the age bound lets processes
+# that do not run the ingestion scheduler themselves pick up new data
+SERIES_CACHE_MAX_BYTES = int(os.environ.get('SERIES_CACHE_MAX_BYTES', 16 * 1024 * 1024))
+SERIES_CACHE_TTL = float(os.environ.get('SERIES_CACHE_TTL', 600))
+
+# Memory caps of the serialized payload and API response caches
+PAYLOAD_CACHE_MAX_BYTES = int(os.environ.get('PAYLOAD_CACHE_MAX_BYTES', 16 * 1024 * 1024))
+RESPONSE_CACHE_MAX_BYTES = int(os.environ.get('RESPONSE_CACHE_MAX_BYTES', 8 * 1024 * 1024))
+
+NAN = float('nan')
+
+
+class RateSeries:
+    """Compact time series: day ordinals plus float arrays (NaN marks a missing value)"""
+
+    __slots__ = ('currency', 'days', 'mid', 'bid', 'ask')
+
+    def __init__(self, currency: str, days: array, mid: array, bid: array, ask: array):
+        self.currency = currency
+        self.days = days
+        self.mid = mid
+        self.bid = bid
+        self.ask = ask
+
+    @classmethod
+    def from_rows(cls, currency: str, rows: Iterable) -> 'RateSeries':
+        """Build a series from (date, mid_rate, bid_rate, ask_rate) rows ordered by date"""
+        days, mid, bid, ask = array('i'), array('d'), array('d'), array('d')
+        for row in rows:
+            days.append(date.fromisoformat(row['date']).toordinal())
+            mid.append(NAN if row['mid_rate'] is None else row['mid_rate'])
+            bid.append(NAN if row['bid_rate'] is None else row['bid_rate'])
+            ask.append(NAN if row['ask_rate'] is None else row['ask_rate'])
+        return cls(currency, days, mid, bid, ask)
+
+    def __len__(self) -> int:
+        return len(self.days)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(a.itemsize * len(a) for a in (self.days, self.mid, self.bid, self.ask))
+
+    @staticmethod
+    def to_list(values: array) -> List[Optional[float]]:
+        """Convert a float array to a JSON-friendly list (NaN -> None)"""
+        return [None if math.isnan(v) else v for v in values]
+
+    def date_strings(self) -> List[str]:
+        return [date.fromordinal(d).isoformat() for d in self.days]
+
+    def to_chart_data(self) -> Dict:
+        """Chart payload in the format of ChartDataService.prepare_chart_data"""
+        return {
+            'dates': self.date_strings(),
+            'mid': self.to_list(self.mid),
+            'bid': self.to_list(self.bid),
+            'ask': self.to_list(self.ask),
+            'currency': self.currency
+        }
+
+
+class LRUCache:
+    """Thread-safe LRU cache bounded by the total size of its values (in bytes)"""
+
+    def __init__(self, max_bytes: int, ttl: float = 0):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (value, nbytes, stored_at)
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable):
+        """Get a cached value or None (counts a hit or a miss)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl and time.monotonic() - entry[2] > self.ttl:
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value, nbytes: int) -> None:
+        """Store a value, evicting least recently used entries above the memory cap"""
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, nbytes, time.monotonic())
+            self.current_bytes += nbytes
+            while self.current_bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def invalidate(self, predicate) -> int:
+        """Drop all entries whose key matches the predicate; returns the number dropped"""
+        with self._lock:
+            keys = [key for key in self._entries if predicate(key)]
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def _remove(self, key: Hashable) -> None:
+        _, nbytes, _ = self._entries.pop(key)
+        self.current_bytes -= nbytes
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+
+class SeriesCache(LRUCache):
+    """Rate series keyed by (currency, period, start date), invalidated per currency on ingest"""
+
+    def __init__(self, max_bytes: int, ttl: float = 0):
+        super().__init__(max_bytes, ttl)
+        # Bumped on every invalidation so series read before an ingest are not stored after it
+        self.generation = 0
+
+    def get_series(self, currency: str, period: str, start_date: Optional[str]) -> Optional[RateSeries]:
+        # The period window moves with the calendar, so the start date is part of the key
+        return self.get((currency, period, start_date))
+
+    def put_series(self, period: str, start_date: Optional[str], series: RateSeries, generation: int) -> None:
+        if generation != self.generation:
+            return
+        self.put((series.currency, period, start_date), series, series.nbytes)
+
+    def invalidate_currencies(self, currencies: Iterable[str]) -> int:
+        codes = set(currencies)
+        if not codes:
+            return 0
+        self.generation += 1
+        return self.invalidate(lambda key: key[0] in codes)
+
+
+class RefreshingCache:
+    """TTL cache in front of a slow or rate-limited upstream
+
+    - fresh entries (younger than ttl) are served directly
+    - stale entries (up to ttl + stale_ttl) are served while one background refresh runs
+    - concurrent misses of a key are coalesced into a single loader call
+    - when the loader fails, the last good value (or the fallback's) is served instead, and
+      the upstream is not retried for retry_delay seconds
+    """
+
+    def __init__(self, loader, ttl: float, stale_ttl: float, retry_delay: float = 30, fallback=None,
+                 wait_timeout: float = 30):
+        self.loader = loader              # key -> value, raises on failure
+        self.fallback = fallback          # key -> (value, fetched_at epoch) or None, used on cold failures
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.retry_delay = retry_delay
+        self.wait_timeout = wait_timeout  # how long coalesced requests wait for the leader
+        self._entries = {}                # key -> (value, fetched_at epoch)
+        self._inflight = {}               # key -> threading.Event set when the load finishes
+        self._failed_at = {}
+        self._lock = threading.Lock()
+        self.counters = {'fresh_hits': 0, 'stale_hits': 0, 'misses': 0, 'coalesced': 0,
+                         'loads': 0, 'failures': 0, 'fallbacks': 0}
+
+    def get(self, key: Hashable):
+        """Get (value, info) where info has fetched_at (epoch seconds), age and source
+
+        source is 'fresh', 'stale' (served while refreshing or after a failed refresh) or
+        None with a None value when nothing could be loaded.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            age = time.time() - entry[1] if entry else None
+            if entry and age < self.ttl:
+                self.counters['fresh_hits'] += 1
+                return entry[0], self._info(entry, 'fresh')
+            if entry and age < self.ttl + self.stale_ttl:
+                self.counters['stale_hits'] += 1
+                if key not in self._inflight and not self._backing_off(key):
+                    self._inflight[key] = threading.Event()
+                    threading.Thread(target=self._load, args=(key,), name='cache-refresh', daemon=True).start()
+                return entry[0], self._info(entry, 'stale')
+
+            self.counters['misses'] += 1
+            event = self._inflight.get(key)
+            leader = event is None and not self._backing_off(key)
+            if leader:
+                event = self._inflight[key] = threading.Event()
+            elif event is not None:
+                self.counters['coalesced'] += 1
+
+        if leader:
+            self._load(key)
+        elif event is not None:
+            event.wait(self.wait_timeout)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None, self._info(None, None)
+            fresh = time.time() - entry[1] < self.ttl
+            return entry[0], self._info(entry, 'fresh' if fresh else 'stale')
+
+    def _load(self, key: Hashable) -> None:
+        """Run the loader for a key (on the requesting or a background thread)"""
+        try:
+            value = self.loader(key)
+            with self._lock:
+                self.counters['loads'] += 1
+                self._entries[key] = (value, time.time())
+                self._failed_at.pop(key, None)
+        except Exception as e:
+            print(f"Cache refresh of {key!r} failed: {e}")
+            with self._lock:
+                self.counters['failures'] += 1
+                self._failed_at[key] = time.monotonic()
+                has_entry = key in self._entries
+            if not has_entry and self.fallback is not None:
+                restored = self.fallback(key)
+                if restored is not None:
+                    with self._lock:
+                        self.counters['fallbacks'] += 1
+                        self._entries.setdefault(key, restored)
+        finally:
+            with self._lock:
+                event = self._inflight.pop(key, None)
+            if event is not None:
+                event.set()
+
+    def _backing_off(self, key: Hashable) -> bool:
+        failed_at = self._failed_at.get(key)
+        return failed_at is not None and time.monotonic() - failed_at < self.retry_delay
+
+    @staticmethod
+    def _info(entry, source) -> Dict:
+        if entry is None:
+            return {'source': None, 'fetched_at': None, 'age': None}
+        return {'source': source, 'fetched_at': entry[1], 'age': round(time.time() - entry[1], 1)}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._failed_at.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.counters['fresh_hits'] + self.counters['stale_hits'] + self.counters['misses']
+            hits = self.counters['fresh_hits'] + self.counters['stale_hits']
+            return dict(self.counters, entries=len(self._entries), ttl=self.ttl, stale_ttl=self.stale_ttl,
+                        hit_rate=round(hits / lookups, 4) if lookups else 0.0)
+
+
+series_cache = SeriesCache(SERIES_CACHE_MAX_BYTES, SERIES_CACHE_TTL)
+payload_cache = LRUCache(PAYLOAD_CACHE_MAX_BYTES)
+response_cache = LRUCache(RESPONSE_CACHE_MAX_BYTES)
@@ -0,0 +1,139 @@
+"""
+Analytics Layer - Cross rates and currency conversion
+Holds every stored PLN rate in a date-indexed NumPy matrix, so cross rates and bulk
+conversions on any historical date are array lookups instead of per-item queries
+"""
+
+from typing import Dict, Iterable, List, Sequence
+
+import numpy as np
+
+# All NBP rates are quoted in PLN
+BASE_CURRENCY = 'PLN'
+
+FIELDS = ('mid', 'bid', 'ask')
+
+# Conversion methods: average (Table A) rates, or Table C rates as a bank would apply them -
+# the source currency is sold at its bid rate and the target currency bought at its ask rate
+METHODS = ('mid', 'exchange')
+
+
+class RateMatrix:
+    """Forward-filled (day x currency) matrices of PLN rates, one per field
+
+    A date without a publication (weekend, holiday, missing row) resolves to the latest
+    earlier published rate, as NBP rates apply until the next table is published.
+    """
+
+    def __init__(self, days: np.ndarray, codes: Sequence[str], values: Dict[str, np.ndarray],
+                 sources: Dict[str, np.ndarray]):
+        self.days = days                  # datetime64[D], ascending, one row per stored date
+        self.codes = list(codes)          # column order, PLN included
+        self.columns = {code: i for i, code in enumerate(self.codes)}
+        self.values = values              # field -> float64 (days x codes), NaN before a currency's first rate
+        self.sources = sources            # field -> int32 row the (forward-filled) value was published on
+
+    @classmethod
+    def from_rows(cls, rows: Iterable) -> 'RateMatrix':
+        """Build the matrix from (currency_code, date, mid_rate, bid_rate, ask_rate) rows"""
+        codes, dates, columns = [], [], {field: [] for field in FIELDS}
+        for row in rows:
+            codes.append(row[0])
+            dates.append(row[1])
+            for i, field in enumerate(FIELDS):
+                columns[field].append(np.nan if row[2 + i] is None else row[2 + i])
+
+        currency_codes = sorted(set(codes) | {BASE_CURRENCY})
+        days, day_index = np.unique(np.array(dates, dtype='datetime64[D]'), return_inverse=True)
+        code_index = np.searchsorted(currency_codes, codes) if codes else np.empty(0, dtype=np.int64)
+
+        values, sources = {}, {}
+        for field in FIELDS:
+            matrix = np.full((len(days), len(currency_codes)), np.nan)
+            matrix[day_index, code_index] = columns[field]
+            matrix[:, currency_codes.index(BASE_CURRENCY)] = 1.0
+            values[field], sources[field] = cls.forward_fill(matrix)
+        return cls(days, currency_codes, values, sources)
+
+    @staticmethod
+    def forward_fill(matrix: np.ndarray):
+        """Fill NaNs down each column with the last valid value; returns (values, source rows)"""
+        rows = np.arange(len(matrix), dtype=np.int32)[:, None]
+        source = np.where(np.isnan(matrix), 0, rows)
+        np.maximum.accumulate(source, axis=0, out=source)
+        filled = np.take_along_axis(matrix, source, axis=0)
+        return filled, source.astype(np.int32)
+
+    def __len__(self) -> int:
+        return len(self.days)
+
+    @property
+    def nbytes(self) -> int:
+        return self.days.nbytes + sum(a.nbytes for a in self.values.values()) + \
+            sum(a.nbytes for a in self.sources.values())
+
+    def column(self, code: str) -> int:
+        """Column of a currency; raises ValueError for currencies without stored rates"""
+        try:
+            return self.columns[code.upper()]
+        except KeyError:
+            raise ValueError(f"Unknown currency: {code}") from None
+
+    def row_indices(self, dates) -> np.ndarray:
+        """Row in effect on each date (-1 before the first stored date)"""
+        return np.searchsorted(self.days, np.asarray(dates, dtype='datetime64[D]'), side='right') - 1
+
+    def lookup(self, code: str, rows: np.ndarray, field: str = 'mid'):
+        """Rates of a currency at the given rows, with the dates they were published on"""
+        column = self.column(code)
+        valid = rows >= 0
+        safe_rows = np.where(valid, rows, 0)
+        rates = np.where(valid, self.values[field][safe_rows, column], np.nan)
+        published = self.days[self.sources[field][safe_rows, column]]
+        published = np.where(np.isnan(rates), np.datetime64('NaT'), published)
+        return rates, published
+
+    def cross(self, base: str, quote: str, dates) -> Dict[str, np.ndarray]:
+        """Price of one unit of `base` in `quote` (mid, plus bid/ask from Table C) on each date
+
+        Bid sells the base currency at its bid and buys the quote currency at its ask;
+        ask is the reverse.
+        """
+        rows = self.row_indices(np.atleast_1d(dates))
+        base_rates = {field: self.lookup(base, rows, field) for field in FIELDS}
+        quote_rates = {field: self.lookup(quote, rows, field) for field in FIELDS}
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return {
+                'mid': base_rates['mid'][0] / quote_rates['mid'][0],
+                'bid': base_rates['bid'][0] / quote_rates['ask'][0],
+                'ask': base_rates['ask'][0] / quote_rates['bid'][0],
+                # The older of the two publications the mid cross rate is based on
+                'rate_date': np.minimum(base_rates['mid'][1], quote_rates['mid'][1])
+            }
+
+    def convert(self, amounts, source: str, target: str, dates, method: str = 'mid') -> Dict[str, np.ndarray]:
+        """Convert amounts (vectorized over amounts and/or dates) between two currencies"""
+        rows = self.row_indices(np.atleast_1d(dates))
+        if method == 'exchange':
+            source_rate, source_date = self.lookup(source, rows, 'bid')
+            target_rate, target_date = self.lookup(target, rows, 'ask')
+        else:
+            source_rate, source_date = self.lookup(source, rows, 'mid')
+            target_rate, target_date = self.lookup(target, rows, 'mid')
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rate = source_rate / target_rate
+        # One date applies to all amounts, and one amount to all dates
+        amounts, rate, rate_date = np.broadcast_arrays(np.asarray(amounts, dtype=np.float64), rate,
+                                                       np.minimum(source_date, target_date))
+        return {'amount': amounts * rate, 'rate': rate, 'rate_date': rate_date}
+
+    def date_range(self, start_date: str = None, end_date: str = None) -> np.ndarray:
+        """Stored publication dates within [start_date, end_date]"""
+        first = np.searchsorted(self.days, np.datetime64(start_date, 'D')) if start_date else 0
+        last = np.searchsorted(self.days, np.datetime64(end_date, 'D'), side='right') if end_date else len(self.days)
+        return self.days[first:last]
+
+
+def date_list(values: np.ndarray) -> List:
+    """datetime64 array to a JSON-friendly list of ISO dates (NaT -> None)"""
+    return [None if np.isnat(v) else str(v) for v in values]
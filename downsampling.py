@@ -0,0 +1,50 @@
+"""
+Analytics Layer - Server-side downsampling of rate series for charts
+Largest-triangle-three-buckets for line charts and the choice of OHLC candle granularity
+"""
+
+import numpy as np
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """Indices of the points kept by largest-triangle-three-buckets downsampling
+
+    The first and last points are always kept; every bucket in between contributes the
+    point forming the largest triangle with the previously kept point and the average
+    of the next bucket.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    indices = np.empty(threshold, dtype=np.int64)
+    indices[0] = 0
+    indices[-1] = n - 1
+    # Interior points are split into threshold - 2 buckets of (fractional) size `every`
+    every = (n - 2) / (threshold - 2)
+
+    previous = 0
+    for i in range(threshold - 2):
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+
+        bucket_x = x[start:end]
+        bucket_y = y[start:end]
+        areas = np.abs((x[previous] - avg_x) * (bucket_y - y[previous])
+                       - (x[previous] - bucket_x) * (avg_y - y[previous]))
+        previous = start + int(np.argmax(areas))
+        indices[i + 1] = previous
+    return indices
+
+
+def choose_granularity(span_days: int, target_points: int) -> str:
+    """Finest bucket size whose bucket count over the span stays within the target"""
+    if span_days / 7 <= target_points:
+        return 'weekly'
+    if span_days / 30.4 <= target_points:
+        return 'monthly'
+    return 'yearly'
+
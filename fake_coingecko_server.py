@@ -0,0 +1,182 @@
+"""
+Local stand-in for the CoinGecko markets API (/api/v3/coins/markets)
+Serves deterministic synthetic market data so the crypto page and its cache can be
+exercised offline:
+
+    python fake_coingecko_server.py --port 8082 --fail-rate 0.3
+    CRYPTO_API_URL=http://127.0.0.1:8082/api/v3/coins/markets python app.py
+"""
+
+import argparse
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# (id, symbol, name, base price in USD, circulating supply)
+COINS = [
+    ('bitcoin', 'btc', 'Bitcoin', 65000.0, 19.7e6), ('ethereum', 'eth', 'Ethereum', 3200.0, 120.1e6),
+    ('tether', 'usdt', 'Tether', 1.0, 110e9), ('binancecoin', 'bnb', 'BNB', 580.0, 147e6),
+    ('solana', 'sol', 'Solana', 150.0, 460e6), ('usd-coin', 'usdc', 'USDC', 1.0, 33e9),
+    ('ripple', 'xrp', 'XRP', 0.55, 55e9), ('dogecoin', 'doge', 'Dogecoin', 0.14, 145e9),
+    ('cardano', 'ada', 'Cardano', 0.45, 35e9), ('tron', 'trx', 'TRON', 0.12, 87e9),
+    ('avalanche-2', 'avax', 'Avalanche', 28.0, 390e6), ('chainlink', 'link', 'Chainlink', 14.0, 587e6),
+]
+
+
+def synthetic_price(base: float, timestamp: float, coin_id: str) -> float:
+    """Deterministic, smoothly varying price of a coin at a point in time"""
+    phase = sum(ord(c) for c in coin_id)
+    hours = timestamp / 3600.0
+    return base * (1 + 0.08 * math.sin(hours / 120.0 + phase) + 0.02 * math.sin(hours / 6.0 + phase))
+
+
+def build_markets(per_page: int, page: int) -> list:
+    """Build a /coins/markets response page, ordered by market cap"""
+    now = time.time()
+    coins = []
+    for coin_id, symbol, name, base, supply in COINS:
+        price = synthetic_price(base, now, coin_id)
+        price_24h = synthetic_price(base, now - 86400, coin_id)
+        price_7d = synthetic_price(base, now - 7 * 86400, coin_id)
+        coins.append({
+            'id': coin_id,
+            'symbol': symbol,
+            'name': name,
+            'image': '',
+            'current_price': round(price, 6),
+            'market_cap': round(price * supply),
+            'total_volume': round(price * supply * 0.03),
+            'high_24h': round(max(price, price_24h) * 1.01, 6),
+            'low_24h': round(min(price, price_24h) * 0.99, 6),
+            'price_change_24h': round(price - price_24h, 6),
+            'price_change_percentage_24h': round((price / price_24h - 1) * 100, 4),
+            'price_change_percentage_24h_in_currency': round((price / price_24h - 1) * 100, 4),
+            'price_change_percentage_7d_in_currency': round((price / price_7d - 1) * 100, 4),
+            'circulating_supply': supply,
+            'last_updated': time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime(now)),
+        })
+    coins.sort(key=lambda coin: coin['market_cap'], reverse=True)
+    for rank, coin in enumerate(coins, start=1):
+        coin['market_cap_rank'] = rank
+    start = (page - 1) * per_page
+    return coins[start:start + per_page]
+
+
+class FakeCoinGeckoHandler(BaseHTTPRequestHandler):
+    """Request handler emulating the CoinGecko markets endpoint"""
+
+    server_version = 'FakeCoinGecko/1.0'
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def send_json(self, status: int, payload, headers: dict = None) -> None:
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        server = self.server
+        server.count_request()
+        if server.latency:
+            time.sleep(server.latency)
+
+        if server.down:
+            self.send_json(503, {'error': 'Service Unavailable'})
+            return
+        if server.rate_limited():
+            self.send_json(429, {'status': {'error_code': 429, 'error_message': 'Rate limit exceeded'}},
+                           {'Retry-After': '60'})
+            return
+        if server.fail_rate and random.random() < server.fail_rate:
+            self.send_json(500, {'error': 'Internal Server Error'})
+            return
+
+        url = urlparse(self.path)
+        if url.path.rstrip('/') != '/api/v3/coins/markets':
+            self.send_json(404, {'error': 'Not Found'})
+            return
+        query = parse_qs(url.query)
+        try:
+            per_page = int(query.get('per_page', ['100'])[0])
+            page = int(query.get('page', ['1'])[0])
+        except ValueError:
+            self.send_json(400, {'error': 'Invalid pagination'})
+            return
+        self.send_json(200, build_markets(per_page, page))
+
+
+class FakeCoinGeckoServer(ThreadingHTTPServer):
+    """Threaded HTTP server with optional latency, failures, rate limiting and an outage switch"""
+
+    daemon_threads = True
+
+    def __init__(self, address, latency: float = 0.0, fail_rate: float = 0.0,
+                 rate_limit: float = 0.0, verbose: bool = False):
+        super().__init__(address, FakeCoinGeckoHandler)
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.rate_limit = rate_limit
+        self.verbose = verbose
+        self.down = False  # answer every request with 503 (simulated outage)
+        self.requests_served = 0
+        self._lock = threading.Lock()
+        self._window_start = time.monotonic()
+        self._window_count = 0
+
+    def count_request(self) -> None:
+        with self._lock:
+            self.requests_served += 1
+
+    def rate_limited(self) -> bool:
+        """Fixed one-minute window limiter answering 429 above `rate_limit` requests/min"""
+        if not self.rate_limit:
+            return False
+        with self._lock:
+            now = time.monotonic()
+            if now - self._window_start >= 60.0:
+                self._window_start = now
+                self._window_count = 0
+            self._window_count += 1
+            return self._window_count > self.rate_limit
+
+    @property
+    def markets_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/api/v3/coins/markets"
+
+
+def start_background(port: int = 0, **options) -> FakeCoinGeckoServer:
+    """Start a fake CoinGecko server in a daemon thread (port 0 picks a free port)"""
+    server = FakeCoinGeckoServer(('127.0.0.1', port), **options)
+    threading.Thread(target=server.serve_forever, name='fake-coingecko', daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local stand-in for the CoinGecko markets API')
+    parser.add_argument('--port', type=int, default=8082)
+    parser.add_argument('--latency', type=float, default=0.0, help='artificial delay per request (seconds)')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='fraction of requests answered with 500')
+    parser.add_argument('--rate-limit', type=float, default=0.0, help='requests/min above which 429 is returned')
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    server = FakeCoinGeckoServer(('127.0.0.1', args.port), latency=args.latency, fail_rate=args.fail_rate,
+                                 rate_limit=args.rate_limit, verbose=args.verbose)
+    print(f"Fake CoinGecko API listening on {server.markets_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
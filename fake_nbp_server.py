@@ -0,0 +1,197 @@
+"""
+Local stand-in for the NBP Web API (exchange rate tables A and C)
+Serves deterministic synthetic rates, published on NBP business days (nbp_calendar),
+so syncs and backfills can be run offline:
+
+    python fake_nbp_server.py --port 8081 --latency 0.05
+    NBP_API_URL=http://127.0.0.1:8081/api python app.py
+"""
+
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from nbp_calendar import is_business_day
+
+# (code, name, base rate vs PLN) - Table C publishes only a subset of Table A currencies
+CURRENCIES = [
+    ('USD', 'dolar amerykański', 3.95), ('EUR', 'euro', 4.30), ('GBP', 'funt szterling', 5.05),
+    ('CHF', 'frank szwajcarski', 4.45), ('AUD', 'dolar australijski', 2.60), ('CAD', 'dolar kanadyjski', 2.90),
+    ('HUF', 'forint (Węgry)', 0.0110), ('JPY', 'jen (Japonia)', 0.0265), ('CZK', 'korona czeska', 0.172),
+    ('DKK', 'korona duńska', 0.577), ('NOK', 'korona norweska', 0.372), ('SEK', 'korona szwedzka', 0.376),
+    ('XDR', 'SDR (MFW)', 5.25), ('THB', 'bat (Tajlandia)', 0.112), ('HKD', 'dolar Hongkongu', 0.505),
+    ('NZD', 'dolar nowozelandzki', 2.40), ('SGD', 'dolar singapurski', 2.93), ('UAH', 'hrywna (Ukraina)', 0.096),
+    ('ISK', 'korona islandzka', 0.0287), ('RON', 'lej rumuński', 0.865), ('BGN', 'lew (Bułgaria)', 2.20),
+    ('TRY', 'lira turecka', 0.12), ('ILS', 'szekel (Izrael)', 1.07), ('CLP', 'peso chilijskie', 0.0042),
+    ('PHP', 'peso filipińskie', 0.069), ('MXN', 'peso meksykańskie', 0.21), ('ZAR', 'rand (RPA)', 0.215),
+    ('BRL', 'real (Brazylia)', 0.72), ('MYR', 'ringgit (Malezja)', 0.85), ('IDR', 'rupia indonezyjska', 0.00025),
+    ('INR', 'rupia indyjska', 0.047), ('KRW', 'won południowokoreański', 0.0029), ('CNY', 'yuan renminbi (Chiny)', 0.545),
+]
+TABLE_C_CODES = {'USD', 'AUD', 'CAD', 'EUR', 'HUF', 'CHF', 'GBP', 'JPY', 'CZK', 'DKK', 'NOK', 'SEK', 'XDR'}
+
+# NBP rejects ranges longer than 367 days
+MAX_RANGE_DAYS = 367
+
+PATH_PATTERN = re.compile(r'^/api/exchangerates/tables/([AC])/(\d{4}-\d{2}-\d{2})/(\d{4}-\d{2}-\d{2})/?$')
+
+
+def synthetic_mid(base: float, day: datetime, code: str) -> float:
+    """Deterministic, smoothly varying mid rate for a currency and day"""
+    phase = sum(ord(c) for c in code)
+    ordinal = day.toordinal()
+    return base * (1 + 0.05 * math.sin(ordinal / 90.0 + phase) + 0.01 * math.sin(ordinal / 7.0 + phase))
+
+
+def build_table(table: str, day: datetime, number: int) -> dict:
+    """Build one NBP table for a business day"""
+    rates = []
+    for code, name, base in CURRENCIES:
+        mid = synthetic_mid(base, day, code)
+        if table == 'A':
+            rates.append({'currency': name, 'code': code, 'mid': round(mid, 6)})
+        elif code in TABLE_C_CODES:
+            rates.append({'currency': name, 'code': code,
+                          'bid': round(mid * 0.99, 4), 'ask': round(mid * 1.01, 4)})
+    entry = {
+        'table': table,
+        'no': f"{number:03d}/{table}/NBP/{day.year}",
+        'effectiveDate': day.strftime('%Y-%m-%d'),
+        'rates': rates,
+    }
+    if table == 'C':
+        entry['tradingDate'] = (day - timedelta(days=1)).strftime('%Y-%m-%d')
+    return entry
+
+
+class FakeNBPHandler(BaseHTTPRequestHandler):
+    """Request handler emulating the NBP tables endpoint"""
+
+    server_version = 'FakeNBP/1.0'
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def send_json(self, status: int, payload, headers: dict = None) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        server = self.server
+        server.count_request()
+        if server.latency:
+            time.sleep(server.latency)
+
+        if server.rate_limited():
+            self.send_json(429, 'Too Many Requests', {'Retry-After': '1'})
+            return
+        if server.fail_rate and random.random() < server.fail_rate:
+            self.send_json(500, 'Internal Server Error')
+            return
+
+        match = PATH_PATTERN.match(self.path.split('?')[0])
+        if not match:
+            self.send_json(400, 'Bad Request')
+            return
+
+        table, start_str, end_str = match.groups()
+        start = datetime.strptime(start_str, '%Y-%m-%d')
+        end = datetime.strptime(end_str, '%Y-%m-%d')
+        if end < start or (end - start).days >= MAX_RANGE_DAYS:
+            self.send_json(400, 'Bad Request - Przekroczony limit 367 dni')
+            return
+        if server.fail_over_days and (end - start).days > server.fail_over_days:
+            self.send_json(500, 'Internal Server Error')
+            return
+
+        tables = []
+        day = start
+        while day <= end:
+            if is_business_day(day.date()):
+                tables.append(build_table(table, day, day.timetuple().tm_yday))
+            day += timedelta(days=1)
+
+        if not tables:
+            self.send_json(404, 'Not Found - Brak danych')
+            return
+        self.send_json(200, tables)
+
+
+class FakeNBPServer(ThreadingHTTPServer):
+    """Threaded HTTP server with optional latency, failures and rate limiting"""
+
+    daemon_threads = True
+
+    def __init__(self, address, latency: float = 0.0, fail_rate: float = 0.0,
+                 rate_limit: float = 0.0, fail_over_days: int = 0, verbose: bool = False):
+        super().__init__(address, FakeNBPHandler)
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.fail_over_days = fail_over_days  # ranges longer than this get a 500 (forces chunk splits)
+        self.rate_limit = rate_limit
+        self.verbose = verbose
+        self.requests_served = 0
+        self._lock = threading.Lock()
+        self._window_start = time.monotonic()
+        self._window_count = 0
+
+    def count_request(self) -> None:
+        with self._lock:
+            self.requests_served += 1
+
+    def rate_limited(self) -> bool:
+        """Fixed one-second window limiter answering 429 above `rate_limit` requests/s"""
+        if not self.rate_limit:
+            return False
+        with self._lock:
+            now = time.monotonic()
+            if now - self._window_start >= 1.0:
+                self._window_start = now
+                self._window_count = 0
+            self._window_count += 1
+            return self._window_count > self.rate_limit
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/api"
+
+
+def start_background(port: int = 0, **options) -> FakeNBPServer:
+    """Start a fake NBP server in a daemon thread (port 0 picks a free port)"""
+    server = FakeNBPServer(('127.0.0.1', port), **options)
+    threading.Thread(target=server.serve_forever, name='fake-nbp', daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local stand-in for the NBP exchange rates API')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency', type=float, default=0.0, help='artificial delay per request (seconds)')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='fraction of requests answered with 500')
+    parser.add_argument('--rate-limit', type=float, default=0.0, help='requests/s above which 429 is returned')
+    parser.add_argument('--fail-over-days', type=int, default=0,
+                        help='answer 500 for ranges longer than this many days')
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    server = FakeNBPServer(('127.0.0.1', args.port), latency=args.latency, fail_rate=args.fail_rate,
+                           rate_limit=args.rate_limit, fail_over_days=args.fail_over_days, verbose=args.verbose)
+    print(f"Fake NBP API listening on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
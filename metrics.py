@@ -0,0 +1,390 @@
+"""
+Observability Layer - In-process metrics
+Per-route latency histograms, SQL query timings, upstream HTTP latency and outcomes and
+cache counters, exposed in the Prometheus text format and as Server-Timing headers
+"""
+
+import os
+import re
+import sqlite3
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Instrumentation can be switched off entirely (plain SQLite connections, no timing hooks)
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') != '0'
+# Add a Server-Timing header (db, upstream, render, total) to every response
+SERVER_TIMING = os.environ.get('SERVER_TIMING', '0') == '1'
+
+# Histogram bucket upper bounds in seconds
+REQUEST_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+UPSTREAM_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# SQL text is normalized into the query label; longer statements are cut
+QUERY_LABEL_LENGTH = 120
+# Rows read by iterating a cursor are timed one by one and reported in batches of this size
+ITERATION_REPORT_ROWS = 256
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: Iterable[str], values: Iterable) -> str:
+    pairs = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return f'{{{pairs}}}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter per label set"""
+
+    kind = 'counter'
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount: float = 1) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}" for key, value in items]
+
+
+class Histogram:
+    """Cumulative-bucket histogram per label set (Prometheus semantics: le = upper bound)"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = REQUEST_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self._values = {}  # label values -> [per-bucket counts (+Inf last), sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(label_values)
+            if entry is None:
+                entry = self._values[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, ([*entry[0]], entry[1], entry[2])) for key, entry in self._values.items())
+        lines = []
+        bucket_labels = self.labels + ('le',)
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels(bucket_labels, key + (_format_value(bound),))} "
+                             f"{cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Metrics of this process plus collectors sampled at scrape time"""
+
+    def __init__(self):
+        self._metrics = []
+        # Callables returning [(name, type, help, [(labels dict, value), ...]), ...]
+        self._collectors = []
+
+    def counter(self, name: str, help_text: str, labels: Tuple[str, ...] = ()) -> Counter:
+        metric = Counter(name, help_text, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help_text: str, labels: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = REQUEST_BUCKETS) -> Histogram:
+        metric = Histogram(name, help_text, labels, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable) -> None:
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format (version 0.0.4)"""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            try:
+                families = collector()
+            except Exception as e:
+                print(f"Metrics collector failed: {e}")
+                continue
+            for name, kind, help_text, samples in families:
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(labels.keys(), labels.values())} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+REQUEST_SECONDS = registry.histogram(
+    'http_request_duration_seconds', 'Request latency by route', ('route', 'method', 'status'))
+QUERY_SECONDS = registry.histogram(
+    'sqlite_query_duration_seconds', 'SQL statement execution time by normalized query', ('query',),
+    QUERY_BUCKETS)
+FETCH_SECONDS = registry.counter(
+    'sqlite_fetch_seconds_total', 'Time spent fetching result rows by normalized query', ('query',))
+UPSTREAM_SECONDS = registry.histogram(
+    'upstream_request_duration_seconds', 'Upstream HTTP latency by service', ('service',), UPSTREAM_BUCKETS)
+UPSTREAM_REQUESTS = registry.counter(
+    'upstream_requests_total', 'Upstream HTTP requests by service and status code or error', ('service', 'status'))
+
+
+# ---- Per-request phase timings (Server-Timing) ----
+
+# phase -> seconds spent in the current request; contexts copied to worker threads share the dict
+_request_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar('request_timings', default=None)
+
+
+def start_request():
+    """Begin collecting phase timings for the current request; returns a token for end_request"""
+    return _request_timings.set({})
+
+
+def end_request(token) -> None:
+    try:
+        _request_timings.reset(token)
+    except ValueError:
+        # Streamed responses may finish in another context (WSGI adapters iterate on other threads)
+        _request_timings.set(None)
+
+
+def add_timing(phase: str, seconds: float) -> None:
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[phase] = timings.get(phase, 0.0) + seconds
+
+
+@contextmanager
+def timed(phase: str):
+    """Attribute the time spent in the block to a request phase"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_timing(phase, time.perf_counter() - started)
+
+
+def server_timing(total: float) -> str:
+    """Server-Timing header value of the current request (durations in milliseconds)"""
+    timings = _request_timings.get() or {}
+    parts = [f"{phase};dur={seconds * 1000:.2f}" for phase, seconds in sorted(timings.items())]
+    parts.append(f"total;dur={total * 1000:.2f}")
+    return ', '.join(parts)
+
+
+def observe_request(route: str, method: str, status: int, seconds: float) -> None:
+    REQUEST_SECONDS.observe(seconds, route, method, str(status))
+
+
+# ---- SQL ----
+
+_WHITESPACE = re.compile(r'\s+')
+_PLACEHOLDER_LIST = re.compile(r'\?(?:\s*,\s*\?)+')
+_ROW_LIST = re.compile(r'\(\?, \.\.\.\)(?:\s*,\s*\(\?, \.\.\.\))+')
+
+
+@lru_cache(maxsize=1024)
+def query_label(sql: str) -> str:
+    """Normalized statement text: collapsed whitespace and placeholder lists of any length"""
+    normalized = _WHITESPACE.sub(' ', sql).strip()
+    normalized = _PLACEHOLDER_LIST.sub('?, ...', normalized)
+    normalized = _ROW_LIST.sub('(?, ...), ...', normalized)
+    return normalized[:QUERY_LABEL_LENGTH]
+
+
+def observe_query(sql: str, seconds: float) -> None:
+    QUERY_SECONDS.observe(seconds, query_label(sql))
+    add_timing('db', seconds)
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor timing statement execution and row fetching (fetch* calls and iteration)"""
+
+    _query = ''
+    _iterated = 0.0
+    _iterated_rows = 0
+
+    def execute(self, sql, parameters=()):
+        self._report_iteration()
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._query = sql
+            observe_query(sql, time.perf_counter() - started)
+
+    def executemany(self, sql, seq_of_parameters):
+        self._report_iteration()
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._query = sql
+            observe_query(sql, time.perf_counter() - started)
+
+    def _fetched(self, started: float) -> None:
+        seconds = time.perf_counter() - started
+        FETCH_SECONDS.inc(query_label(self._query), amount=seconds)
+        add_timing('db', seconds)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            self._fetched(started)
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        try:
+            return super().fetchmany(self.arraysize if size is None else size)
+        finally:
+            self._fetched(started)
+
+    def fetchall(self):
+        started = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            self._fetched(started)
+
+    def __next__(self):
+        # `for row in db.execute(...)` reads rows without any fetch* call
+        started = time.perf_counter()
+        try:
+            row = super().__next__()
+        except BaseException:
+            self._iterated += time.perf_counter() - started
+            self._report_iteration()
+            raise
+        self._iterated += time.perf_counter() - started
+        self._iterated_rows += 1
+        if self._iterated_rows >= ITERATION_REPORT_ROWS:
+            self._report_iteration()
+        return row
+
+    def close(self):
+        self._report_iteration()
+        super().close()
+
+    def _report_iteration(self) -> None:
+        """Report the time spent iterating since the last report (batched to keep per-row cost low)"""
+        if self._iterated:
+            FETCH_SECONDS.inc(query_label(self._query), amount=self._iterated)
+            add_timing('db', self._iterated)
+            self._iterated = 0.0
+            self._iterated_rows = 0
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connection whose statements (including the execute shortcuts) run on timed cursors"""
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, script):
+        started = time.perf_counter()
+        try:
+            return super().executescript(script)
+        finally:
+            observe_query('<script>', time.perf_counter() - started)
+
+
+# ---- Upstream HTTP ----
+
+class UpstreamCall:
+    status = None
+
+
+@contextmanager
+def upstream(service: str):
+    """Time an upstream HTTP call; set `.status` on the yielded object to the response status
+
+    Exceptions are counted under their class name (e.g. ConnectTimeout) and re-raised.
+    """
+    call = UpstreamCall()
+    started = time.perf_counter()
+    try:
+        yield call
+    except Exception as e:
+        call.status = type(e).__name__
+        raise
+    finally:
+        seconds = time.perf_counter() - started
+        UPSTREAM_SECONDS.observe(seconds, service)
+        UPSTREAM_REQUESTS.inc(service, str(call.status))
+        add_timing('upstream', seconds)
+
+
+# ---- Caches ----
+
+def cache_collector(caches: Dict[str, Callable[[], Dict]]) -> Callable:
+    """Collector exporting the counters of caches given as name -> stats() callable"""
+    def collect():
+        stats = {name: get_stats() for name, get_stats in caches.items()}
+        hits, misses, ratio, entries = [], [], [], []
+        for name, values in stats.items():
+            labels = {'cache': name}
+            hit_count = values.get('hits', values.get('fresh_hits', 0) + values.get('stale_hits', 0))
+            hits.append((labels, hit_count))
+            misses.append((labels, values.get('misses', 0)))
+            ratio.append((labels, values.get('hit_rate', 0.0)))
+            entries.append((labels, values.get('entries', 0)))
+        families = [
+            ('cache_hits_total', 'counter', 'Cache hits', hits),
+            ('cache_misses_total', 'counter', 'Cache misses', misses),
+            ('cache_hit_ratio', 'gauge', 'Hits over lookups since start', ratio),
+            ('cache_entries', 'gauge', 'Entries currently cached', entries),
+        ]
+        sized = [({'cache': name}, values['bytes']) for name, values in stats.items() if 'bytes' in values]
+        if sized:
+            families.append(('cache_bytes', 'gauge', 'Bytes held by size-bounded caches', sized))
+        return families
+    return collect
+
+
+def render() -> str:
+    return registry.render()
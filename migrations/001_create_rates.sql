@@ -1,6 +1,4 @@
-DROP TABLE IF EXISTS rates;
-
-CREATE TABLE rates (
+CREATE TABLE IF NOT EXISTS rates (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     currency_code TEXT NOT NULL,
     currency_name TEXT NOT NULL,
@@ -0,0 +1,9 @@
+-- Covering index for per-currency range scans (get_historical_rates, get_rates_with_filters
+-- with a currency filter): the whole query is answered from the index, without table lookups
+CREATE INDEX IF NOT EXISTS idx_rates_currency_date_cover
+    ON rates (currency_code, date, mid_rate, bid_rate, ask_rate, currency_name);
+
+-- Latest rates across all currencies (get_rates_with_filters without a currency, ORDER BY date DESC)
+CREATE INDEX IF NOT EXISTS idx_rates_date ON rates (date);
+
+ANALYZE;
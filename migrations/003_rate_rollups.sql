@@ -0,0 +1,15 @@
+-- Pre-aggregated rates per currency and calendar period (weekly buckets start on Monday,
+-- monthly/yearly on the first day). Maintained incrementally by RateRollupModel.refresh
+-- for the periods touched by each ingest.
+CREATE TABLE IF NOT EXISTS rate_rollups (
+    currency_code TEXT NOT NULL,
+    granularity TEXT NOT NULL,
+    period_start TEXT NOT NULL,
+    first_date TEXT NOT NULL,
+    last_date TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    mid_open REAL, mid_close REAL, mid_min REAL, mid_max REAL, mid_avg REAL, mid_count INTEGER NOT NULL,
+    bid_open REAL, bid_close REAL, bid_min REAL, bid_max REAL, bid_avg REAL, bid_count INTEGER NOT NULL,
+    ask_open REAL, ask_close REAL, ask_min REAL, ask_max REAL, ask_avg REAL, ask_count INTEGER NOT NULL,
+    PRIMARY KEY (currency_code, granularity, period_start)
+) WITHOUT ROWID;
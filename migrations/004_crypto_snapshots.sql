@@ -0,0 +1,6 @@
+-- Last good CoinGecko market data per request, served when the upstream is unavailable
+CREATE TABLE IF NOT EXISTS crypto_snapshots (
+    key TEXT PRIMARY KEY,
+    fetched_at REAL NOT NULL,
+    payload TEXT NOT NULL
+);
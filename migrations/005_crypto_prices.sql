@@ -0,0 +1,26 @@
+-- Cryptocurrency market history recorded by the periodic snapshot job
+CREATE TABLE IF NOT EXISTS crypto_coins (
+    coin_id TEXT PRIMARY KEY,
+    symbol TEXT NOT NULL,
+    name TEXT NOT NULL,
+    image TEXT,
+    market_cap_rank INTEGER,
+    updated_at INTEGER NOT NULL
+);
+
+-- change_24h/change_7d are the percentages reported by CoinGecko, used only until the
+-- local history covers the 24h/7d window
+CREATE TABLE IF NOT EXISTS crypto_prices (
+    coin_id TEXT NOT NULL,
+    timestamp INTEGER NOT NULL,
+    price REAL NOT NULL,
+    market_cap REAL,
+    total_volume REAL,
+    high_24h REAL,
+    low_24h REAL,
+    change_24h REAL,
+    change_7d REAL,
+    PRIMARY KEY (coin_id, timestamp)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_crypto_prices_timestamp ON crypto_prices (timestamp);
@@ -0,0 +1,15 @@
+-- Per-currency row counts and date bounds, kept up to date at ingest by RateStatsModel.refresh
+-- so freshness checks and data versions never aggregate over the rates table.
+-- synced_at is the last sync that checked the currency (whether or not it found new rows).
+CREATE TABLE IF NOT EXISTS rate_stats (
+    currency_code TEXT PRIMARY KEY,
+    row_count INTEGER NOT NULL,
+    first_date TEXT,
+    last_date TEXT,
+    updated_at REAL,
+    synced_at REAL
+) WITHOUT ROWID;
+
+INSERT OR REPLACE INTO rate_stats (currency_code, row_count, first_date, last_date, updated_at)
+SELECT currency_code, COUNT(*), MIN(date), MAX(date), CAST(strftime('%s', 'now') AS REAL)
+FROM rates GROUP BY currency_code;
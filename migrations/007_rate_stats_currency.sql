@@ -0,0 +1,12 @@
+-- Currency name (as of the latest stored date) and the tables quoting each currency
+-- ('A' mid only, 'C' bid/ask only, 'AC' both), so the tracked-currency registry and the
+-- freshness checks need no queries on the rates table either.
+ALTER TABLE rate_stats ADD COLUMN currency_name TEXT;
+ALTER TABLE rate_stats ADD COLUMN tables TEXT;
+
+UPDATE rate_stats SET
+    currency_name = (SELECT currency_name FROM rates
+                     WHERE rates.currency_code = rate_stats.currency_code ORDER BY date DESC LIMIT 1),
+    tables = (SELECT CASE WHEN COUNT(mid_rate) > 0 THEN 'A' ELSE '' END ||
+                     CASE WHEN COUNT(bid_rate) > 0 THEN 'C' ELSE '' END
+              FROM rates WHERE rates.currency_code = rate_stats.currency_code);
@@ -0,0 +1,9 @@
+-- Business days of the NBP calendar on which a refetch confirmed that no rate of a currency
+-- was published (discontinued currencies, one-off days off missing from the calendar).
+-- Gap analysis skips them, so a confirmed hole is not requested from NBP again on every sync.
+CREATE TABLE IF NOT EXISTS unpublished_days (
+    currency_code TEXT NOT NULL,
+    date TEXT NOT NULL,
+    checked_at REAL NOT NULL,
+    PRIMARY KEY (currency_code, date)
+) WITHOUT ROWID;
@@ -0,0 +1,12 @@
+-- Cross-process single-writer leases: a sync runs only in the process holding the unexpired
+-- lease (renewed while it runs), so several web workers or hosts sharing the database never
+-- fetch and write the same data at once. The outcome of the last run is kept with the lease,
+-- so every process reports the same sync status.
+CREATE TABLE IF NOT EXISTS sync_leases (
+    name TEXT PRIMARY KEY,
+    owner TEXT,
+    acquired_at REAL,
+    expires_at REAL NOT NULL DEFAULT 0,
+    finished_at REAL,
+    last_status TEXT
+) WITHOUT ROWID;
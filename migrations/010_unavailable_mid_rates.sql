@@ -0,0 +1,12 @@
+-- Stored rows (e.g. from Table C or archive imports) whose date Table A was fetched for
+-- without a mid rate of the currency. The mid backfill skips them, so a row Table A never
+-- fills is not requested from NBP again on every sync.
+CREATE TABLE IF NOT EXISTS unavailable_mid_rates (
+    currency_code TEXT NOT NULL,
+    date TEXT NOT NULL,
+    checked_at REAL NOT NULL,
+    PRIMARY KEY (currency_code, date)
+) WITHOUT ROWID;
+
+-- Rows still missing a mid rate, found without scanning the table
+CREATE INDEX IF NOT EXISTS idx_rates_missing_mid ON rates (currency_code, date) WHERE mid_rate IS NULL;
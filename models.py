@@ -3,41 +3,193 @@ Data Layer - Database models and operations
 Handles all database interactions and data persistence
 """
 
+import os
+import json
+import queue
 import sqlite3
+import threading
+import time
+from contextlib import contextmanager
 from flask import g
-from datetime import datetime, timedelta
-from typing import List, Dict, Optional, Tuple
+from datetime import datetime
+from typing import List, Dict, Optional, Tuple, Iterable, Iterator
+from metrics import InstrumentedConnection, METRICS_ENABLED
 
 # Database configuration
 DATABASE = 'currency_rates.db'
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+# Connections kept open per process
+POOL_SIZE = 8
+
+# Per-connection tuning: WAL lets readers run concurrently with the ingestion writer
+SQLITE_PRAGMAS = (
+    'PRAGMA journal_mode = WAL',
+    'PRAGMA synchronous = NORMAL',
+    'PRAGMA mmap_size = 268435456',
+    'PRAGMA cache_size = -16000',
+    'PRAGMA temp_store = MEMORY',
+)
+
+# Number of rows written per transaction by bulk upserts
+UPSERT_CHUNK_SIZE = 1000
+
+# Rollup granularities: SQLite expressions mapping a date to the start of its period
+# and to the last day of its period (weeks run Monday to Sunday)
+ROLLUP_GRANULARITIES = {
+    'weekly': ("date({}, '-6 days', 'weekday 1')", "date({}, 'weekday 0')"),
+    'monthly': ("date({}, 'start of month')", "date({}, 'start of month', '+1 month', '-1 day')"),
+    'yearly': ("date({}, 'start of year')", "date({}, 'start of year', '+1 year', '-1 day')"),
+}
+ROLLUP_FIELDS = ('mid', 'bid', 'ask')
+
+class ConnectionPool:
+    """Per-process pool of tuned SQLite connections"""
+    
+    def __init__(self, database: str, size: int = POOL_SIZE):
+        self.database = database
+        self._idle = queue.LifoQueue(maxsize=size)
+    
+    def _connect(self) -> sqlite3.Connection:
+        # Instrumented connections time every statement for /metrics and Server-Timing
+        factory = InstrumentedConnection if METRICS_ENABLED else sqlite3.Connection
+        db = sqlite3.connect(self.database, timeout=5.0, check_same_thread=False, factory=factory)
+        db.row_factory = sqlite3.Row
+        for pragma in SQLITE_PRAGMAS:
+            db.execute(pragma)
+        return db
+    
+    def acquire(self) -> sqlite3.Connection:
+        """Take an idle connection or open a new one"""
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self._connect()
+    
+    def release(self, db: sqlite3.Connection) -> None:
+        """Return a connection to the pool (closed if the pool is full)"""
+        if db.in_transaction:
+            db.rollback()
+        try:
+            self._idle.put_nowait(db)
+        except queue.Full:
+            db.close()
+    
+    def close_all(self) -> None:
+        """Close all idle connections"""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
 
 class DatabaseManager:
     """Handles database connections and operations"""
     
+    _pool = None
+    _pool_lock = threading.Lock()
+    
+    @staticmethod
+    def get_pool() -> ConnectionPool:
+        """Get the connection pool for the configured database"""
+        pool = DatabaseManager._pool
+        if pool is None or pool.database != DATABASE:
+            with DatabaseManager._pool_lock:
+                pool = DatabaseManager._pool
+                if pool is None or pool.database != DATABASE:
+                    if pool is not None:
+                        pool.close_all()
+                    pool = DatabaseManager._pool = ConnectionPool(DATABASE)
+        return pool
+    
     @staticmethod
     def get_db():
         """Get database connection with row factory"""
         db = getattr(g, '_database', None)
         if db is None:
-            db = g._database = sqlite3.connect(DATABASE)
-            db.row_factory = sqlite3.Row
+            db = g._database = DatabaseManager.get_pool().acquire()
         return db
     
     @staticmethod
     def close_connection(exception):
-        """Close database connection"""
-        db = getattr(g, '_database', None)
+        """Return database connection to the pool"""
+        db = g.pop('_database', None)
         if db is not None:
-            db.close()
+            DatabaseManager.get_pool().release(db)
+    
+    @staticmethod
+    @contextmanager
+    def connection():
+        """Borrow a pooled connection outside of a Flask application context"""
+        pool = DatabaseManager.get_pool()
+        db = pool.acquire()
+        try:
+            yield db
+        finally:
+            pool.release(db)
+    
+    @staticmethod
+    def get_migrations() -> List[Tuple[int, str]]:
+        """List (version, path) of migration files, ordered by version"""
+        migrations = []
+        for filename in os.listdir(MIGRATIONS_DIR):
+            if filename.endswith('.sql') and filename[:3].isdigit():
+                migrations.append((int(filename[:3]), os.path.join(MIGRATIONS_DIR, filename)))
+        return sorted(migrations)
+    
+    @staticmethod
+    def split_statements(sql: str) -> List[str]:
+        """Split a migration script into complete SQL statements"""
+        statements = []
+        buffer = ''
+        for line in sql.splitlines(keepends=True):
+            buffer += line
+            if sqlite3.complete_statement(buffer):
+                statements.append(buffer.strip())
+                buffer = ''
+        return statements
+    
+    @staticmethod
+    def migrate(db: sqlite3.Connection) -> List[int]:
+        """Apply pending migrations; the schema version is tracked in PRAGMA user_version
+        
+        Each migration runs in an IMMEDIATE transaction that re-reads the version first,
+        so processes starting together apply every migration exactly once.
+        """
+        applied = []
+        if db.in_transaction:
+            db.commit()
+        
+        for version, path in DatabaseManager.get_migrations():
+            if version <= db.execute('PRAGMA user_version').fetchone()[0]:
+                continue
+            with open(path, encoding='utf-8') as f:
+                sql = f.read()
+            # Each migration and its version bump commit atomically
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                if version <= db.execute('PRAGMA user_version').fetchone()[0]:
+                    db.rollback()
+                    continue
+                for statement in DatabaseManager.split_statements(sql):
+                    db.execute(statement)
+                db.execute(f'PRAGMA user_version = {version}')
+                db.commit()
+            except Exception:
+                db.rollback()
+                raise
+            applied.append(version)
+            print(f"Applied migration {os.path.basename(path)}")
+        
+        return applied
     
     @staticmethod
     def init_db(app):
-        """Initialize database schema"""
+        """Initialize database schema (non-destructive, applies pending migrations)"""
         with app.app_context():
-            db = DatabaseManager.get_db()
-            with app.open_resource('schema.sql', mode='r') as f:
-                db.cursor().executescript(f.read())
-            db.commit()
+            DatabaseManager.migrate(DatabaseManager.get_db())
+            RateStatsModel.ensure_populated()
+            RateRollupModel.ensure_populated()
 
 class CurrencyRatesModel:
     """Model for currency rates data operations"""
@@ -57,66 +209,111 @@ class CurrencyRatesModel:
         return result[0] if result else 0
     
     @staticmethod
-    def get_recent_rates_count(currency_code: str, days: int = 7) -> int:
-        """Get count of recent rates for a currency"""
+    def get_missing_mid_days(currency_codes: List[str]) -> List[Tuple[str, str]]:
+        """(currency, date) pairs of rows still missing a mid rate, except those Table A was
+        found not to quote (UnavailableMidRatesModel)"""
         db = DatabaseManager.get_db()
-        cursor = db.cursor()
-        
-        recent_period = (datetime.now().date() - timedelta(days=days)).strftime('%Y-%m-%d')
-        cursor.execute("""
-            SELECT COUNT(*) FROM rates 
-            WHERE currency_code = ? AND date >= ?
-        """, (currency_code, recent_period))
-        
-        result = cursor.fetchone()
-        return result[0] if result else 0
+        placeholders = ','.join('?' * len(currency_codes))
+        rows = db.execute(f"""
+            SELECT currency_code, date FROM rates
+            WHERE mid_rate IS NULL AND currency_code IN ({placeholders})
+              AND NOT EXISTS (SELECT 1 FROM unavailable_mid_rates u
+                              WHERE u.currency_code = rates.currency_code AND u.date = rates.date)
+            ORDER BY currency_code, date
+        """, tuple(currency_codes))
+        return [(row[0], row[1]) for row in rows]
     
     @staticmethod
-    def get_latest_date(currency_code: str) -> Optional[datetime]:
-        """Get the latest date for a currency"""
+    def get_latest_rates(currency_codes: List[str] = None) -> List:
+        """Latest stored rates of the given (default: all) currencies, one indexed lookup each"""
         db = DatabaseManager.get_db()
-        cursor = db.cursor()
-        
-        cursor.execute("""
-            SELECT MAX(date) FROM rates WHERE currency_code = ?
-        """, (currency_code,))
-        
-        latest_date_row = cursor.fetchone()
-        if latest_date_row and latest_date_row[0]:
-            return datetime.strptime(latest_date_row[0], '%Y-%m-%d').date()
-        return None
+        query = """
+            SELECT r.id, r.currency_code, r.currency_name, r.mid_rate, r.bid_rate, r.ask_rate, r.date
+            FROM rate_stats s
+            JOIN rates r ON r.currency_code = s.currency_code AND r.date = s.last_date
+        """
+        params = ()
+        if currency_codes is not None:
+            query += f" WHERE s.currency_code IN ({','.join('?' * len(currency_codes))})"
+            params = tuple(currency_codes)
+        return db.execute(query + " ORDER BY r.currency_code", params).fetchall()
     
     @staticmethod
-    def rate_exists(currency_code: str, date: str) -> bool:
-        """Check if rate exists for given currency and date"""
+    def upsert_rates(rates: Iterable[Dict], chunk_size: int = UPSERT_CHUNK_SIZE) -> Dict[str, int]:
+        """Insert or update many rates in chunked transactions
+
+        Each rate is a dict with code, name, date and any of mid/bid/ask. Values that are
+        None never overwrite stored ones, so partial records (e.g. Table A mid only) merge
+        into existing rows. Returns inserted/updated counts, the currencies written and the
+        date range written per currency (used to refresh rollups incrementally).
+        """
         db = DatabaseManager.get_db()
-        cursor = db.cursor()
+        inserted = updated = 0
+        # (first, last) date per currency over the chunks that actually wrote rows
+        ranges = {}
         
-        cursor.execute("""
-            SELECT 1 FROM rates WHERE currency_code = ? AND date = ? LIMIT 1
-        """, (currency_code, date))
+        def write(chunk):
+            chunk_inserted, chunk_updated = CurrencyRatesModel._upsert_chunk(db, chunk)
+            if chunk_inserted or chunk_updated:
+                for code, _, _, _, _, day in chunk:
+                    first, last = ranges.get(code, (day, day))
+                    ranges[code] = (min(first, day), max(last, day))
+            return chunk_inserted, chunk_updated
+        
+        chunk = []
+        for rate in rates:
+            chunk.append((rate['code'], rate['name'], rate.get('mid'), rate.get('bid'), rate.get('ask'), rate['date']))
+            if len(chunk) >= chunk_size:
+                chunk_inserted, chunk_updated = write(chunk)
+                inserted += chunk_inserted
+                updated += chunk_updated
+                chunk = []
+        if chunk:
+            chunk_inserted, chunk_updated = write(chunk)
+            inserted += chunk_inserted
+            updated += chunk_updated
         
-        return cursor.fetchone() is not None
+        return {'inserted': inserted, 'updated': updated, 'currencies': sorted(ranges), 'ranges': ranges}
     
     @staticmethod
-    def insert_rate(currency_code: str, currency_name: str, bid_rate: float, ask_rate: float, date: str) -> None:
-        """Insert a new currency rate"""
-        db = DatabaseManager.get_db()
+    def _upsert_chunk(db: sqlite3.Connection, chunk: List[Tuple]) -> Tuple[int, int]:
+        """Write one chunk in its own transaction; returns (inserted, updated)"""
         cursor = db.cursor()
+        if not db.in_transaction:
+            # Take the write lock before reading MAX(id): the counts stay exact, and a concurrent
+            # writer makes this wait (busy timeout) instead of failing the read-to-write upgrade
+            cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM rates")
+        max_id = cursor.fetchone()[0]
         
-        cursor.execute('''
+        # Unchanged rows are skipped by the WHERE clause, so rowcount only counts real writes
+        cursor.executemany('''
             INSERT INTO rates (currency_code, currency_name, mid_rate, bid_rate, ask_rate, date)
-            VALUES (?, ?, NULL, ?, ?, ?)
-        ''', (currency_code, currency_name, bid_rate, ask_rate, date))
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(currency_code, date) DO UPDATE SET
+                currency_name = COALESCE(excluded.currency_name, currency_name),
+                mid_rate = COALESCE(excluded.mid_rate, mid_rate),
+                bid_rate = COALESCE(excluded.bid_rate, bid_rate),
+                ask_rate = COALESCE(excluded.ask_rate, ask_rate)
+            WHERE excluded.mid_rate IS NOT NULL AND excluded.mid_rate IS NOT mid_rate
+               OR excluded.bid_rate IS NOT NULL AND excluded.bid_rate IS NOT bid_rate
+               OR excluded.ask_rate IS NOT NULL AND excluded.ask_rate IS NOT ask_rate
+        ''', chunk)
+        written = cursor.rowcount
+        
+        cursor.execute("SELECT COUNT(*) FROM rates WHERE id > ?", (max_id,))
+        inserted = cursor.fetchone()[0]
+        db.commit()
+        return inserted, written - inserted
     
     @staticmethod
-    def get_rates_with_filters(currency_code: str = None, limit: int = 30, 
-                              start_date: str = None, end_date: str = None) -> List[sqlite3.Row]:
-        """Get rates with optional filters"""
-        db = DatabaseManager.get_db()
-        cursor = db.cursor()
-        
-        query = "SELECT * FROM rates WHERE 1=1"
+    def _build_rates_query(currency_code: str = None, limit: int = 30, start_date: str = None,
+                           end_date: str = None, after: Tuple[str, int] = None) -> Tuple[str, List]:
+        """Build the filtered rates query, newest first, with keyset pagination on (date, id)"""
+        query = """
+            SELECT id, currency_code, currency_name, mid_rate, bid_rate, ask_rate, date
+            FROM rates WHERE 1=1
+        """
         params = []
         
         if currency_code:
@@ -131,15 +328,122 @@ class CurrencyRatesModel:
             query += " AND date <= ?"
             params.append(end_date)
         
-        query += " ORDER BY date DESC"
+        if after:
+            # Continue strictly after the last row of the previous page
+            query += " AND date <= ? AND (date < ? OR id < ?)"
+            params.extend((after[0], after[0], after[1]))
+        
+        query += " ORDER BY date DESC, id DESC"
         
         if limit:
             query += " LIMIT ?"
             params.append(limit)
         
+        return query, params
+    
+    @staticmethod
+    def get_rates_with_filters(currency_code: str = None, limit: int = 30, start_date: str = None,
+                               end_date: str = None, after: Tuple[str, int] = None) -> List[sqlite3.Row]:
+        """Get rates with optional filters"""
+        db = DatabaseManager.get_db()
+        cursor = db.cursor()
+        
+        query, params = CurrencyRatesModel._build_rates_query(currency_code, limit, start_date, end_date, after)
         cursor.execute(query, params)
         return cursor.fetchall()
     
+    @staticmethod
+    def iter_rates(currency_code: str = None, limit: int = 30, start_date: str = None,
+                   end_date: str = None, after: Tuple[str, int] = None,
+                   batch_size: int = 500) -> Iterator[sqlite3.Row]:
+        """Lazily walk filtered rates in batches on a dedicated pooled connection (for streaming)"""
+        query, params = CurrencyRatesModel._build_rates_query(currency_code, limit, start_date, end_date, after)
+        with DatabaseManager.connection() as db:
+            cursor = db.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield from rows
+    
+    @staticmethod
+    def iter_all_rates(currency_codes: List[str] = None, start_date: str = None, end_date: str = None,
+                       batch_size: int = 1000) -> Iterator[sqlite3.Row]:
+        """Lazily walk every stored rate, oldest date first (for bulk exports)"""
+        query = "SELECT id, currency_code, currency_name, mid_rate, bid_rate, ask_rate, date FROM rates WHERE 1=1"
+        params = []
+        if currency_codes:
+            query += f" AND currency_code IN ({','.join('?' * len(currency_codes))})"
+            params.extend(currency_codes)
+        if start_date:
+            query += " AND date >= ?"
+            params.append(start_date)
+        if end_date:
+            query += " AND date <= ?"
+            params.append(end_date)
+        with DatabaseManager.connection() as db:
+            cursor = db.execute(query + " ORDER BY date, currency_code", params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield from rows
+    
+    @staticmethod
+    def get_missing_days(expected_days: List[str], ranges: Dict[str, Tuple[str, str]]) -> List[Tuple[str, str]]:
+        """(currency, date) pairs of expected days without a stored row, within each currency's range
+
+        One set-based query: the expected calendar and the per-currency ranges are passed as
+        JSON arrays and anti-joined against the (currency_code, date) index. Days confirmed
+        as unpublished (UnpublishedDaysModel) are not reported.
+        """
+        if not expected_days or not ranges:
+            return []
+        db = DatabaseManager.get_db()
+        rows = db.execute("""
+            WITH expected(day) AS (SELECT value FROM json_each(?)),
+                 wanted(code, first_day, last_day) AS (
+                     SELECT json_extract(value, '$[0]'), json_extract(value, '$[1]'), json_extract(value, '$[2]')
+                     FROM json_each(?))
+            SELECT wanted.code, expected.day FROM wanted
+            JOIN expected ON expected.day BETWEEN wanted.first_day AND wanted.last_day
+            WHERE NOT EXISTS (SELECT 1 FROM rates WHERE currency_code = wanted.code AND date = expected.day)
+              AND NOT EXISTS (SELECT 1 FROM unpublished_days u
+                              WHERE u.currency_code = wanted.code AND u.date = expected.day)
+            ORDER BY wanted.code, expected.day
+        """, (json.dumps(expected_days), json.dumps([[code, *bounds] for code, bounds in ranges.items()])))
+        return [(row[0], row[1]) for row in rows]
+    
+    @staticmethod
+    def get_integrity_counts(expected_days: List[str], currency_codes: List[str], start_date: str,
+                             end_date: str) -> Dict[str, Dict]:
+        """Per-currency row counts, rows dated off the expected calendar and rows missing values"""
+        if not currency_codes:
+            return {}
+        db = DatabaseManager.get_db()
+        rows = db.execute(f"""
+            SELECT currency_code, COUNT(*) AS rows,
+                   SUM(date NOT IN (SELECT value FROM json_each(?))) AS off_calendar,
+                   SUM(mid_rate IS NULL) AS missing_mid,
+                   SUM(bid_rate IS NULL OR ask_rate IS NULL) AS missing_bid_ask
+            FROM rates
+            WHERE currency_code IN ({','.join('?' * len(currency_codes))}) AND date BETWEEN ? AND ?
+            GROUP BY currency_code
+        """, (json.dumps(expected_days), *currency_codes, start_date, end_date))
+        return {row['currency_code']: dict(row) for row in rows}
+    
+    @staticmethod
+    def encode_cursor(row) -> str:
+        """Keyset pagination cursor pointing at a row"""
+        return f"{row['date']}:{row['id']}"
+    
+    @staticmethod
+    def decode_cursor(cursor: str) -> Tuple[str, int]:
+        """Parse a pagination cursor; raises ValueError when malformed"""
+        day, _, row_id = cursor.partition(':')
+        datetime.strptime(day, '%Y-%m-%d')
+        return day, int(row_id)
+    
     @staticmethod
     def get_historical_rates(currency_code: str, start_date: str = None) -> List[sqlite3.Row]:
         """Get historical rates for a currency"""
@@ -161,6 +465,14 @@ class CurrencyRatesModel:
         cursor.execute(sql_query, tuple(query_params))
         return cursor.fetchall()
     
+    @staticmethod
+    def get_all_rates() -> List[sqlite3.Row]:
+        """Get the rates of every currency (for the in-memory conversion matrix)"""
+        db = DatabaseManager.get_db()
+        cursor = db.cursor()
+        cursor.execute("SELECT currency_code, date, mid_rate, bid_rate, ask_rate FROM rates")
+        return cursor.fetchall()
+    
     @staticmethod
     def get_first_rate_of_period(currency_code: str, start_date: str) -> Optional[float]:
         """Get the first rate of a specific period"""
@@ -184,3 +496,393 @@ class CurrencyRatesModel:
         """Commit database changes"""
         db = DatabaseManager.get_db()
         db.commit()
+
+
+class RateStatsModel:
+    """Model for the per-currency row counts, date bounds and sync times (rate_stats)"""
+    
+    @staticmethod
+    def refresh(currency_codes: Iterable[str]) -> int:
+        """Recount the given currencies (from the covering index) after an ingest"""
+        codes = sorted(set(currency_codes))
+        if not codes:
+            return 0
+        db = DatabaseManager.get_db()
+        placeholders = ','.join('?' * len(codes))
+        cursor = db.execute(f"""
+            INSERT INTO rate_stats (currency_code, row_count, first_date, last_date, currency_name, tables, updated_at)
+            SELECT currency_code, COUNT(*), MIN(date), MAX(date),
+                   (SELECT latest.currency_name FROM rates latest
+                    WHERE latest.currency_code = rates.currency_code ORDER BY latest.date DESC LIMIT 1),
+                   CASE WHEN COUNT(mid_rate) > 0 THEN 'A' ELSE '' END ||
+                   CASE WHEN COUNT(bid_rate) > 0 THEN 'C' ELSE '' END,
+                   ?
+            FROM rates
+            WHERE currency_code IN ({placeholders})
+            GROUP BY currency_code
+            ON CONFLICT(currency_code) DO UPDATE SET
+                row_count = excluded.row_count, first_date = excluded.first_date,
+                last_date = excluded.last_date, currency_name = excluded.currency_name,
+                tables = excluded.tables, updated_at = excluded.updated_at
+        """, (time.time(), *codes))
+        db.commit()
+        return cursor.rowcount
+    
+    @staticmethod
+    def rebuild() -> int:
+        """Recount every currency stored in the rates table"""
+        db = DatabaseManager.get_db()
+        codes = [row[0] for row in db.execute("SELECT DISTINCT currency_code FROM rates")]
+        return RateStatsModel.refresh(codes)
+    
+    @staticmethod
+    def ensure_populated() -> None:
+        """Build the stats of rates written without going through the ingest path"""
+        db = DatabaseManager.get_db()
+        if db.execute("SELECT 1 FROM rate_stats LIMIT 1").fetchone() is None:
+            if db.execute("SELECT 1 FROM rates LIMIT 1").fetchone() is not None:
+                print(f"Built stats of {RateStatsModel.rebuild()} currencies")
+    
+    @staticmethod
+    def record_sync(currency_codes: Iterable[str], synced_at: float) -> None:
+        """Record that a sync checked the given currencies (rows are created if missing)"""
+        db = DatabaseManager.get_db()
+        db.executemany("""
+            INSERT INTO rate_stats (currency_code, row_count, synced_at) VALUES (?, 0, ?)
+            ON CONFLICT(currency_code) DO UPDATE SET synced_at = excluded.synced_at
+        """, [(code, synced_at) for code in currency_codes])
+        db.commit()
+    
+    @staticmethod
+    def get_all() -> Dict[str, Dict]:
+        """Stats of every currency, keyed by currency code"""
+        db = DatabaseManager.get_db()
+        rows = db.execute("SELECT * FROM rate_stats").fetchall()
+        return {row['currency_code']: dict(row) for row in rows}
+
+
+class SyncLeaseModel:
+    """Model for the cross-process single-writer leases (sync_leases)
+    
+    Used outside of request handling (scheduler and heartbeat threads, CLI tools), so every
+    call borrows its own pooled connection. Each change is a single conditional statement,
+    which SQLite serializes across processes.
+    """
+    
+    @staticmethod
+    def acquire(name: str, owner: str, ttl: float, finished_before: float = None) -> bool:
+        """Take the lease unless another owner holds it unexpired
+        
+        With finished_before set, the lease is not taken when a run finished at or after
+        that time either (the work it was wanted for is already done).
+        """
+        now = time.time()
+        with DatabaseManager.connection() as db:
+            cursor = db.execute("""
+                INSERT INTO sync_leases (name, owner, acquired_at, expires_at) VALUES (:name, :owner, :now, :expires)
+                ON CONFLICT(name) DO UPDATE SET
+                    owner = excluded.owner, acquired_at = excluded.acquired_at, expires_at = excluded.expires_at
+                WHERE (sync_leases.expires_at < :now OR sync_leases.owner = excluded.owner)
+                  AND (:since IS NULL OR sync_leases.finished_at IS NULL OR sync_leases.finished_at < :since)
+            """, {'name': name, 'owner': owner, 'now': now, 'expires': now + ttl, 'since': finished_before})
+            db.commit()
+            return cursor.rowcount == 1
+    
+    @staticmethod
+    def renew(name: str, owner: str, ttl: float) -> bool:
+        """Extend a held lease; False if it expired and was taken over meanwhile"""
+        with DatabaseManager.connection() as db:
+            cursor = db.execute("UPDATE sync_leases SET expires_at = ? WHERE name = ? AND owner = ?",
+                                (time.time() + ttl, name, owner))
+            db.commit()
+            return cursor.rowcount == 1
+    
+    @staticmethod
+    def release(name: str, owner: str, status: Dict = None) -> bool:
+        """Give up a held lease, recording the outcome of the run
+        
+        Without a status (e.g. after an archive import) the previous run stays the last one.
+        """
+        finished_at, status = (time.time(), json.dumps(status)) if status is not None else (None, None)
+        with DatabaseManager.connection() as db:
+            cursor = db.execute("""
+                UPDATE sync_leases SET expires_at = 0, finished_at = COALESCE(?, finished_at),
+                                       last_status = COALESCE(?, last_status)
+                WHERE name = ? AND owner = ?
+            """, (finished_at, status, name, owner))
+            db.commit()
+            return cursor.rowcount == 1
+    
+    @staticmethod
+    def get(name: str) -> Optional[Dict]:
+        """Current holder (if unexpired) and last recorded run of a lease"""
+        with DatabaseManager.connection() as db:
+            row = db.execute("SELECT * FROM sync_leases WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            return None
+        lease = dict(row)
+        lease['held'] = lease['expires_at'] > time.time()
+        lease['last_status'] = json.loads(lease['last_status']) if lease['last_status'] else None
+        return lease
+
+
+class CheckedDaysModel:
+    """(currency, date) pairs a complete refetch left without a rate, so they are not requested again
+
+    Subclasses name their table; both tables share the (currency_code, date, checked_at) layout.
+    """
+    
+    TABLE = None
+    
+    @classmethod
+    def record(cls, days: Iterable[Tuple[str, str]], checked_at: float) -> int:
+        """Record (currency, date) pairs confirmed by a refetch"""
+        days = list(days)
+        if not days:
+            return 0
+        db = DatabaseManager.get_db()
+        db.executemany(f"""
+            INSERT INTO {cls.TABLE} (currency_code, date, checked_at) VALUES (?, ?, ?)
+            ON CONFLICT(currency_code, date) DO UPDATE SET checked_at = excluded.checked_at
+        """, [(code, day, checked_at) for code, day in days])
+        db.commit()
+        return len(days)
+    
+    @classmethod
+    def count(cls) -> int:
+        db = DatabaseManager.get_db()
+        return db.execute(f"SELECT COUNT(*) FROM {cls.TABLE}").fetchone()[0]
+
+
+class UnpublishedDaysModel(CheckedDaysModel):
+    """Business days on which NBP published no rate of a currency (unpublished_days)"""
+    
+    TABLE = 'unpublished_days'
+
+
+class UnavailableMidRatesModel(CheckedDaysModel):
+    """Stored rows that Table A has no mid rate for (unavailable_mid_rates)"""
+    
+    TABLE = 'unavailable_mid_rates'
+
+
+class RateRollupModel:
+    """Model for the pre-aggregated weekly/monthly/yearly rollups of the rates table"""
+    
+    @staticmethod
+    def _columns() -> List[str]:
+        columns = ['currency_code', 'granularity', 'period_start', 'first_date', 'last_date', 'count']
+        for field in ROLLUP_FIELDS:
+            columns.extend(f"{field}_{stat}" for stat in ('open', 'close', 'min', 'max', 'avg', 'count'))
+        return columns
+    
+    @staticmethod
+    def _aggregate_sql(granularity: str, period_expr: str, start_expr: str = ':start',
+                       end_expr: str = ':end') -> str:
+        """SELECT aggregating the rates of :code per period_expr, in rate_rollups column order
+
+        Open/close are the first/last non-null value of each field within the period, looked
+        up on the covering index from the period bounds (window functions would sort the
+        whole range once per field and direction). The trailing WHERE keeps a following
+        upsert clause from parsing as a join constraint.
+        """
+        aggregates = []
+        columns = []
+        for field in ROLLUP_FIELDS:
+            column = f"{field}_rate"
+            aggregates.append(f"MIN({column}) AS {field}_min, MAX({column}) AS {field}_max, "
+                              f"AVG({column}) AS {field}_avg, COUNT({column}) AS {field}_count")
+            edge = (f"(SELECT {column} FROM rates WHERE currency_code = :code AND date BETWEEN p.first_date "
+                    f"AND p.last_date AND {column} IS NOT NULL ORDER BY date {{}} LIMIT 1)")
+            columns.append(f"{edge.format('ASC')}, {edge.format('DESC')}, "
+                           f"{field}_min, {field}_max, {field}_avg, {field}_count")
+        return f"""
+            SELECT :code, '{granularity}', period_start, first_date, last_date, count, {', '.join(columns)}
+            FROM (
+                SELECT {period_expr} AS period_start, MIN(date) AS first_date, MAX(date) AS last_date,
+                       COUNT(*) AS count, {', '.join(aggregates)}
+                FROM rates
+                WHERE currency_code = :code AND date >= {start_expr} AND date <= {end_expr}
+                GROUP BY period_start
+            ) AS p
+            WHERE true
+        """
+    
+    @staticmethod
+    def refresh(ranges: Dict[str, Tuple[str, str]]) -> int:
+        """Recompute the rollups of every period overlapping the given per-currency date ranges
+
+        Only the touched periods are rebuilt (from the covering index), so a daily ingest costs
+        one week, month and year per currency. Returns the number of rollup rows written.
+        """
+        if not ranges:
+            return 0
+        db = DatabaseManager.get_db()
+        columns = RateRollupModel._columns()
+        updates = ', '.join(f"{column} = excluded.{column}" for column in columns[3:])
+        
+        written = 0
+        for granularity, (start_expr, end_expr) in ROLLUP_GRANULARITIES.items():
+            # The range is widened to whole periods so partially touched periods are fully recomputed
+            select = RateRollupModel._aggregate_sql(granularity, start_expr.format('date'),
+                                                    start_expr.format(':start'), end_expr.format(':end'))
+            sql = f"""
+                INSERT INTO rate_rollups ({', '.join(columns)}) {select}
+                ON CONFLICT(currency_code, granularity, period_start) DO UPDATE SET {updates}
+            """
+            for code, (start, end) in ranges.items():
+                written += db.execute(sql, {'code': code, 'start': start, 'end': end}).rowcount
+        db.commit()
+        return written
+    
+    @staticmethod
+    def rebuild() -> int:
+        """Recompute all rollups from the rates table"""
+        db = DatabaseManager.get_db()
+        rows = db.execute("SELECT currency_code, MIN(date), MAX(date) FROM rates GROUP BY currency_code").fetchall()
+        return RateRollupModel.refresh({row[0]: (row[1], row[2]) for row in rows})
+    
+    @staticmethod
+    def ensure_populated() -> None:
+        """Build the rollups of rates stored before the rollup table existed"""
+        db = DatabaseManager.get_db()
+        if db.execute("SELECT 1 FROM rate_rollups LIMIT 1").fetchone() is None:
+            if db.execute("SELECT 1 FROM rates LIMIT 1").fetchone() is not None:
+                print(f"Built {RateRollupModel.rebuild()} rate rollups")
+    
+    @staticmethod
+    def get_rollups(currency_code: str, granularity: str, start_date: str = None,
+                    end_date: str = None) -> List[sqlite3.Row]:
+        """Get the rollups of a currency whose periods overlap [start_date, end_date]"""
+        db = DatabaseManager.get_db()
+        
+        query = "SELECT * FROM rate_rollups WHERE currency_code = ? AND granularity = ?"
+        params = [currency_code, granularity]
+        if start_date:
+            query += " AND last_date >= ?"
+            params.append(start_date)
+        if end_date:
+            query += " AND period_start <= ?"
+            params.append(end_date)
+        query += " ORDER BY period_start ASC"
+        
+        return db.execute(query, params).fetchall()
+    
+    @staticmethod
+    def get_range_aggregate(currency_code: str, start_date: str, end_date: str) -> Optional[Dict]:
+        """Aggregate the daily rates of [start_date, end_date] into one rollup-shaped row"""
+        db = DatabaseManager.get_db()
+        select = RateRollupModel._aggregate_sql('daily', ':start')
+        row = db.execute(select, {'code': currency_code, 'start': start_date, 'end': end_date}).fetchone()
+        return dict(zip(RateRollupModel._columns(), row)) if row else None
+
+
+class CryptoSnapshotModel:
+    """Model for the last good cryptocurrency market data snapshots"""
+    
+    @staticmethod
+    def save(key: str, data: List[Dict], fetched_at: float) -> None:
+        """Store the latest good market data for a request key"""
+        with DatabaseManager.connection() as db:
+            db.execute("""
+                INSERT INTO crypto_snapshots (key, fetched_at, payload) VALUES (?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET fetched_at = excluded.fetched_at, payload = excluded.payload
+            """, (key, fetched_at, json.dumps(data)))
+            db.commit()
+    
+    @staticmethod
+    def load(key: str) -> Optional[Tuple[List[Dict], float]]:
+        """Get the last good (data, fetched_at) of a request key"""
+        with DatabaseManager.connection() as db:
+            row = db.execute("SELECT payload, fetched_at FROM crypto_snapshots WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        return json.loads(row['payload']), row['fetched_at']
+
+
+class CryptoPricesModel:
+    """Model for the recorded cryptocurrency market history"""
+    
+    @staticmethod
+    def insert_snapshot(coins: List[Dict], timestamp: int, chunk_size: int = UPSERT_CHUNK_SIZE) -> int:
+        """Store one market snapshot (CoinGecko /coins/markets items) in batched transactions"""
+        db = DatabaseManager.get_db()
+        inserted = 0
+        for start in range(0, len(coins), chunk_size):
+            chunk = coins[start:start + chunk_size]
+            db.executemany("""
+                INSERT INTO crypto_coins (coin_id, symbol, name, image, market_cap_rank, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(coin_id) DO UPDATE SET
+                    symbol = excluded.symbol, name = excluded.name, image = excluded.image,
+                    market_cap_rank = excluded.market_cap_rank, updated_at = excluded.updated_at
+            """, [(c['id'], c['symbol'], c['name'], c.get('image'), c.get('market_cap_rank'), timestamp)
+                  for c in chunk])
+            cursor = db.executemany("""
+                INSERT OR IGNORE INTO crypto_prices
+                    (coin_id, timestamp, price, market_cap, total_volume, high_24h, low_24h, change_24h, change_7d)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, [(c['id'], timestamp, c['current_price'], c.get('market_cap'), c.get('total_volume'),
+                   c.get('high_24h'), c.get('low_24h'), c.get('price_change_percentage_24h'),
+                   c.get('price_change_percentage_7d_in_currency'))
+                  for c in chunk if c.get('current_price') is not None])
+            inserted += cursor.rowcount
+            db.commit()
+        return inserted
+    
+    @staticmethod
+    def get_latest_snapshot(limit: int = 10) -> List[sqlite3.Row]:
+        """Get the most recent snapshot, ordered by market cap rank"""
+        db = DatabaseManager.get_db()
+        cursor = db.cursor()
+        cursor.execute("""
+            SELECT p.*, c.symbol, c.name, c.image, c.market_cap_rank
+            FROM crypto_prices p JOIN crypto_coins c ON c.coin_id = p.coin_id
+            WHERE p.timestamp = (SELECT MAX(timestamp) FROM crypto_prices)
+            ORDER BY c.market_cap_rank IS NULL, c.market_cap_rank
+            LIMIT ?
+        """, (limit,))
+        return cursor.fetchall()
+    
+    @staticmethod
+    def get_prices_at(coin_ids: List[str], timestamp: int) -> Dict[str, Tuple[float, int]]:
+        """Get the last recorded (price, timestamp) at or before a point in time per coin"""
+        if not coin_ids:
+            return {}
+        db = DatabaseManager.get_db()
+        cursor = db.cursor()
+        placeholders = ','.join('?' * len(coin_ids))
+        cursor.execute(f"""
+            SELECT p.coin_id, p.price, p.timestamp FROM crypto_prices p
+            WHERE p.coin_id IN ({placeholders}) AND p.timestamp = (
+                SELECT MAX(timestamp) FROM crypto_prices WHERE coin_id = p.coin_id AND timestamp <= ?
+            )
+        """, (*coin_ids, timestamp))
+        return {row['coin_id']: (row['price'], row['timestamp']) for row in cursor.fetchall()}
+    
+    @staticmethod
+    def get_history(coin_id: str, start_timestamp: int = None, end_timestamp: int = None) -> List[sqlite3.Row]:
+        """Get the recorded history of a coin, oldest first"""
+        db = DatabaseManager.get_db()
+        cursor = db.cursor()
+        
+        query = """
+            SELECT timestamp, price, market_cap, total_volume FROM crypto_prices
+            WHERE coin_id = ?
+        """
+        params = [coin_id]
+        if start_timestamp is not None:
+            query += " AND timestamp >= ?"
+            params.append(start_timestamp)
+        if end_timestamp is not None:
+            query += " AND timestamp <= ?"
+            params.append(end_timestamp)
+        query += " ORDER BY timestamp ASC"
+        
+        cursor.execute(query, params)
+        return cursor.fetchall()
+    
+    @staticmethod
+    def get_coin(coin_id: str) -> Optional[sqlite3.Row]:
+        db = DatabaseManager.get_db()
+        return db.execute("SELECT * FROM crypto_coins WHERE coin_id = ?", (coin_id,)).fetchone()
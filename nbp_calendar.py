@@ -0,0 +1,98 @@
+"""
+Ingestion Layer - NBP publication calendar
+NBP publishes exchange rate tables on Polish business days only: weekdays that are not
+statutory public holidays. Table C is published around 8:15 and Table A around 12:15
+(Warsaw time).
+"""
+
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from typing import FrozenSet, List, Optional
+
+try:
+    from zoneinfo import ZoneInfo
+    NBP_TIMEZONE = ZoneInfo('Europe/Warsaw')
+except Exception:  # zoneinfo or tzdata not available - fall back to local time
+    NBP_TIMEZONE = None
+
+# (hour, minute) by which each table is published on a business day
+TABLE_PUBLICATION_TIMES = {'A': (12, 15), 'C': (8, 15)}
+
+
+def now() -> datetime:
+    """Current time in the NBP timezone (naive local time if unavailable)"""
+    if NBP_TIMEZONE is not None:
+        return datetime.now(NBP_TIMEZONE)
+    return datetime.now()
+
+
+def easter_sunday(year: int) -> date:
+    """Gregorian Easter Sunday (anonymous Gregorian algorithm)"""
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return date(year, month, day + 1)
+
+
+@lru_cache(maxsize=256)
+def public_holidays(year: int) -> FrozenSet[date]:
+    """Polish statutory public holidays of a year (Sunday holidays included)"""
+    easter = easter_sunday(year)
+    holidays = {
+        date(year, 1, 1),                  # Nowy Rok
+        date(year, 5, 1),                  # Święto Pracy
+        date(year, 5, 3),                  # Święto Konstytucji 3 Maja
+        date(year, 8, 15),                 # Wniebowzięcie NMP
+        date(year, 11, 1),                 # Wszystkich Świętych
+        date(year, 11, 11),                # Święto Niepodległości
+        date(year, 12, 25),                # Boże Narodzenie
+        date(year, 12, 26),                # drugi dzień Bożego Narodzenia
+        easter,                            # Wielkanoc
+        easter + timedelta(days=1),        # Poniedziałek Wielkanocny
+        easter + timedelta(days=49),       # Zielone Świątki
+        easter + timedelta(days=60),       # Boże Ciało
+    }
+    if year >= 2011:
+        holidays.add(date(year, 1, 6))     # Trzech Króli
+    if year >= 2025:
+        holidays.add(date(year, 12, 24))   # Wigilia
+    return frozenset(holidays)
+
+
+def is_business_day(day: date) -> bool:
+    return day.weekday() < 5 and day not in public_holidays(day.year)
+
+
+def previous_business_day(day: date) -> date:
+    """Latest business day strictly before `day`"""
+    day -= timedelta(days=1)
+    while not is_business_day(day):
+        day -= timedelta(days=1)
+    return day
+
+
+def business_days(start: date, end: date) -> List[date]:
+    """Business days within [start, end], ascending"""
+    days = []
+    day = start
+    while day <= end:
+        if is_business_day(day):
+            days.append(day)
+        day += timedelta(days=1)
+    return days
+
+
+def latest_publication_date(table: str = 'A', at: Optional[datetime] = None) -> date:
+    """Date of the most recent table that should be published by `at` (default: now)"""
+    at = at or now()
+    today = at.date()
+    if is_business_day(today) and (at.hour, at.minute) >= TABLE_PUBLICATION_TIMES[table]:
+        return today
+    return previous_business_day(today)
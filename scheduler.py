@@ -0,0 +1,325 @@
+"""
+Ingestion Layer - Background synchronization scheduler
+Runs incremental NBP syncs at publication times and periodic jobs, outside of the request path
+"""
+
+import importlib
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from nbp_calendar import is_business_day, now
+
+# NBP publishes Table C around 8:15 and Table A around 12:15 (Warsaw time) on business days.
+# Syncs are scheduled a few minutes after each publication window closes.
+PUBLICATION_TIMES = ((8, 20), (12, 20))
+
+# Delay before retrying after a failed sync (seconds)
+RETRY_DELAY = 15 * 60
+
+# Only the holder of the sync lease (shared by all processes using the database) syncs.
+# The lease expires SYNC_LEASE_TTL seconds after its last renewal, so a crashed holder
+# is taken over; a running sync renews it every third of that.
+SYNC_LEASE = 'nbp-sync'
+SYNC_LEASE_TTL = float(os.environ.get('SYNC_LEASE_TTL', 120))
+
+
+def _import_layer(name: str):
+    """Import a data/service layer module (models, services) on first use
+
+    Those modules pull in Flask and the whole service stack; loading them only when a
+    sync or lease call runs keeps this module importable (and cheap) on its own.
+    """
+    return importlib.import_module(name)
+
+
+class SyncLease:
+    """Cross-process single-writer lease on NBP ingestion, renewed in the background while held"""
+
+    def __init__(self, owner: str = None, name: str = SYNC_LEASE, ttl: float = SYNC_LEASE_TTL):
+        self.name = name
+        self.ttl = ttl
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}:{id(self):x}"
+        self._done = None
+
+    def acquire(self, finished_before: float = None) -> bool:
+        """Take the lease (see SyncLeaseModel.acquire) and start renewing it"""
+        if not _import_layer('models').SyncLeaseModel.acquire(self.name, self.owner, self.ttl, finished_before):
+            return False
+        self._done = threading.Event()
+        threading.Thread(target=self._renew, args=(self._done,), name=f"{self.name}-lease", daemon=True).start()
+        return True
+
+    def release(self, status: Dict = None) -> None:
+        if self._done is not None:
+            self._done.set()
+            self._done = None
+        _import_layer('models').SyncLeaseModel.release(self.name, self.owner, status)
+
+    def get(self) -> Optional[Dict]:
+        """Holder, expiry and the status recorded by the last finished run (in any process)"""
+        return _import_layer('models').SyncLeaseModel.get(self.name)
+
+    def held_elsewhere(self, lease: Optional[Dict]) -> bool:
+        return bool(lease and lease['held'] and lease['owner'] != self.owner)
+
+    def _renew(self, done: threading.Event) -> None:
+        model = _import_layer('models').SyncLeaseModel
+        while not done.wait(self.ttl / 3):
+            try:
+                if not model.renew(self.name, self.owner, self.ttl):
+                    # Taken over after expiring: the upserts are idempotent, so the worst
+                    # outcome is the same data written twice
+                    print(f"Lost the {self.name} lease")
+                    return
+            except Exception as e:
+                print(f"Renewing the {self.name} lease failed: {e}")
+
+
+class IngestionScheduler:
+    """Background worker running NBP syncs on the publication schedule
+
+    Every process may run one: the sync lease lets only one of them sync at a time, and a
+    scheduled run is skipped when another process already synced after its scheduled time.
+    """
+
+    def __init__(self, app, run_on_start: bool = True):
+        self.app = app
+        self.run_on_start = run_on_start
+        self.lease = SyncLease()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._status = {
+            'state': 'idle',
+            'runs': 0,
+            'last_started': None,
+            'last_finished': None,
+            'last_duration': None,
+            'last_result': None,
+            'last_error': None,
+            'next_run': None,
+            'skipped': 0,
+        }
+
+    @staticmethod
+    def next_run_time(now: datetime) -> datetime:
+        """Get the next publication-based sync time after `now` (NBP business days only)"""
+        day = now
+        while True:
+            if is_business_day(day.date()):
+                for hour, minute in PUBLICATION_TIMES:
+                    candidate = day.replace(hour=hour, minute=minute, second=0, microsecond=0)
+                    if candidate > now:
+                        return candidate
+            day = (day + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+
+    def start(self) -> None:
+        """Start the scheduler thread (no-op if already running)"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run_loop, name='nbp-ingestion', daemon=True)
+        self._thread.start()
+
+    def run_forever(self) -> None:
+        """Run the scheduler loop in the calling thread until stop() is called (dedicated workers)"""
+        self._stop.clear()
+        self._run_loop()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Stop the scheduler thread"""
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def trigger(self) -> bool:
+        """Request an immediate sync; returns False if one is already running (in any process)"""
+        with self._lock:
+            if self._status['state'] == 'running':
+                return False
+        if self.lease.held_elsewhere(self.lease.get()):
+            return False
+        if self._thread is None or not self._thread.is_alive():
+            threading.Thread(target=self.run_once, args=(time.time(),), name='nbp-ingestion-manual',
+                             daemon=True).start()
+        else:
+            self._wakeup.set()
+        return True
+
+    def local_status(self) -> Dict:
+        """Get a copy of this process's sync status"""
+        with self._lock:
+            return dict(self._status)
+
+    def status(self) -> Dict:
+        """Get the current sync status, including runs of other processes sharing the database"""
+        status = self.local_status()
+        lease = self.lease.get()
+        if lease is None:
+            return status
+        shared = lease['last_status'] or {}
+        if (shared.get('last_finished') or '') > (status['last_finished'] or ''):
+            for key in ('last_started', 'last_finished', 'last_duration', 'last_result', 'last_error'):
+                status[key] = shared.get(key)
+            status['last_run_by'] = shared.get('owner')
+            if status['state'] != 'running':
+                status['state'] = 'error' if status['last_error'] else 'idle'
+        if self.lease.held_elsewhere(lease):
+            status['state'] = 'running'
+            status['running_in'] = lease['owner']
+        return status
+
+    def run_once(self, requested_at: float = None) -> Optional[Dict]:
+        """Run a single sync and record its status
+
+        Nothing is run (None is returned) while another process holds the sync lease, or
+        when a sync finished at or after `requested_at` (a timestamp) anywhere.
+        """
+        with self._lock:
+            if self._status['state'] == 'running':
+                return None
+            previous_state = self._status['state']
+            self._status['state'] = 'running'
+        try:
+            acquired = self.lease.acquire(requested_at)
+        except Exception as e:
+            print(f"Could not take the sync lease: {e}")
+            acquired = False
+        if not acquired:
+            with self._lock:
+                self._status['state'] = previous_state
+                self._status['skipped'] += 1
+            return None
+        with self._lock:
+            self._status['last_started'] = now().isoformat()
+
+        started = time.perf_counter()
+        result = None
+        error = None
+        try:
+            with self.app.app_context():
+                result = _import_layer('services').CurrencyDataService.check_and_fetch_missing_data()
+        except Exception as e:
+            error = str(e)
+            print(f"Scheduled sync failed: {e}")
+
+        with self._lock:
+            self._status['state'] = 'error' if error else 'idle'
+            self._status['runs'] += 1
+            self._status['last_finished'] = now().isoformat()
+            self._status['last_duration'] = round(time.perf_counter() - started, 3)
+            self._status['last_result'] = result
+            self._status['last_error'] = error
+            shared = {key: self._status[key] for key in
+                      ('last_started', 'last_finished', 'last_duration', 'last_result', 'last_error')}
+        self.lease.release(dict(shared, owner=self.lease.owner))
+        return result
+
+    def _run_loop(self) -> None:
+        """Main scheduler loop"""
+        if self.run_on_start:
+            self.run_once(time.time())
+
+        while not self._stop.is_set():
+            if self.local_status()['state'] == 'error':
+                next_run = now() + timedelta(seconds=RETRY_DELAY)
+            else:
+                next_run = self.next_run_time(now())
+            with self._lock:
+                self._status['next_run'] = next_run.isoformat()
+
+            delay = max((next_run - now()).total_seconds(), 0)
+            triggered = self._wakeup.wait(delay)
+            self._wakeup.clear()
+            if self._stop.is_set():
+                break
+            # Skipped if another process already synced after the scheduled time
+            self.run_once(time.time() if triggered else next_run.timestamp())
+
+
+class PeriodicJob:
+    """Background worker running a job at a fixed interval (e.g. crypto market snapshots)"""
+
+    def __init__(self, app, job, interval: float, name: str):
+        self.app = app
+        self.job = job
+        self.interval = interval
+        self.name = name
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._status = {
+            'state': 'idle',
+            'runs': 0,
+            'failures': 0,
+            'last_finished': None,
+            'last_duration': None,
+            'last_error': None,
+        }
+
+    def start(self) -> None:
+        """Start the job thread (no-op if already running)"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run_loop, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def status(self) -> Dict:
+        with self._lock:
+            return dict(self._status, interval=self.interval)
+
+    def run_once(self) -> None:
+        """Run the job once in an application context and record its status"""
+        with self._lock:
+            self._status['state'] = 'running'
+        started = time.perf_counter()
+        error = None
+        try:
+            with self.app.app_context():
+                self.job()
+        except Exception as e:
+            error = str(e)
+            print(f"{self.name} failed: {e}")
+        self.record_run(started, error)
+
+    def record_run(self, started: float, error: Optional[str] = None) -> None:
+        """Record a finished run (also used by runners driving the job from an event loop)"""
+        with self._lock:
+            self._status['state'] = 'error' if error else 'idle'
+            self._status['runs'] += 1
+            self._status['failures'] += 1 if error else 0
+            self._status['last_finished'] = now().isoformat()
+            self._status['last_duration'] = round(time.perf_counter() - started, 3)
+            self._status['last_error'] = error
+
+    def _run_loop(self) -> None:
+        """Run immediately, then every `interval` seconds (measured start to start)"""
+        while not self._stop.is_set():
+            started = time.monotonic()
+            self.run_once()
+            self._stop.wait(max(self.interval - (time.monotonic() - started), 0))
+
+
+if __name__ == '__main__':
+    # Standalone ingestion worker: web processes only read the database
+    from app import init_db, scheduler, crypto_snapshots
+
+    init_db()  # Apply pending migrations (existing data is kept)
+    crypto_snapshots.start()
+    print("Ingestion worker started")
+    try:
+        scheduler.run_forever()
+    except KeyboardInterrupt:
+        print("Ingestion worker stopped")
@@ -0,0 +1,52 @@
+"""
+Production entry point - serves the application with uvicorn (ASGI mode, see asgi.py)
+
+    python serve.py --host 0.0.0.0 --port 8000 --workers 4
+
+With more than one worker the NBP ingestion and crypto snapshots run in a single
+dedicated worker process, so the web workers only read the database.
+"""
+
+import argparse
+import multiprocessing
+import os
+
+import uvicorn
+
+
+def run_ingestion_worker() -> None:
+    """Background jobs of all web workers, in their own process"""
+    from app import init_db, scheduler, crypto_snapshots
+
+    init_db()
+    crypto_snapshots.start()
+    print("Ingestion worker started")
+    scheduler.run_forever()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Serve the exchange tracker (ASGI, uvicorn)')
+    parser.add_argument('--host', default=os.environ.get('HOST', '127.0.0.1'))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('PORT', 8000)))
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('WEB_CONCURRENCY', 1)),
+                        help='web worker processes (default: $WEB_CONCURRENCY or 1)')
+    parser.add_argument('--log-level', default=os.environ.get('LOG_LEVEL', 'info'))
+    args = parser.parse_args()
+
+    worker = None
+    if args.workers > 1 and os.environ.get('INGESTION_WORKER') != 'external':
+        worker = multiprocessing.Process(target=run_ingestion_worker, name='ingestion-worker', daemon=True)
+        worker.start()
+        # Inherited by the web workers, which then skip starting their own jobs
+        os.environ['INGESTION_WORKER'] = 'external'
+
+    try:
+        uvicorn.run('asgi:app', host=args.host, port=args.port, workers=args.workers,
+                    log_level=args.log_level, proxy_headers=True)
+    finally:
+        if worker is not None:
+            worker.terminate()
+
+
+if __name__ == '__main__':
+    main()
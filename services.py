@@ -3,153 +3,589 @@ Business Logic Layer - Services and API interactions
 Handles external API calls, data processing, and business logic
 """
 
-import requests
-from datetime import datetime, timedelta
-from typing import List, Dict, Optional, Tuple
-from models import CurrencyRatesModel
+import io
+import os
+import csv
+import json
+import time
+import hashlib
+import threading
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import date, datetime, timedelta, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import TYPE_CHECKING, List, Dict, Optional, Tuple, Iterable
+from models import (DatabaseManager, CurrencyRatesModel, RateRollupModel, RateStatsModel, UnpublishedDaysModel,
+                    UnavailableMidRatesModel, CryptoSnapshotModel, CryptoPricesModel, ROLLUP_FIELDS)
+from cache import RateSeries, RefreshingCache, series_cache, payload_cache, response_cache
+from snapshots import RateSnapshot, snapshot_store, SNAPSHOTS_ENABLED, SNAPSHOT_DIR
+from metrics import upstream
+import nbp_calendar
+
+# The HTTP client (requests) and the numpy-based modules (analytics, downsampling, conversion)
+# are imported where first used, so processes that never call upstream or compute analytics
+# (short-lived workers, CLI tools, tests) start without loading them
+if TYPE_CHECKING:
+    import requests
+    from conversion import RateMatrix
 
 # API Configuration
-CRYPTO_API_URL = "https://api.coingecko.com/api/v3/coins/markets"
+CRYPTO_API_URL = os.environ.get('CRYPTO_API_URL', 'https://api.coingecko.com/api/v3/coins/markets')
+CRYPTO_TIMEOUT = float(os.environ.get('CRYPTO_TIMEOUT', 10))
+# Crypto market data is fresh for CRYPTO_CACHE_TTL seconds, then served stale for up to
+# CRYPTO_STALE_TTL more while a background refresh runs
+CRYPTO_CACHE_TTL = float(os.environ.get('CRYPTO_CACHE_TTL', 60))
+CRYPTO_STALE_TTL = float(os.environ.get('CRYPTO_STALE_TTL', 3600))
+# Market history: snapshot interval (seconds) and number of coins recorded per snapshot
+CRYPTO_SNAPSHOT_INTERVAL = float(os.environ.get('CRYPTO_SNAPSHOT_INTERVAL', 300))
+CRYPTO_TRACKED_COINS = int(os.environ.get('CRYPTO_TRACKED_COINS', 50))
+NBP_API_URL = os.environ.get('NBP_API_URL', 'http://api.nbp.pl/api')
+
+# NBP API allows max 367 days per request
+NBP_MAX_CHUNK_DAYS = 366
+# Failed chunks are split in half until they get this small
+NBP_MIN_CHUNK_DAYS = 30
+# Backfill concurrency and request rate limit (requests per second, shared by all workers)
+NBP_MAX_WORKERS = int(os.environ.get('NBP_MAX_WORKERS', 4))
+NBP_RATE_LIMIT = float(os.environ.get('NBP_RATE_LIMIT', 10))
+NBP_TIMEOUT = 30
+
+# How often (seconds) the in-memory latest stored dates are re-read from the database,
+# so processes without their own scheduler notice new data
+DATA_VERSION_REFRESH = float(os.environ.get('DATA_VERSION_REFRESH', 30))
+
+# Maximum number of points sent to the browser per chart series
+CHART_TARGET_POINTS = int(os.environ.get('CHART_TARGET_POINTS', 500))
+
+# Tracked currencies: comma-separated codes, or 'all' for every currency of NBP tables A and C
+TRACKED_CURRENCIES = os.environ.get('TRACKED_CURRENCIES', 'USD,EUR,GBP,CHF')
+
+class RateLimiter:
+    """Thread-safe limiter spacing out requests to a maximum rate"""
+    
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+    
+    def acquire(self) -> None:
+        """Block until the next request slot is available"""
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+class BackfillStats:
+    """Counters and timing for a single backfill run"""
+    
+    def __init__(self):
+        self.chunks = 0
+        self.failed_chunks = 0
+        self.splits = 0
+        self.tables = 0
+        self.elapsed = 0.0
+    
+    @property
+    def chunks_per_sec(self) -> float:
+        return self.chunks / self.elapsed if self.elapsed > 0 else 0.0
+    
+    def to_dict(self) -> Dict:
+        return {
+            'chunks': self.chunks,
+            'failed_chunks': self.failed_chunks,
+            'splits': self.splits,
+            'tables': self.tables,
+            'elapsed': round(self.elapsed, 3),
+            'chunks_per_sec': round(self.chunks_per_sec, 2)
+        }
 
 class NBPService:
     """Service for handling NBP API interactions"""
     
+    _session = None
+    _session_lock = threading.Lock()
+    _rate_limiter = RateLimiter(NBP_RATE_LIMIT)
+    
+    @staticmethod
+    def get_session() -> 'requests.Session':
+        """Get the shared keep-alive session (connection pool sized for the backfill workers)"""
+        if NBPService._session is None:
+            with NBPService._session_lock:
+                if NBPService._session is None:
+                    import requests
+                    from requests.adapters import HTTPAdapter
+                    from urllib3.util.retry import Retry
+                    
+                    retry = Retry(
+                        total=3,
+                        backoff_factor=0.5,
+                        status_forcelist=(429, 500, 502, 503, 504),
+                        allowed_methods=frozenset(['GET']),
+                        respect_retry_after_header=True
+                    )
+                    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=NBP_MAX_WORKERS, max_retries=retry)
+                    session = requests.Session()
+                    session.mount('http://', adapter)
+                    session.mount('https://', adapter)
+                    NBPService._session = session
+        return NBPService._session
+    
+    @staticmethod
+    def fetch_table_range(start_date: datetime, end_date: datetime, table: str = 'C') -> List[Tuple]:
+        """Fetch a single NBP table range (at most NBP_MAX_CHUNK_DAYS long) in one request"""
+        start_str = start_date.strftime('%Y-%m-%d')
+        end_str = end_date.strftime('%Y-%m-%d')
+        url = f"{NBP_API_URL}/exchangerates/tables/{table}/{start_str}/{end_str}/?format=json"
+        
+        NBPService._rate_limiter.acquire()
+        print(f"Fetching data from: {url}")
+        with upstream('nbp') as call:
+            response = NBPService.get_session().get(url, timeout=NBP_TIMEOUT)
+            call.status = response.status_code
+        # NBP answers 404 when no table was published in the range (weekends, holidays)
+        if response.status_code == 404:
+            return []
+        response.raise_for_status()
+        data = response.json()
+        
+        all_rates = []
+        if data and isinstance(data, list):
+            for day_data in data:
+                if day_data.get('rates') and day_data.get('effectiveDate'):
+                    all_rates.append((day_data['rates'], day_data['effectiveDate']))
+        
+        return all_rates
+    
     @staticmethod
     def fetch_data_by_date_range(start_date: datetime, end_date: datetime, table: str = 'C') -> List[Tuple]:
         """Fetch NBP data for a specific date range using Table C (for bid/ask) or A (for mid)"""
-        try:
-            # Format dates for API
-            start_str = start_date.strftime('%Y-%m-%d')
-            end_str = end_date.strftime('%Y-%m-%d')
+        return NBPBackfillEngine().fetch(start_date, end_date, (table,))[table]
+
+    @staticmethod
+    def parse_table_rates(tables: List[Tuple], currencies=None):
+        """Fan fetched tables out into per-currency rate records in a single pass
+
+        Yields dicts with code, name, date and whichever of mid/bid/ask the table carries.
+        With currencies=None every currency present in the tables is yielded.
+        """
+        wanted = set(currencies) if currencies is not None else None
+        for rates, effective_date in tables:
+            if not rates or not effective_date:
+                continue
+            for rate in rates:
+                code = rate.get('code')
+                if wanted is not None and code not in wanted:
+                    continue
+                yield {
+                    'code': code,
+                    'name': rate.get('currency'),
+                    'date': effective_date,
+                    'mid': rate.get('mid'),
+                    'bid': rate.get('bid'),
+                    'ask': rate.get('ask')
+                }
+
+    @staticmethod
+    def merge_tables(tables: Dict[str, List[Tuple]], currencies=None) -> List[Dict]:
+        """Merge Table A mid rates and Table C bid/ask rates into one record per (currency, date)"""
+        merged = {}
+        for table in ('A', 'C'):
+            for rate in NBPService.parse_table_rates(tables.get(table, []), currencies):
+                key = (rate['code'], rate['date'])
+                record = merged.get(key)
+                if record is None:
+                    merged[key] = rate
+                else:
+                    for field in ('mid', 'bid', 'ask'):
+                        if rate[field] is not None:
+                            record[field] = rate[field]
+        return list(merged.values())
+
+class NBPBackfillEngine:
+    """Concurrent chunked NBP fetcher with adaptive splitting of failed chunks"""
+    
+    def __init__(self, max_workers: int = NBP_MAX_WORKERS, chunk_days: int = NBP_MAX_CHUNK_DAYS,
+                 min_chunk_days: int = NBP_MIN_CHUNK_DAYS):
+        self.max_workers = max_workers
+        self.chunk_days = chunk_days
+        self.min_chunk_days = min_chunk_days
+        self.stats = BackfillStats()
+    
+    def split_range(self, start_date: datetime, end_date: datetime) -> List[Tuple]:
+        """Split a date range into chunks accepted by the NBP API"""
+        chunks = []
+        current_start = start_date
+        while current_start <= end_date:
+            current_end = min(current_start + timedelta(days=self.chunk_days), end_date)
+            chunks.append((current_start, current_end))
+            current_start = current_end + timedelta(days=1)
+        return chunks
+    
+    def fetch(self, start_date: datetime, end_date: datetime, tables: Tuple = ('C',)) -> Dict[str, List[Tuple]]:
+        """Fetch all chunks of the given tables in parallel; returns {table: [(rates, date), ...]}"""
+        return self.fetch_ranges([(start_date, end_date)], tables)
+    
+    def fetch_ranges(self, ranges: List[Tuple], tables: Tuple = ('C',)) -> Dict[str, List[Tuple]]:
+        """Fetch several (non-overlapping) date ranges of the given tables, all chunks in parallel"""
+        import requests
+        
+        results = {table: [] for table in tables}
+        started = time.perf_counter()
+        
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            pending = {}
             
-            # NBP API allows max 367 days per request, so we might need to split
-            if (end_date - start_date).days > 366:
-                # Split into smaller chunks
-                current_start = start_date
-                all_rates = []
-                
-                while current_start < end_date:
-                    current_end = min(current_start + timedelta(days=366), end_date)
-                    chunk_rates = NBPService.fetch_data_by_date_range(current_start, current_end, table)
-                    if chunk_rates:
-                        all_rates.extend(chunk_rates)
-                    current_start = current_end + timedelta(days=1)
-                
-                return all_rates
-                
-            url = f"http://api.nbp.pl/api/exchangerates/tables/{table}/{start_str}/{end_str}/?format=json"
-            print(f"Fetching data from: {url}")
-            response = requests.get(url)
-            response.raise_for_status()
-            data = response.json()
+            def submit(table, chunk_start, chunk_end):
+                future = executor.submit(NBPService.fetch_table_range, chunk_start, chunk_end, table)
+                pending[future] = (table, chunk_start, chunk_end)
             
-            all_rates = []
-            if data and isinstance(data, list):
-                for day_data in data:
-                    if day_data.get('rates') and day_data.get('effectiveDate'):
-                        all_rates.append((day_data['rates'], day_data['effectiveDate']))
+            for table in tables:
+                for start_date, end_date in ranges:
+                    for chunk_start, chunk_end in self.split_range(start_date, end_date):
+                        submit(table, chunk_start, chunk_end)
             
-            return all_rates
-        except requests.exceptions.RequestException as e:
-            print(f"Error fetching NBP data for range {start_str} to {end_str}: {e}")
-            # Try with a smaller range or return whatever we have
-            if (end_date - start_date).days > 30:
-                mid_date = start_date + (end_date - start_date) // 2
-                first_half = NBPService.fetch_data_by_date_range(start_date, mid_date, table)
-                second_half = NBPService.fetch_data_by_date_range(mid_date + timedelta(days=1), end_date, table)
-                return (first_half or []) + (second_half or [])
-        return []
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    table, chunk_start, chunk_end = pending.pop(future)
+                    try:
+                        chunk_rates = future.result()
+                    except requests.exceptions.RequestException as e:
+                        print(f"Error fetching NBP table {table} for range {chunk_start:%Y-%m-%d} to {chunk_end:%Y-%m-%d}: {e}")
+                        if (chunk_end - chunk_start).days > self.min_chunk_days:
+                            # Retry both halves concurrently
+                            mid_date = chunk_start + (chunk_end - chunk_start) // 2
+                            submit(table, chunk_start, mid_date)
+                            submit(table, mid_date + timedelta(days=1), chunk_end)
+                            self.stats.splits += 1
+                        else:
+                            self.stats.failed_chunks += 1
+                        continue
+                    
+                    self.stats.chunks += 1
+                    self.stats.tables += len(chunk_rates)
+                    results[table].extend(chunk_rates)
+        
+        for table in tables:
+            results[table].sort(key=lambda item: item[1])
+        
+        self.stats.elapsed = time.perf_counter() - started
+        print(f"Backfill finished: {self.stats.chunks} chunks, {self.stats.tables} tables "
+              f"in {self.stats.elapsed:.2f}s ({self.stats.chunks_per_sec:.2f} chunks/s)")
+        return results
 
 class CryptocurrencyService:
     """Service for handling cryptocurrency API interactions"""
     
+    _session = None
+    
     @staticmethod
-    def fetch_data(limit: int = 10) -> List[Dict]:
-        """Fetch top cryptocurrencies data from CoinGecko API"""
-        try:
-            params = {
-                'vs_currency': 'usd',
-                'order': 'market_cap_desc',
-                'per_page': limit,
-                'page': 1,
-                'sparkline': False,
-                'price_change_percentage': '24h,7d'
-            }
-            
-            response = requests.get(CRYPTO_API_URL, params=params)
-            response.raise_for_status()
-            crypto_data = response.json()
+    def get_session() -> 'requests.Session':
+        """Shared keep-alive session (failures are absorbed by the cache, so no retries here)"""
+        if CryptocurrencyService._session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
             
-            if crypto_data and isinstance(crypto_data, list):
-                return crypto_data
-                
-        except requests.exceptions.RequestException as e:
-            print(f"Error fetching cryptocurrency data: {e}")
-        return []
+            session = requests.Session()
+            session.mount('http://', HTTPAdapter(pool_maxsize=4))
+            session.mount('https://', HTTPAdapter(pool_maxsize=4))
+            CryptocurrencyService._session = session
+        return CryptocurrencyService._session
+    
+    @staticmethod
+    def market_params(limit: int) -> Dict:
+        """Query parameters of the CoinGecko /coins/markets request"""
+        return {
+            'vs_currency': 'usd',
+            'order': 'market_cap_desc',
+            'per_page': limit,
+            'page': 1,
+            'sparkline': 'false',
+            'price_change_percentage': '24h,7d'
+        }
+    
+    @staticmethod
+    def accept_market_data(crypto_data, limit: int) -> List[Dict]:
+        """Validate an upstream response and keep it as the last good snapshot"""
+        if not crypto_data or not isinstance(crypto_data, list):
+            raise ValueError("Unexpected CoinGecko response")
+        
+        # Keep the last good data so the page still renders while the upstream is down
+        CryptoSnapshotModel.save(f"markets:{limit}", crypto_data, time.time())
+        return crypto_data
+    
+    @staticmethod
+    def fetch_upstream(limit: int = 10) -> List[Dict]:
+        """Fetch top cryptocurrencies data from CoinGecko API; raises on failure"""
+        with upstream('coingecko') as call:
+            response = CryptocurrencyService.get_session().get(
+                CRYPTO_API_URL, params=CryptocurrencyService.market_params(limit), timeout=CRYPTO_TIMEOUT)
+            call.status = response.status_code
+        response.raise_for_status()
+        return CryptocurrencyService.accept_market_data(response.json(), limit)
+    
+    @staticmethod
+    def load_snapshot(limit: int):
+        try:
+            return CryptoSnapshotModel.load(f"markets:{limit}")
+        except Exception as e:
+            print(f"Error loading cryptocurrency snapshot: {e}")
+            return None
+    
+    # History periods: key -> seconds back from now
+    HISTORY_PERIODS = {
+        '24h': 86400,
+        '7days': 7 * 86400,
+        '1month': 30 * 86400,
+        '1year': 365 * 86400,
+        'all': None
+    }
+    
+    @staticmethod
+    def store_snapshot(coins: List[Dict]) -> int:
+        """Append fetched market data to the local history"""
+        inserted = CryptoPricesModel.insert_snapshot(coins, int(time.time()))
+        print(f"Recorded crypto snapshot: {inserted} prices")
+        return inserted
+    
+    @staticmethod
+    def record_snapshot(limit: int = CRYPTO_TRACKED_COINS) -> int:
+        """Fetch the current market data and append it to the local history (snapshot job)"""
+        return CryptocurrencyService.store_snapshot(CryptocurrencyService.fetch_upstream(limit))
+    
+    @staticmethod
+    def local_change(current: float, past: Optional[Tuple[float, int]], window: int, now: int) -> Optional[float]:
+        """Percentage change against a recorded price from about `window` seconds ago"""
+        if past is None or not past[0]:
+            return None
+        # The recorded price must be close to the start of the window (snapshots may be missing)
+        if now - past[1] > window + max(3 * CRYPTO_SNAPSHOT_INTERVAL, 3600):
+            return None
+        return (current / past[0] - 1) * 100
+    
+    @staticmethod
+    def get_local_market_data(limit: int = 10) -> Tuple[List[Dict], Optional[int]]:
+        """Latest recorded snapshot in CoinGecko format with locally computed 24h/7d changes"""
+        rows = CryptoPricesModel.get_latest_snapshot(limit)
+        if not rows:
+            return [], None
+        timestamp = rows[0]['timestamp']
+        coin_ids = [row['coin_id'] for row in rows]
+        day_ago = CryptoPricesModel.get_prices_at(coin_ids, timestamp - 86400)
+        week_ago = CryptoPricesModel.get_prices_at(coin_ids, timestamp - 7 * 86400)
+        
+        coins = []
+        for row in rows:
+            change_24h = CryptocurrencyService.local_change(row['price'], day_ago.get(row['coin_id']), 86400, timestamp)
+            change_7d = CryptocurrencyService.local_change(row['price'], week_ago.get(row['coin_id']), 7 * 86400, timestamp)
+            coins.append({
+                'id': row['coin_id'],
+                'symbol': row['symbol'],
+                'name': row['name'],
+                'image': row['image'],
+                'market_cap_rank': row['market_cap_rank'],
+                'current_price': row['price'],
+                'market_cap': row['market_cap'],
+                'total_volume': row['total_volume'],
+                'high_24h': row['high_24h'],
+                'low_24h': row['low_24h'],
+                # Reported values are used until the local history covers the window
+                'price_change_percentage_24h': change_24h if change_24h is not None else row['change_24h'],
+                'price_change_percentage_7d_in_currency': change_7d if change_7d is not None else row['change_7d']
+            })
+        return coins, timestamp
+    
+    @staticmethod
+    def get_market_data_local(limit: int = 10) -> Tuple[List[Dict], Optional[Dict]]:
+        """Recorded market data and its freshness (source, fetched_at, age); empty before the first snapshot"""
+        coins, timestamp = CryptocurrencyService.get_local_market_data(limit)
+        if not coins:
+            return [], None
+        age = time.time() - timestamp
+        source = 'fresh' if age < 2 * CRYPTO_SNAPSHOT_INTERVAL else 'stale'
+        return coins, {'source': source, 'fetched_at': timestamp, 'age': round(age, 1)}
+    
+    @staticmethod
+    def get_market_data(limit: int = 10) -> Tuple[List[Dict], Dict]:
+        """Get market data and its freshness (source, fetched_at, age)
+
+        Served from the recorded history; the upstream (through the cache) is only used
+        before the snapshot job has recorded anything.
+        """
+        coins, info = CryptocurrencyService.get_market_data_local(limit)
+        if coins:
+            return coins, info
+        data, info = crypto_cache.get(limit)
+        return data or [], info
+    
+    @staticmethod
+    def get_history(coin_id: str, period: str = '7days', max_points: int = CHART_TARGET_POINTS) -> Optional[Dict]:
+        """Recorded price history of a coin, LTTB-downsampled to max_points"""
+        import numpy as np
+        from downsampling import lttb_indices
+        
+        coin = CryptoPricesModel.get_coin(coin_id)
+        if coin is None:
+            return None
+        seconds = CryptocurrencyService.HISTORY_PERIODS[period]
+        start = int(time.time()) - seconds if seconds else None
+        rows = CryptoPricesModel.get_history(coin_id, start)
+        
+        timestamps = np.array([row['timestamp'] for row in rows], dtype=np.float64)
+        prices = np.array([row['price'] for row in rows], dtype=np.float64)
+        keep = lttb_indices(timestamps, prices, max_points)
+        first = prices[0] if len(prices) else None
+        last = prices[-1] if len(prices) else None
+        return {
+            'coin': coin_id,
+            'symbol': coin['symbol'],
+            'name': coin['name'],
+            'period': period,
+            'points': len(rows),
+            'timestamps': [rows[i]['timestamp'] for i in keep.tolist()],
+            'prices': [rows[i]['price'] for i in keep.tolist()],
+            'market_caps': [rows[i]['market_cap'] for i in keep.tolist()],
+            'volumes': [rows[i]['total_volume'] for i in keep.tolist()],
+            'change_percent': (last / first - 1) * 100 if first else None
+        }
+    
+    @staticmethod
+    def fetch_data(limit: int = 10) -> List[Dict]:
+        """Get top cryptocurrencies data (cached, empty when unavailable)"""
+        return CryptocurrencyService.get_market_data(limit)[0]
+
+crypto_cache = RefreshingCache(CryptocurrencyService.fetch_upstream, CRYPTO_CACHE_TTL, CRYPTO_STALE_TTL,
+                               fallback=CryptocurrencyService.load_snapshot)
+
+class CurrencyRegistry:
+    """Tracked currencies: the TRACKED_CURRENCIES list, or every currency NBP publishes ('all')"""
+    
+    # Shown first (in this order) when every currency is tracked
+    POPULAR = ('USD', 'EUR', 'GBP', 'CHF')
+    
+    @staticmethod
+    def configured() -> Optional[List[str]]:
+        """Configured codes in display order; None when every published currency is tracked"""
+        if TRACKED_CURRENCIES.strip().lower() == 'all':
+            return None
+        return list(dict.fromkeys(code.strip().upper() for code in TRACKED_CURRENCIES.split(',') if code.strip()))
+    
+    @staticmethod
+    def tracked() -> List[str]:
+        """Tracked codes in display order (in 'all' mode: every currency stored so far)"""
+        configured = CurrencyRegistry.configured()
+        if configured is not None:
+            return configured
+        stored = [code for code, entry in FreshnessService.stats().items() if entry['row_count']]
+        popular = CurrencyRegistry.POPULAR
+        return sorted(stored, key=lambda code: (popular.index(code) if code in popular else len(popular), code))
+    
+    @staticmethod
+    def names() -> Dict[str, str]:
+        """Currency names as published by NBP"""
+        return {code: entry['currency_name'] for code, entry in FreshnessService.stats().items()
+                if entry.get('currency_name')}
+    
+    @staticmethod
+    def has_bid_ask(currency_code: str) -> bool:
+        """Whether the currency is quoted in Table C (bid/ask); Table A has mid rates only"""
+        return FreshnessService.table_of(currency_code) == 'C'
 
 class CurrencyDataService:
     """Service for managing currency data operations"""
     
-    REQUIRED_CURRENCIES = ['USD', 'EUR', 'GBP', 'CHF']
-    
     @staticmethod
     def check_and_fetch_missing_data() -> Dict:
-        """Check if we have enough data and fetch only missing data if needed"""
+        """Find the gaps in the tracked currencies' history and fetch only those
+
+        Every currency should have a rate for each NBP business day from its first stored date
+        (a year back when nothing is stored) to the latest date its table should have been
+        published. GapService finds the missing days with one set-based query and coalesces
+        them into minimal ranges; tables A and C are fetched once for the union of the ranges
+        and each currency keeps only the rates of its own gaps.
+        """
         missing_data_found = False
         total_stored = 0
-        today = datetime.now().date()
+        total_updated = 0
+        today = nbp_calendar.now().date()
         
-        for currency in CurrencyDataService.REQUIRED_CURRENCIES:
-            # First check if we have any data at all for this currency
-            total_count = CurrencyRatesModel.get_rates_count(currency)
+        # Expected windows come from the in-memory stats, the gaps from one query on rates
+        stats = FreshnessService.refresh()
+        configured = CurrencyRegistry.configured()
+        currencies = configured if configured is not None else CurrencyRegistry.tracked()
+        # If no data, start from 1 year ago instead of 5 years
+        default_start = today - timedelta(days=365)
+        gaps = GapService.find(GapService.expected_windows(currencies, stats, default_start))
+        
+        # Tracking everything with nothing stored yet: discover the currencies from the tables
+        bootstrap = configured is None and not currencies
+        if gaps or bootstrap:
+            missing_data_found = True
+            for code, ranges in gaps.items():
+                print(f"Fetching {code}: {len(ranges)} gap(s) between {ranges[0][0]} and {ranges[-1][1]}")
+            # Download tables A (mid) and C (bid/ask) once for the gap ranges of all currencies
+            # and merge them per (currency, date)
+            fetch_ranges = GapService.merge(gaps) or [(default_start, today)]
+            engine = NBPBackfillEngine()
+            tables = engine.fetch_ranges(fetch_ranges, ('A', 'C'))
             
-            # Check if we have recent data (last 7 days)
-            recent_count = CurrencyRatesModel.get_recent_rates_count(currency, 7)
+            known = set(currencies)
+            new_start = default_start.strftime('%Y-%m-%d')
             
-            # Only fetch data if we have very little data overall (less than 50 records) 
-            # OR if we have no recent data and less than 500 total records
-            should_fetch = (total_count < 50) or (recent_count == 0 and total_count < 500)
+            def wanted(rate):
+                ranges = gaps.get(rate['code'])
+                if ranges is not None:
+                    return GapService.covers(ranges, rate['date'])
+                # Tracking everything: currencies not stored yet (first sync, or newly published) get a year
+                return configured is None and rate['code'] not in known and rate['date'] >= new_start
             
-            if should_fetch:
-                print(f"Fetching data for {currency}: {total_count} total records, {recent_count} recent records")
+            rates = [rate for rate in NBPService.merge_tables(tables, configured) if wanted(rate)]
+            counts = CurrencyRatesModel.upsert_rates(rates)
+            CurrencyDataService.after_ingest(counts['currencies'], counts['ranges'])
+            total_stored += counts['inserted']
+            total_updated += counts['updated']
+            if not engine.stats.failed_chunks:
+                # Gap days NBP answered without a rate are not requested again
+                UnpublishedDaysModel.record(GapService.unpublished(gaps, tables, rates), time.time())
+            if configured is None and set(counts['currencies']) - known:
+                # Newly published (or, on the first sync, all) currencies join the tracked set
+                currencies = CurrencyRegistry.tracked()
+        
+        # Backfill mid rates of rows stored before Table A was ingested
+        # (and of today's rows when Table C was published before Table A)
+        missing_mid = GapService.missing_mid(currencies) if currencies else {}
+        if missing_mid:
+            for code, ranges in missing_mid.items():
+                print(f"Backfilling {code} mid rates: {len(ranges)} range(s) between {ranges[0][0]} and {ranges[-1][1]}")
+            engine = NBPBackfillEngine()
+            tables = engine.fetch_ranges(GapService.merge(missing_mid), ('A',))
+            rates = [rate for rate in NBPService.merge_tables(tables, currencies)
+                     if rate['code'] in missing_mid and GapService.covers(missing_mid[rate['code']], rate['date'])]
+            counts = CurrencyRatesModel.upsert_rates(rates)
+            CurrencyDataService.after_ingest(counts['currencies'], counts['ranges'])
+            if counts['inserted'] or counts['updated']:
                 missing_data_found = True
-                
-                # Get the latest date we have for this currency
-                latest_date = CurrencyRatesModel.get_latest_date(currency)
-                
-                if latest_date:
-                    start_date = latest_date + timedelta(days=1)  # Start from day after latest
-                else:
-                    # If no data, start from 1 year ago instead of 5 years
-                    start_date = today - timedelta(days=365)
-                
-                # Only fetch if there's a gap to fill
-                if start_date <= today:
-                    print(f"Fetching {currency} data from {start_date} to {today}")
-                    historical_data = NBPService.fetch_data_by_date_range(start_date, today, 'C')
-                    
-                    # Store only the data for our required currency
-                    for rates, effective_date in historical_data:
-                        if rates and effective_date:
-                            # Find the specific currency in the rates
-                            currency_data = next((rate for rate in rates if rate['code'] == currency), None)
-                            if currency_data:
-                                if not CurrencyRatesModel.rate_exists(currency, effective_date):
-                                    CurrencyRatesModel.insert_rate(
-                                        currency_data['code'], 
-                                        currency_data['currency'],
-                                        currency_data['bid'], 
-                                        currency_data['ask'], 
-                                        effective_date
-                                    )
-                                    total_stored += 1
-                    
-                    CurrencyRatesModel.commit_changes()
+            total_stored += counts['inserted']
+            total_updated += counts['updated']
+            if not engine.stats.failed_chunks:
+                # Rows Table A was published for without the currency are not requested again
+                UnavailableMidRatesModel.record(GapService.unresolved(missing_mid, tables), time.time())
+        
+        RateStatsModel.record_sync(currencies, time.time())
+        
+        # Precompute serialized chart payloads so page views are served from memory
+        PayloadService.precompute(currencies)
         
         if missing_data_found:
             return {
-                "message": f"Missing data detected and updated: Stored {total_stored} new records.",
-                "status": "updated"
+                "message": f"Missing data detected and updated: Stored {total_stored} new records, updated {total_updated}.",
+                "status": "updated",
+                "inserted": total_stored,
+                "updated": total_updated
             }
         else:
             return {
@@ -157,29 +593,275 @@ class CurrencyDataService:
                 "status": "complete"
             }
     
+    @staticmethod
+    def after_ingest(currencies: List[str], ranges: Dict[str, Tuple[str, str]] = None) -> None:
+        """Refresh rollups and invalidate cached series and payloads of currencies that received new data"""
+        if not currencies:
+            return
+        RateStatsModel.refresh(currencies)
+        if ranges:
+            RateRollupModel.refresh(ranges)
+        SnapshotService.update(currencies, ranges)
+        series_cache.invalidate_currencies(currencies)
+        PayloadService.invalidate(currencies)
+        ConversionService.invalidate()
+    
     @staticmethod
     def check_data_needs_update() -> bool:
-        """Check if data needs to be updated"""
-        today = datetime.now().date()
-        recent_period = today - timedelta(days=7)
+        """Check if data needs to be updated (in-memory stats and the NBP calendar, no queries on rates)"""
+        stale = FreshnessService.stale_currencies(CurrencyRegistry.tracked())
+        if stale:
+            print(f"Auto-checking: {', '.join(stale)} behind the NBP publication calendar, will fetch missing data")
+        return bool(stale)
+
+class GapService:
+    """Gap analysis of the stored rates against the NBP publication calendar"""
+    
+    @staticmethod
+    def expected_windows(currencies: Iterable[str], stats: Dict[str, Dict], history_start: date,
+                         at: datetime = None) -> Dict[str, Tuple[str, str]]:
+        """(first, last) dates each currency should cover: from its first stored date (history_start
+        when nothing is stored) to the latest date its table should have been published"""
+        windows = {}
+        for code in currencies:
+            entry = stats.get(code) or {}
+            first = entry['first_date'] if entry.get('row_count') else history_start.isoformat()
+            last = nbp_calendar.latest_publication_date(FreshnessService.table_of(code), at).isoformat()
+            if first <= last:
+                windows[code] = (first, last)
+        return windows
+    
+    @staticmethod
+    def calendar(start_date: str, end_date: str) -> List[str]:
+        """Business days within [start_date, end_date] as ISO dates"""
+        return [day.isoformat() for day in nbp_calendar.business_days(date.fromisoformat(start_date),
+                                                                      date.fromisoformat(end_date))]
+    
+    @staticmethod
+    def coalesce(days: List[str], calendar: List[str]) -> List[Tuple[str, str]]:
+        """Minimal (first, last) ranges covering the ascending missing days
         
-        for currency in CurrencyDataService.REQUIRED_CURRENCIES:
-            # Check if we have any data from the last 7 days
-            recent_count = CurrencyRatesModel.get_recent_rates_count(currency, 7)
-            
-            # Also check if we have any data at all for this currency
-            total_count = CurrencyRatesModel.get_rates_count(currency)
-            
-            # Only trigger update if we have no recent data AND less than 100 total records
-            if recent_count == 0 and total_count < 100:
-                print(f"Auto-checking: {currency} has no recent data ({recent_count} recent, {total_count} total), will fetch missing data")
-                return True
+        Days adjacent in the business-day calendar share a range, so a range spans weekends
+        and holidays but never a business day that is not missing.
+        """
+        position = {day: index for index, day in enumerate(calendar)}
+        ranges = []
+        previous = None
+        for day in days:
+            index = position[day]
+            if previous is not None and index == previous + 1:
+                ranges[-1][1] = day
+            else:
+                ranges.append([day, day])
+            previous = index
+        return [tuple(bounds) for bounds in ranges]
+    
+    @staticmethod
+    def find(windows: Dict[str, Tuple[str, str]]) -> Dict[str, List[Tuple[str, str]]]:
+        """Missing business days of each currency within its window, coalesced into ranges"""
+        if not windows:
+            return {}
+        calendar = GapService.calendar(min(first for first, _ in windows.values()),
+                                       max(last for _, last in windows.values()))
+        missing = {}
+        for code, day in CurrencyRatesModel.get_missing_days(calendar, windows):
+            missing.setdefault(code, []).append(day)
+        return {code: GapService.coalesce(days, calendar) for code, days in missing.items()}
+    
+    @staticmethod
+    def merge(gaps: Dict[str, List[Tuple[str, str]]]) -> List[Tuple[date, date]]:
+        """Union of the gap ranges of all currencies, joined where no business day separates them"""
+        merged = []
+        for first, last in sorted({bounds for ranges in gaps.values() for bounds in ranges}):
+            start, end = date.fromisoformat(first), date.fromisoformat(last)
+            if merged and not nbp_calendar.business_days(merged[-1][1] + timedelta(days=1), start - timedelta(days=1)):
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        return [tuple(bounds) for bounds in merged]
+    
+    @staticmethod
+    def covers(ranges: List[Tuple[str, str]], day: str) -> bool:
+        """True when a day falls within one of the ascending, disjoint ranges"""
+        index = bisect_right(ranges, (day, '\uffff')) - 1
+        return index >= 0 and ranges[index][1] >= day
+    
+    @staticmethod
+    def unpublished(gaps: Dict[str, List[Tuple[str, str]]], tables: Dict[str, List[Tuple]],
+                    rates: List[Dict]) -> List[Tuple[str, str]]:
+        """Gap days left without a rate by a complete fetch of their ranges
         
-        return False
+        A day counts once every fetched table was published for it, or a later table was:
+        until then the missing rate may still come with the other table.
+        """
+        published = [{effective_date for _, effective_date in fetched} for fetched in tables.values()]
+        latest = max(set().union(*published), default=None)
+        if latest is None:
+            return []
+        complete = set.intersection(*published)
+        received = {(rate['code'], rate['date']) for rate in rates}
+        return [(code, day)
+                for code, ranges in gaps.items()
+                for first, last in ranges
+                for day in GapService.calendar(first, min(last, latest))
+                if (day < latest or day in complete) and (code, day) not in received]
+
+    @staticmethod
+    def missing_mid(currencies: List[str]) -> Dict[str, List[Tuple[str, str]]]:
+        """Stored rows of each currency still missing a mid rate, coalesced into ranges
+        
+        Rows dated off the business-day calendar (e.g. imported from archives) take part
+        in the coalescing like business days.
+        """
+        missing = {}
+        for code, day in CurrencyRatesModel.get_missing_mid_days(currencies):
+            missing.setdefault(code, []).append(day)
+        if not missing:
+            return {}
+        days = {day for code_days in missing.values() for day in code_days}
+        calendar = sorted(days.union(GapService.calendar(min(days), max(days))))
+        return {code: GapService.coalesce(code_days, calendar) for code, code_days in missing.items()}
+    
+    @staticmethod
+    def unresolved(missing: Dict[str, List[Tuple[str, str]]], tables: Dict[str, List[Tuple]],
+                   at: datetime = None) -> List[Tuple[str, str]]:
+        """Rows of the missing-mid ranges still without a mid rate after a complete fetch of Table A
+        
+        A row counts once a table dated on or after it was fetched, or the calendar says a
+        later Table A is already due (e.g. a row dated on a day NBP published no Table A);
+        until then the next Table A may still bring it.
+        """
+        latest = max((effective_date for fetched in tables.values() for _, effective_date in fetched), default='')
+        due = nbp_calendar.latest_publication_date('A', at).isoformat()
+        return [(code, day)
+                for code, day in CurrencyRatesModel.get_missing_mid_days(list(missing))
+                if (day <= latest or day < due) and GapService.covers(missing[code], day)]
+
+class IntegrityService:
+    """Integrity checks of the stored rates against the NBP publication calendar"""
+    
+    @staticmethod
+    def verify(currencies: List[str] = None, start_date: str = None, end_date: str = None) -> Dict:
+        """Gaps (business days without a row), rows dated off the calendar and rows missing values
+
+        Days confirmed as unpublished by a sync are not gaps.
+
+        Each currency is checked between its first and last stored date, clipped to
+        [start_date, end_date]. Duplicates cannot be stored: (currency_code, date) is unique.
+        """
+        stats = FreshnessService.refresh()
+        codes = currencies or sorted(code for code, entry in stats.items() if entry['row_count'])
+        ranges = {}
+        for code in codes:
+            entry = stats.get(code)
+            if not entry or not entry['row_count']:
+                continue
+            first = max(entry['first_date'], start_date) if start_date else entry['first_date']
+            last = min(entry['last_date'], end_date) if end_date else entry['last_date']
+            if first <= last:
+                ranges[code] = (first, last)
+        
+        report = {'currencies': {}, 'problems': 0}
+        if not ranges:
+            return report
+        start = min(first for first, _ in ranges.values())
+        end = max(last for _, last in ranges.values())
+        expected = GapService.calendar(start, end)
+        missing = {}
+        for code, day in CurrencyRatesModel.get_missing_days(expected, ranges):
+            missing.setdefault(code, []).append(day)
+        counts = CurrencyRatesModel.get_integrity_counts(expected, list(ranges), start, end)
+        
+        for code, (first, last) in ranges.items():
+            entry_counts = counts.get(code, {})
+            has_bid_ask = 'C' in (stats[code].get('tables') or '')
+            result = {
+                'first_date': first,
+                'last_date': last,
+                'rows': entry_counts.get('rows', 0),
+                'missing_dates': missing.get(code, []),
+                'gaps': GapService.coalesce(missing.get(code, []), expected),
+                'off_calendar': entry_counts.get('off_calendar', 0),
+                'missing_mid': entry_counts.get('missing_mid', 0),
+                'missing_bid_ask': entry_counts.get('missing_bid_ask', 0) if has_bid_ask else 0
+            }
+            report['currencies'][code] = result
+            report['problems'] += len(result['missing_dates']) + result['off_calendar']
+        return report
 
 class ChartDataService:
     """Service for preparing chart data"""
     
+    # Chart periods: key -> (label, days back from today)
+    PERIODS = {
+        '7days': ('7 Dni', 7),
+        '1month': ('1 Miesiąc', 30),
+        '6months': ('6 Miesięcy', 180),
+        '1year': ('1 Rok', 365),
+        '5years': ('5 Lat', 1825),
+        'all': ('Wszystkie dane', None)
+    }
+    
+    @staticmethod
+    def get_period_start(period: str) -> Optional[str]:
+        """Get the first date (YYYY-MM-DD) of a chart period, None for the full history"""
+        days = ChartDataService.PERIODS.get(period, (None, None))[1]
+        if days is None:
+            return None
+        return (datetime.now().date() - timedelta(days=days)).strftime('%Y-%m-%d')
+    
+    @staticmethod
+    def get_series(currency_code: str, period: str) -> RateSeries:
+        """Get the rate series of a currency for a period, from its snapshot file or the series cache"""
+        start_date = ChartDataService.get_period_start(period)
+        snapshot = SnapshotService.get(currency_code)
+        if snapshot is not None:
+            return snapshot.slice(start_date)
+        series = series_cache.get_series(currency_code, period, start_date)
+        if series is None:
+            generation = series_cache.generation
+            rows = CurrencyRatesModel.get_historical_rates(currency_code, start_date)
+            series = RateSeries.from_rows(currency_code, rows)
+            series_cache.put_series(period, start_date, series, generation)
+        return series
+    
+    @staticmethod
+    def downsample(series: RateSeries, target_points: int = CHART_TARGET_POINTS) -> Dict:
+        """Chart payload capped at target_points: an LTTB-selected mid line plus bid/ask OHLC candles
+
+        Short series are sent as daily points. Longer ones get the mid rate line reduced with
+        largest-triangle-three-buckets (points are picked on the bid/ask midpoint where mid is
+        missing) and bid/ask read as OHLC candles from the finest of the weekly, monthly or
+        yearly rollups within the target.
+        """
+        if len(series) <= target_points:
+            chart_data = series.to_chart_data()
+            chart_data['resolution'] = 'daily'
+            return chart_data
+        
+        import numpy as np
+        from analytics import RateAnalytics, to_list
+        from downsampling import lttb_indices, choose_granularity
+        
+        analytics = RateAnalytics(series)
+        days = analytics.days
+        reference = analytics.column('mid')
+        valid_rows = np.flatnonzero(~np.isnan(reference))
+        keep = valid_rows[lttb_indices(days[valid_rows].astype(np.float64), reference[valid_rows], target_points)]
+        
+        span_days = int(days[-1] - days[0]) + 1
+        granularity = choose_granularity(span_days, target_points)
+        candles = RollupService.get_candles(series.currency, granularity, RateAnalytics.day_string(days[0]),
+                                            RateAnalytics.day_string(days[-1]), ('bid', 'ask'))
+        
+        return {
+            'dates': [RateAnalytics.day_string(d) for d in days[keep].tolist()],
+            'mid': to_list(analytics.columns['mid'][keep]),
+            'currency': series.currency,
+            'resolution': granularity,
+            'ohlc': candles
+        }
+    
     @staticmethod
     def prepare_chart_data(rates_history: List, currency_code: str) -> Dict:
         """Prepare data for frontend charts"""
@@ -211,43 +893,650 @@ class ChartDataService:
         return None
     
     @staticmethod
-    def calculate_rate_changes(values_mid: List, values_bid: List, values_ask: List) -> Tuple[float, float, float]:
-        """Calculate current rate, change, and change percentage"""
-        if not values_mid and not values_bid:
-            return 0, 0, 0
+    def calculate_rate_changes(values_mid: List, values_bid: List = None,
+                               values_ask: List = None) -> Tuple[float, float, float]:
+        """Calculate current rate, change, and change percentage over the series
         
-        # Get current rate
-        current_rate = ChartDataService.get_last_valid_value(values_mid)
+        Rows without a mid rate (Table C stored before Table A was ingested) count with
+        the average of their bid and ask rates.
+        """
+        values = values_mid
+        if values_bid is not None and values_ask is not None:
+            values = [(bid + ask) / 2 if mid is None and bid is not None and ask is not None else mid
+                      for mid, bid, ask in zip(values_mid, values_bid, values_ask)]
+        current_rate = ChartDataService.get_last_valid_value(values)
         if current_rate is None:
-            # fallback to average of bid/ask
-            bid = ChartDataService.get_last_valid_value(values_bid)
-            ask = ChartDataService.get_last_valid_value(values_ask)
-            if bid is not None and ask is not None:
-                current_rate = (bid + ask) / 2
-            else:
-                current_rate = 0
+            return 0, 0, 0
         
-        # Calculate change
+        prev_rate = next((v for v in values if v is not None), None)
         change = 0
         change_percent = 0
-        data_points = len(values_mid) if values_mid else len(values_bid)
-        
-        if data_points > 1:
-            prev_rate = None
-            # Use first valid mid, else avg(bid,ask)
-            for i in range(data_points-1):
-                if values_mid and values_mid[i] is not None:
-                    prev_rate = values_mid[i]
-                    break
-            
-            if prev_rate is None and values_bid and values_ask:
-                bid = values_bid[0] if values_bid[0] is not None else 0
-                ask = values_ask[0] if values_ask[0] is not None else 0
-                if bid and ask:
-                    prev_rate = (bid + ask) / 2
-            
-            if prev_rate is not None and prev_rate != 0:
-                change = current_rate - prev_rate
-                change_percent = (change / prev_rate) * 100
+        if prev_rate:
+            change = current_rate - prev_rate
+            change_percent = (change / prev_rate) * 100
         
         return current_rate, change, change_percent
+
+class AnalyticsService:
+    """Rate analytics over cached series"""
+    
+    @staticmethod
+    def get_analytics(currency_code: str, period: str, field: str = 'mid',
+                      windows=None, include_series: bool = False) -> Dict:
+        """Summary statistics (and optionally indicator series) of a currency over a period"""
+        from analytics import RateAnalytics, DEFAULT_WINDOWS
+        
+        windows = windows or DEFAULT_WINDOWS
+        analytics = RateAnalytics(ChartDataService.get_series(currency_code, period))
+        result = analytics.summary(field, windows)
+        result['period'] = period
+        if include_series:
+            result['series'] = analytics.indicator_series(field, windows)
+        return result
+
+class RollupService:
+    """Reads over the pre-aggregated rollups, choosing the coarsest ones that fit a request"""
+    
+    # Coarsest first
+    GRANULARITIES = ('yearly', 'monthly', 'weekly')
+    
+    @staticmethod
+    def period_start(day: date, granularity: str) -> date:
+        """Start of the period containing a day"""
+        if granularity == 'weekly':
+            return day - timedelta(days=day.weekday())
+        if granularity == 'monthly':
+            return day.replace(day=1)
+        return day.replace(month=1, day=1)
+    
+    @staticmethod
+    def next_period_start(day: date, granularity: str) -> date:
+        """Start of the period following the one containing a day"""
+        start = RollupService.period_start(day, granularity)
+        if granularity == 'weekly':
+            return start + timedelta(days=7)
+        if granularity == 'monthly':
+            return (start + timedelta(days=32)).replace(day=1)
+        return start.replace(year=start.year + 1)
+    
+    @staticmethod
+    def plan(start: date, end: date, granularities: Tuple = GRANULARITIES) -> List[Tuple[str, date, date]]:
+        """Cover [start, end] with the coarsest whole periods available, daily rows at the edges
+
+        Returns chronologically ordered (granularity, first day, last day) segments, e.g. a range
+        of several years becomes daily + weekly + monthly + yearly + monthly + weekly + daily.
+        """
+        if start > end:
+            return []
+        if not granularities:
+            return [('daily', start, end)]
+        
+        granularity, finer = granularities[0], granularities[1:]
+        first = start if RollupService.period_start(start, granularity) == start \
+            else RollupService.next_period_start(start, granularity)
+        # Day after the last whole period ending within the range
+        stop = RollupService.period_start(end + timedelta(days=1), granularity)
+        if first >= stop:
+            return RollupService.plan(start, end, finer)
+        return (RollupService.plan(start, first - timedelta(days=1), finer)
+                + [(granularity, first, stop - timedelta(days=1))]
+                + RollupService.plan(stop, end, finer))
+    
+    @staticmethod
+    def get_candles(currency_code: str, granularity: str, start_date: str, end_date: str,
+                    fields: Tuple = ROLLUP_FIELDS) -> Dict:
+        """OHLC candles per field from the rollups overlapping [start_date, end_date]"""
+        rows = RateRollupModel.get_rollups(currency_code, granularity, start_date, end_date)
+        candles = {}
+        for field in fields:
+            candles[field] = {
+                'dates': [row['period_start'] for row in rows],
+                'open': [row[f'{field}_open'] for row in rows],
+                'high': [row[f'{field}_max'] for row in rows],
+                'low': [row[f'{field}_min'] for row in rows],
+                'close': [row[f'{field}_close'] for row in rows]
+            }
+        return candles
+    
+    @staticmethod
+    def range_stats(currency_code: str, start_date: str, end_date: str) -> Dict:
+        """Open/close/min/max/avg per field over a date range, combined from rollups
+
+        Whole years, months and weeks inside the range are read from their rollups and only
+        the partial periods at the edges are aggregated from daily rows.
+        """
+        start = datetime.strptime(start_date, '%Y-%m-%d').date()
+        end = datetime.strptime(end_date, '%Y-%m-%d').date()
+        segments = RollupService.plan(start, end)
+        
+        parts = []
+        for granularity, first, last in segments:
+            if granularity == 'daily':
+                row = RateRollupModel.get_range_aggregate(currency_code, first.isoformat(), last.isoformat())
+                parts.extend([row] if row else [])
+            else:
+                parts.extend(RateRollupModel.get_rollups(currency_code, granularity, first.isoformat(), last.isoformat()))
+        
+        result = {
+            'currency': currency_code,
+            'start': start_date,
+            'end': end_date,
+            'count': sum(part['count'] for part in parts),
+            'first_date': parts[0]['first_date'] if parts else None,
+            'last_date': parts[-1]['last_date'] if parts else None,
+            'segments': [{'granularity': g, 'start': f.isoformat(), 'end': l.isoformat()} for g, f, l in segments]
+        }
+        for field in ROLLUP_FIELDS:
+            valid = [part for part in parts if part[f'{field}_count']]
+            count = sum(part[f'{field}_count'] for part in valid)
+            result[field] = {
+                'open': valid[0][f'{field}_open'] if valid else None,
+                'close': valid[-1][f'{field}_close'] if valid else None,
+                'min': min((part[f'{field}_min'] for part in valid), default=None),
+                'max': max((part[f'{field}_max'] for part in valid), default=None),
+                'avg': sum(part[f'{field}_avg'] * part[f'{field}_count'] for part in valid) / count if count else None,
+                'count': count
+            }
+        return result
+    
+    @staticmethod
+    def get_rollups(currency_code: str, granularity: str, start_date: str, end_date: str,
+                    max_points: int = CHART_TARGET_POINTS) -> Dict:
+        """Rollup buckets of a range; granularity 'auto' picks the finest one within max_points"""
+        if granularity == 'auto':
+            from downsampling import choose_granularity
+            
+            start = datetime.strptime(start_date, '%Y-%m-%d').date()
+            end = datetime.strptime(end_date, '%Y-%m-%d').date()
+            granularity = choose_granularity((end - start).days + 1, max_points)
+        
+        rows = RateRollupModel.get_rollups(currency_code, granularity, start_date, end_date)
+        return {
+            'currency': currency_code,
+            'granularity': granularity,
+            'buckets': [{key: row[key] for key in row.keys() if key not in ('currency_code', 'granularity')}
+                        for row in rows],
+            'stats': RollupService.range_stats(currency_code, start_date, end_date)
+        }
+
+class ConversionService:
+    """Cross rates and amount conversion over an in-memory matrix of all stored rates"""
+    
+    _matrix = None
+    _matrix_version = None
+    _lock = threading.Lock()
+    
+    @staticmethod
+    def get_matrix() -> 'RateMatrix':
+        """Get the rate matrix, rebuilt when the stored data versions have changed"""
+        version = tuple(sorted((code, FreshnessService.entry_version(entry))
+                               for code, entry in FreshnessService.stats().items()))
+        matrix = ConversionService._matrix
+        if matrix is None or ConversionService._matrix_version != version:
+            with ConversionService._lock:
+                matrix = ConversionService._matrix
+                if matrix is None or ConversionService._matrix_version != version:
+                    from conversion import RateMatrix
+                    
+                    started = time.perf_counter()
+                    matrix = RateMatrix.from_rows(CurrencyRatesModel.get_all_rates())
+                    ConversionService._matrix = matrix
+                    ConversionService._matrix_version = version
+                    print(f"Rate matrix built: {len(matrix)} dates x {len(matrix.codes)} currencies "
+                          f"in {time.perf_counter() - started:.3f}s")
+        return matrix
+    
+    @staticmethod
+    def invalidate() -> None:
+        ConversionService._matrix = None
+    
+    @staticmethod
+    def convert(source: str, target: str, amounts: List[float], dates: List[str], method: str = 'mid') -> Dict:
+        """Convert amounts between currencies on the given dates (one date or one per amount)"""
+        from analytics import to_list
+        from conversion import date_list
+        
+        matrix = ConversionService.get_matrix()
+        result = matrix.convert(amounts, source, target, dates, method)
+        return {
+            'from': source.upper(),
+            'to': target.upper(),
+            'method': method,
+            'amounts': to_list(result['amount']),
+            'rates': to_list(result['rate']),
+            'rate_dates': date_list(result['rate_date'])
+        }
+    
+    @staticmethod
+    def cross(base: str, quote: str, dates: List[str] = None, start_date: str = None,
+              end_date: str = None) -> Dict:
+        """Cross rate of base/quote on given dates, or on every publication date of a range"""
+        import numpy as np
+        from analytics import to_list
+        from conversion import date_list
+        
+        matrix = ConversionService.get_matrix()
+        if dates is None:
+            dates = matrix.date_range(start_date, end_date)
+        rates = matrix.cross(base, quote, dates)
+        return {
+            'base': base.upper(),
+            'quote': quote.upper(),
+            'dates': date_list(np.atleast_1d(np.asarray(dates, dtype='datetime64[D]'))),
+            'mid': to_list(rates['mid']),
+            'bid': to_list(rates['bid']),
+            'ask': to_list(rates['ask']),
+            'rate_dates': date_list(rates['rate_date'])
+        }
+    
+    @staticmethod
+    def currencies() -> List[str]:
+        return ConversionService.get_matrix().codes
+
+class SnapshotService:
+    """Columnar snapshot files of each currency's history, written behind every ingest
+
+    A snapshot is valid for the rate_stats updated_at it was written for; reads fall back
+    to SQLite (and rebuild the file) when it is missing or older than the stats.
+    """
+    
+    @staticmethod
+    def path(currency_code: str) -> str:
+        directory = SNAPSHOT_DIR or os.path.splitext(os.path.abspath(DatabaseManager.get_pool().database))[0] + '_snapshots'
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, f"{currency_code}.rates")
+    
+    @staticmethod
+    def get(currency_code: str) -> Optional[RateSnapshot]:
+        """Mapped snapshot of a currency that matches its current stats, exported on first use"""
+        if not SNAPSHOTS_ENABLED:
+            return None
+        entry = FreshnessService.stats().get(currency_code)
+        if not entry or not entry['row_count']:
+            return None
+        path = SnapshotService.path(currency_code)
+        snapshot = snapshot_store.get(path, currency_code, entry['updated_at'])
+        if snapshot is None:
+            snapshot = SnapshotService.export(currency_code, entry)
+        return snapshot
+    
+    @staticmethod
+    def export(currency_code: str, entry: Dict, after: Optional[RateSnapshot] = None) -> Optional[RateSnapshot]:
+        """Write a currency's snapshot for its stats entry
+
+        With `after`, only rows later than that snapshot are read and appended to its file in
+        place, as long as the result accounts for every stored row and the file has room for
+        them; otherwise the whole history is rewritten.
+        """
+        path = SnapshotService.path(currency_code)
+        try:
+            if after is not None:
+                next_day = (date.fromordinal(after.days[-1]) + timedelta(days=1)).isoformat()
+                rows = CurrencyRatesModel.get_historical_rates(currency_code, next_day)
+                if after.count + len(rows) == entry['row_count']:
+                    snapshot = snapshot_store.append(path, after, RateSeries.from_rows(currency_code, rows),
+                                                     entry['updated_at'])
+                    if snapshot is not None:
+                        return snapshot
+            rows = CurrencyRatesModel.get_historical_rates(currency_code)
+            return snapshot_store.put(path, RateSeries.from_rows(currency_code, rows), entry['updated_at'])
+        except OSError as e:
+            print(f"Could not write the {currency_code} snapshot: {e}")
+            return None
+    
+    @staticmethod
+    def update(currencies: List[str], ranges: Dict[str, Tuple[str, str]] = None) -> None:
+        """Bring the snapshots of freshly ingested currencies up to date
+
+        Rows written after a snapshot's last day are appended to it; anything else
+        (updates of older rows) re-exports the currency.
+        """
+        if not SNAPSHOTS_ENABLED:
+            return
+        stats = RateStatsModel.get_all()
+        for code in currencies:
+            entry = stats.get(code)
+            if not entry:
+                continue
+            previous = snapshot_store.get(SnapshotService.path(code), code)
+            first_written = (ranges or {}).get(code, (None, None))[0]
+            appendable = (previous is not None and previous.last_date is not None
+                          and first_written is not None and first_written > previous.last_date)
+            SnapshotService.export(code, entry, previous if appendable else None)
+
+class FreshnessService:
+    """In-process copy of the per-currency stats and freshness decisions on the NBP calendar
+
+    The copy is re-read from rate_stats after every ingest of this process and at most
+    DATA_VERSION_REFRESH seconds apart otherwise, so deciding whether data is current
+    never touches the rates table.
+    """
+    
+    _stats = {}
+    _loaded_at = None
+    _lock = threading.Lock()
+    
+    @staticmethod
+    def stats() -> Dict[str, Dict]:
+        """Stats per currency: row_count, first_date, last_date, currency_name, tables, updated_at, synced_at"""
+        loaded_at = FreshnessService._loaded_at
+        if loaded_at is None or time.monotonic() - loaded_at > DATA_VERSION_REFRESH:
+            FreshnessService.refresh()
+        return FreshnessService._stats
+    
+    @staticmethod
+    def refresh() -> Dict[str, Dict]:
+        """Re-read the stats; drop cached series and payloads of currencies whose data changed"""
+        stats = RateStatsModel.get_all()
+        with FreshnessService._lock:
+            previous = FreshnessService._stats
+            changed = [code for code, entry in stats.items()
+                       if FreshnessService.entry_version(previous.get(code)) != FreshnessService.entry_version(entry)]
+            FreshnessService._stats = stats
+            FreshnessService._loaded_at = time.monotonic()
+        if changed:
+            series_cache.invalidate_currencies(changed)
+            payload_cache.invalidate(lambda key: key[0] in changed)
+            response_cache.clear()
+        return stats
+    
+    @staticmethod
+    def invalidate() -> None:
+        """Force a re-read on next use"""
+        FreshnessService._loaded_at = None
+    
+    @staticmethod
+    def entry_version(entry: Optional[Dict]) -> Optional[str]:
+        """Data version of one currency: changes on every write, including in-place updates
+        (e.g. Table A mid rates filled into rows stored from Table C)"""
+        if not entry or not entry['row_count']:
+            return None
+        return f"{entry['last_date']}/{entry['row_count']}/{entry['updated_at']!r}"
+    
+    @staticmethod
+    def version(currency_code: str = None) -> Optional[str]:
+        """Data version of a currency, or of all stored rates"""
+        stats = FreshnessService.stats()
+        if currency_code:
+            return FreshnessService.entry_version(stats.get(currency_code))
+        if not stats:
+            return None
+        last_date = max((entry['last_date'] for entry in stats.values() if entry['last_date']), default=None)
+        updated_at = max((entry['updated_at'] for entry in stats.values() if entry['updated_at']), default=None)
+        return f"{last_date}/{sum(entry['row_count'] for entry in stats.values())}/{updated_at!r}"
+    
+    @staticmethod
+    def latest_dates() -> Dict[str, str]:
+        """Latest stored date per currency"""
+        return {code: entry['last_date'] for code, entry in FreshnessService.stats().items() if entry['last_date']}
+    
+    @staticmethod
+    def parse_date(value: Optional[str]) -> Optional[date]:
+        return datetime.strptime(value, '%Y-%m-%d').date() if value else None
+    
+    @staticmethod
+    def table_of(currency_code: str) -> str:
+        """Earliest published table quoting the currency: C (bid/ask) if it is in Table C, else A"""
+        entry = FreshnessService.stats().get(currency_code)
+        return 'A' if entry and entry.get('tables') == 'A' else 'C'
+    
+    @staticmethod
+    def is_stale(currency_code: str, table: str = None, at: datetime = None) -> bool:
+        """True when a table (by default the currency's own) was due since its latest stored date"""
+        entry = FreshnessService.stats().get(currency_code)
+        latest = FreshnessService.parse_date(entry['last_date']) if entry else None
+        table = table or FreshnessService.table_of(currency_code)
+        return latest is None or latest < nbp_calendar.latest_publication_date(table, at)
+    
+    @staticmethod
+    def stale_currencies(currencies: Iterable[str], table: str = None, at: datetime = None) -> List[str]:
+        return [code for code in currencies if FreshnessService.is_stale(code, table, at)]
+    
+    @staticmethod
+    def status(currencies: Iterable[str]) -> Dict:
+        """Freshness report of the given currencies"""
+        expected = {table: nbp_calendar.latest_publication_date(table) for table in ('A', 'C')}
+        stats = FreshnessService.stats()
+        report = {}
+        for code in currencies:
+            entry = stats.get(code, {})
+            synced_at = entry.get('synced_at')
+            report[code] = {
+                'row_count': entry.get('row_count', 0),
+                'first_date': entry.get('first_date'),
+                'last_date': entry.get('last_date'),
+                'last_synced': datetime.fromtimestamp(synced_at).isoformat(timespec='seconds') if synced_at else None,
+                'table': FreshnessService.table_of(code),
+                'stale': FreshnessService.is_stale(code)
+            }
+        return {
+            'expected_dates': {table: day.isoformat() for table, day in expected.items()},
+            'business_day': nbp_calendar.is_business_day(nbp_calendar.now().date()),
+            'currencies': report
+        }
+
+class PayloadService:
+    """Precomputed, serialized read payloads with ETags derived from the stored data versions"""
+    
+    @staticmethod
+    def latest_dates() -> Dict[str, str]:
+        """Latest stored date per currency, kept in memory between refreshes"""
+        return FreshnessService.latest_dates()
+    
+    @staticmethod
+    def invalidate(currencies: List[str]) -> None:
+        """Drop payloads of the given currencies and force a stats refresh"""
+        codes = set(currencies)
+        payload_cache.invalidate(lambda key: key[0] in codes)
+        response_cache.clear()
+        FreshnessService.invalidate()
+    
+    @staticmethod
+    def make_etag(*parts) -> str:
+        """Build a short, stable ETag value from its parts"""
+        return hashlib.sha1('|'.join(str(p) for p in parts).encode('utf-8')).hexdigest()[:20]
+    
+    @staticmethod
+    def last_modified(currency_code: str = None) -> Optional[datetime]:
+        """Time of the latest write (of a currency or overall) as a naive UTC Last-Modified timestamp
+
+        Writes that only update stored rows move it too, so If-Modified-Since revalidates them.
+        """
+        stats = FreshnessService.stats()
+        entries = [stats.get(currency_code)] if currency_code else stats.values()
+        updated_at = max((entry['updated_at'] for entry in entries if entry and entry['updated_at']), default=None)
+        if updated_at is None:
+            return None
+        # HTTP dates have a resolution of one second
+        return datetime.fromtimestamp(int(updated_at), timezone.utc).replace(tzinfo=None)
+    
+    @staticmethod
+    def is_not_modified(etag: str, last_modified: Optional[datetime], if_none_match: Optional[str],
+                        if_modified_since: Optional[str]) -> bool:
+        """Whether a conditional GET's raw If-None-Match / If-Modified-Since headers match the
+        current representation (shared by the Flask and the ASGI routes)
+
+        If-None-Match takes precedence; If-Modified-Since is only compared when it is absent.
+        """
+        if if_none_match:
+            tags = {tag.strip().removeprefix('W/').strip('"') for tag in if_none_match.split(',')}
+            return etag in tags or '*' in tags
+        if not (last_modified and if_modified_since):
+            return False
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is not None:
+            since = since.astimezone(timezone.utc).replace(tzinfo=None)
+        return since >= last_modified
+    
+    @staticmethod
+    def cache_headers(etag: str, last_modified: Optional[datetime] = None) -> Dict[str, str]:
+        """Validator headers of a read response; clients must revalidate, answered with 304 when unchanged"""
+        headers = {'ETag': f'"{etag}"', 'Cache-Control': 'no-cache'}
+        if last_modified:
+            headers['Last-Modified'] = format_datetime(last_modified.replace(tzinfo=timezone.utc), usegmt=True)
+        return headers
+    
+    @staticmethod
+    def chart_etag(currency_code: str, period: str, *extra) -> str:
+        """ETag of the dashboard view; the period window moves daily, so today is included"""
+        version = FreshnessService.version(currency_code)
+        return PayloadService.make_etag('chart', currency_code, period, version,
+                                        datetime.now().date().isoformat(), *extra)
+    
+    @staticmethod
+    def rates_etag(currency_code: str, query: str) -> str:
+        """ETag of an /api/rates response"""
+        version = FreshnessService.version(currency_code.upper() if currency_code else None)
+        return PayloadService.make_etag('rates', query, version)
+    
+    @staticmethod
+    def build_chart_payload(currency_code: str, period: str) -> Dict:
+        """Serialize chart data and precompute the dashboard statistics"""
+        from analytics import RateAnalytics
+        
+        series = ChartDataService.get_series(currency_code, period)
+        if not len(series):
+            return {'points': 0}
+        
+        chart_data = series.to_chart_data()
+        current_rate, change, change_percent = ChartDataService.calculate_rate_changes(
+            chart_data['mid'], chart_data['bid'], chart_data['ask'])
+        downsampled = ChartDataService.downsample(series)
+        return {
+            'points': len(series),
+            'chart_points': len(downsampled['dates']),
+            'resolution': downsampled['resolution'],
+            'chart_json': json.dumps(downsampled),
+            'first_date': chart_data['dates'][0],
+            'last_date': chart_data['dates'][-1],
+            'current_rate': current_rate,
+            'change': change,
+            'change_percent': change_percent,
+            'current_bid': ChartDataService.get_last_valid_value(chart_data['bid']),
+            'current_ask': ChartDataService.get_last_valid_value(chart_data['ask']),
+            'analytics': RateAnalytics(series).summary()
+        }
+    
+    @staticmethod
+    def embed_json(fields: Dict, **encoded: str) -> str:
+        """JSON object of `fields` followed by members given as already-encoded JSON text"""
+        members = [f'{json.dumps(key)}: {json.dumps(value)}' for key, value in fields.items()]
+        members += [f'{json.dumps(key)}: {value}' for key, value in encoded.items()]
+        return '{' + ', '.join(members) + '}'
+    
+    @staticmethod
+    def get_chart_json(currency_code: str, period: str, etag: str) -> bytes:
+        """JSON body of /api/chart, embedding the pre-serialized chart data without re-encoding it"""
+        body = response_cache.get(etag)
+        if body is None:
+            payload = PayloadService.get_chart_payload(currency_code, period)
+            meta = {key: value for key, value in payload.items() if key != 'chart_json'}
+            meta.update(currency=currency_code, period=period)
+            data = PayloadService.embed_json(meta, chart=payload.get('chart_json', 'null'))
+            body = PayloadService.embed_json({'status': 'success'}, data=data).encode('utf-8')
+            response_cache.put(etag, body, len(body))
+        return body
+    
+    @staticmethod
+    def get_chart_payload(currency_code: str, period: str) -> Dict:
+        """Get the precomputed chart payload, building it on a miss"""
+        key = (currency_code, period, ChartDataService.get_period_start(period))
+        payload = payload_cache.get(key)
+        if payload is None:
+            payload = PayloadService.build_chart_payload(currency_code, period)
+            payload_cache.put(key, payload, len(payload.get('chart_json', '')) + 256)
+        return payload
+    
+    @staticmethod
+    def precompute(currencies: List[str]) -> int:
+        """Build payloads for every currency and chart period (run at ingest time)"""
+        FreshnessService.refresh()
+        count = 0
+        for currency in currencies:
+            for period in ChartDataService.PERIODS:
+                PayloadService.get_chart_payload(currency, period)
+                count += 1
+        return count
+
+class RatesExportService:
+    """Serialization of rate rows for /api/rates: JSON rows, columnar JSON, NDJSON and CSV"""
+    
+    FIELDS = ('id', 'currency_code', 'currency_name', 'mid_rate', 'bid_rate', 'ask_rate', 'date')
+    FORMATS = ('json', 'columnar', 'ndjson', 'csv')
+    
+    @staticmethod
+    def to_dict(row) -> Dict:
+        return {field: row[field] for field in RatesExportService.FIELDS}
+    
+    @staticmethod
+    def get_body(currency_code: Optional[str], limit: int, start_date: Optional[str], end_date: Optional[str],
+                 after: Optional[Tuple[str, int]], output_format: str, etag: str) -> bytes:
+        """Serialized json/columnar /api/rates response, cached under its ETag"""
+        body = response_cache.get(etag)
+        if body is None:
+            rates = CurrencyRatesModel.get_rates_with_filters(currency_code, limit, start_date, end_date, after)
+            next_cursor = CurrencyRatesModel.encode_cursor(rates[-1]) if limit and len(rates) == limit else None
+            
+            if output_format == 'columnar':
+                payload = RatesExportService.to_columnar(rates, next_cursor, with_currency=not currency_code)
+            else:
+                payload = RatesExportService.to_json(rates, next_cursor)
+            
+            body = json.dumps(payload).encode('utf-8')
+            response_cache.put(etag, body, len(body))
+        return body
+    
+    @staticmethod
+    def to_json(rows: List, next_cursor: Optional[str]) -> Dict:
+        """Row-oriented payload (the default /api/rates format)"""
+        payload = {
+            'status': 'success',
+            'count': len(rows),
+            'data': [RatesExportService.to_dict(row) for row in rows]
+        }
+        if next_cursor:
+            payload['next_cursor'] = next_cursor
+        return payload
+    
+    @staticmethod
+    def to_columnar(rows: List, next_cursor: Optional[str], with_currency: bool = True) -> Dict:
+        """Compact column-oriented payload: {"dates": [...], "mid": [...], "bid": [...], "ask": [...]}"""
+        payload = {
+            'status': 'success',
+            'count': len(rows),
+            'dates': [row['date'] for row in rows],
+            'mid': [row['mid_rate'] for row in rows],
+            'bid': [row['bid_rate'] for row in rows],
+            'ask': [row['ask_rate'] for row in rows]
+        }
+        if with_currency:
+            payload['currency_code'] = [row['currency_code'] for row in rows]
+        if next_cursor:
+            payload['next_cursor'] = next_cursor
+        return payload
+    
+    @staticmethod
+    def stream_ndjson(rows: Iterable):
+        """Yield one JSON document per line, walking the rows lazily"""
+        for row in rows:
+            yield json.dumps(RatesExportService.to_dict(row), ensure_ascii=False) + '\n'
+    
+    @staticmethod
+    def stream_csv(rows: Iterable, batch_size: int = 500):
+        """Yield CSV text (header first) in batches, walking the rows lazily"""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(RatesExportService.FIELDS)
+        pending = 0
+        for row in rows:
+            writer.writerow([row[field] for field in RatesExportService.FIELDS])
+            pending += 1
+            if pending >= batch_size:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+                pending = 0
+        yield buffer.getvalue()
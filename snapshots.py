@@ -0,0 +1,236 @@
+"""
+Storage Layer - Columnar rate snapshot files
+Each currency's history is exported after ingest into a compact binary file that is opened
+with mmap: rate series are sliced from it by binary search on the day column, without
+queries, row objects or copies.
+
+File layout (one file per currency, <CODE>.rates):
+
+    header   32 bytes: magic, format version, byte order, row count, capacity, stats updated_at
+    days     int32[capacity]    date ordinals, ascending (the first `count` are used)
+    padding  to an 8-byte boundary
+    mid      float64[capacity]  NaN marks a missing value
+    bid      float64[capacity]
+    ask      float64[capacity]
+
+Columns are allocated with room for SNAPSHOT_RESERVE_ROWS more rows, so new days are
+appended in place (the new values, then the header) and a file is only rewritten when
+older rows change or the room runs out.
+"""
+
+import mmap
+import os
+import struct
+import sys
+import threading
+from bisect import bisect_left, bisect_right
+from datetime import date
+from typing import Dict, Optional
+
+from cache import RateSeries
+
+# Set SNAPSHOTS_ENABLED=0 to serve every read from SQLite
+SNAPSHOTS_ENABLED = os.environ.get('SNAPSHOTS_ENABLED', '1') != '0'
+# Directory of the snapshot files (default: <database name>_snapshots next to the database)
+SNAPSHOT_DIR = os.environ.get('SNAPSHOT_DIR')
+
+# Rows of room left after the data when a file is (re)written - about a year of business days
+SNAPSHOT_RESERVE_ROWS = int(os.environ.get('SNAPSHOT_RESERVE_ROWS', 256))
+
+MAGIC = b'NBPR'
+FORMAT_VERSION = 2
+# magic, version, byte order (0 little, 1 big), reserved, count, capacity, updated_at, padding
+HEADER = struct.Struct('<4sBBHIId8x')
+BYTE_ORDER = 0 if sys.byteorder == 'little' else 1
+FIELDS = ('mid', 'bid', 'ask')
+
+
+def float_offset(capacity: int) -> int:
+    """Offset of the first float column (8-byte aligned, so it can be viewed in place)"""
+    offset = HEADER.size + 4 * capacity
+    return offset + (-offset % 8)
+
+
+def column_offsets(capacity: int) -> Dict[str, int]:
+    """Offset of each column in a file with the given capacity"""
+    offsets = {'days': HEADER.size}
+    offset = float_offset(capacity)
+    for field in FIELDS:
+        offsets[field] = offset
+        offset += 8 * capacity
+    return offsets
+
+
+class RateSnapshot:
+    """Read-only, memory-mapped snapshot of one currency's rate history"""
+
+    __slots__ = ('currency', 'count', 'capacity', 'updated_at', 'days', 'mid', 'bid', 'ask', '_mmap')
+
+    def __init__(self, currency: str, mapped: mmap.mmap):
+        magic, version, byte_order, _, count, capacity, updated_at = HEADER.unpack_from(mapped)
+        if magic != MAGIC or version != FORMAT_VERSION or byte_order != BYTE_ORDER or count > capacity:
+            raise ValueError(f"Unsupported snapshot format for {currency}")
+        if len(mapped) < float_offset(capacity) + 8 * capacity * len(FIELDS):
+            raise ValueError(f"Truncated snapshot for {currency}")
+        self.currency = currency
+        self.count = count
+        self.capacity = capacity
+        self.updated_at = updated_at
+        self._mmap = mapped
+        # Typed views over the used part of the mapping - nothing is read until it is used
+        view = memoryview(mapped)
+        offsets = column_offsets(capacity)
+        self.days = view[offsets['days']:offsets['days'] + 4 * count].cast('i')
+        for field in FIELDS:
+            setattr(self, field, view[offsets[field]:offsets[field] + 8 * count].cast('d'))
+
+    @classmethod
+    def open(cls, path: str, currency: str) -> Optional['RateSnapshot']:
+        """Map a snapshot file; None if it does not exist or cannot be used"""
+        try:
+            with open(path, 'rb') as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):  # missing or empty file
+            return None
+        try:
+            return cls(currency, mapped)
+        except (ValueError, struct.error) as e:
+            print(f"Ignoring snapshot {path}: {e}")
+            return None
+
+    def __len__(self) -> int:
+        return self.count
+
+    @property
+    def last_date(self) -> Optional[str]:
+        return date.fromordinal(self.days[-1]).isoformat() if self.count else None
+
+    def slice(self, start_date: str = None, end_date: str = None) -> RateSeries:
+        """Rates within [start_date, end_date] as a series of views into the mapping"""
+        first = bisect_left(self.days, date.fromisoformat(start_date).toordinal()) if start_date else 0
+        last = bisect_right(self.days, date.fromisoformat(end_date).toordinal()) if end_date else self.count
+        return RateSeries(self.currency, self.days[first:last], self.mid[first:last],
+                          self.bid[first:last], self.ask[first:last])
+
+
+def write_snapshot(path: str, series: RateSeries, updated_at: float) -> None:
+    """Write a series to a new snapshot file, atomically replacing the previous one
+
+    Readers that still map the previous file keep a valid view of it. A failed write
+    leaves no temporary file behind.
+    """
+    count = len(series)
+    capacity = count + SNAPSHOT_RESERVE_ROWS
+    offsets = column_offsets(capacity)
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(temp_path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, FORMAT_VERSION, BYTE_ORDER, 0, count, capacity, updated_at))
+            for column in ('days',) + FIELDS:
+                f.seek(offsets[column])
+                f.write(memoryview(getattr(series, column)).cast('B'))
+            # The unused room reads as zeros, up to the end of the last column
+            f.truncate(offsets[FIELDS[-1]] + 8 * capacity)
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+def append_snapshot(path: str, snapshot: RateSnapshot, series: RateSeries, updated_at: float) -> bool:
+    """Append later rows to a snapshot file in place; False when the file has no room for them
+
+    Only the new values and the header are written. The header goes last, so readers
+    mapping the file see either the previous rows or all of them. Nothing is written
+    unless the file is still the one `snapshot` maps (same count, capacity and updated_at).
+    """
+    count = snapshot.count + len(series)
+    if count > snapshot.capacity:
+        return False
+    offsets = column_offsets(snapshot.capacity)
+    with open(path, 'r+b') as f:
+        header = HEADER.unpack(f.read(HEADER.size))
+        if header[4:] != (snapshot.count, snapshot.capacity, snapshot.updated_at):
+            return False
+        f.seek(offsets['days'] + 4 * snapshot.count)
+        f.write(memoryview(series.days).cast('B'))
+        for field in FIELDS:
+            f.seek(offsets[field] + 8 * snapshot.count)
+            f.write(memoryview(getattr(series, field)).cast('B'))
+        f.flush()
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, BYTE_ORDER, 0, count, snapshot.capacity, updated_at))
+    return True
+
+
+class SnapshotStore:
+    """Snapshots opened by this process, keyed by path and reopened when their data changed"""
+
+    def __init__(self):
+        self._snapshots: Dict[str, RateSnapshot] = {}
+        self._lock = threading.Lock()
+        self.opens = 0
+        self.writes = 0
+        self.appends = 0
+
+    def get(self, path: str, currency: str, updated_at: Optional[float] = None) -> Optional[RateSnapshot]:
+        """Snapshot at path, or None when missing or not written for the given stats updated_at"""
+        snapshot = self._snapshots.get(path)
+        if snapshot is None or (updated_at is not None and snapshot.updated_at != updated_at):
+            # Another process may have written a newer file since it was mapped here
+            snapshot = RateSnapshot.open(path, currency)
+            with self._lock:
+                self.opens += 1
+                if snapshot is None:
+                    self._snapshots.pop(path, None)
+                else:
+                    self._snapshots[path] = snapshot
+        if snapshot is None or (updated_at is not None and snapshot.updated_at != updated_at):
+            return None
+        return snapshot
+
+    def put(self, path: str, series: RateSeries, updated_at: float) -> Optional[RateSnapshot]:
+        """Write a series to a new file and map it"""
+        write_snapshot(path, series, updated_at)
+        with self._lock:
+            self.writes += 1
+        return self._remap(path, series.currency)
+
+    def append(self, path: str, snapshot: RateSnapshot, series: RateSeries,
+               updated_at: float) -> Optional[RateSnapshot]:
+        """Append later rows to a mapped snapshot in place and map the result; None if it has no room"""
+        if not append_snapshot(path, snapshot, series, updated_at):
+            return None
+        with self._lock:
+            self.appends += 1
+        return self._remap(path, snapshot.currency)
+
+    def _remap(self, path: str, currency: str) -> Optional[RateSnapshot]:
+        snapshot = RateSnapshot.open(path, currency)
+        with self._lock:
+            if snapshot is None:
+                self._snapshots.pop(path, None)
+            else:
+                self._snapshots[path] = snapshot
+        return snapshot
+
+    def clear(self) -> None:
+        with self._lock:
+            self._snapshots.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'enabled': SNAPSHOTS_ENABLED,
+                'entries': len(self._snapshots),
+                'bytes': sum(len(snapshot._mmap) for snapshot in self._snapshots.values()),
+                'opens': self.opens,
+                'writes': self.writes,
+                'appends': self.appends
+            }
+
+
+snapshot_store = SnapshotStore()
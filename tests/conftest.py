@@ -0,0 +1,61 @@
+"""
+Shared fixtures: a throwaway database and the local stand-ins for the upstream APIs
+Run from the project root:  python -m pytest
+"""
+
+import os
+import sys
+
+import pytest
+
+# The modules live in the project root, next to this directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fake_coingecko_server
+import fake_nbp_server
+import models
+import services
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    """Application on an empty, migrated database in a temporary directory"""
+    from app import create_app
+    from cache import series_cache, payload_cache, response_cache
+
+    monkeypatch.setattr(models, 'DATABASE', str(tmp_path / 'rates.db'))
+    application = create_app(warm_cache=False)
+    with application.app_context():
+        yield application
+    series_cache.clear()
+    payload_cache.clear()
+    response_cache.clear()
+    services.FreshnessService.invalidate()
+    models.DatabaseManager.get_pool().close_all()
+
+
+@pytest.fixture
+def nbp_server(monkeypatch):
+    """Factory starting a fake NBP API (options as in FakeNBPServer) that services talk to"""
+    servers = []
+
+    def start(**options):
+        server = fake_nbp_server.start_background(**options)
+        servers.append(server)
+        monkeypatch.setattr(services, 'NBP_API_URL', server.base_url)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def coingecko_server(monkeypatch):
+    """Fake CoinGecko markets API that services talk to"""
+    server = fake_coingecko_server.start_background()
+    monkeypatch.setattr(services, 'CRYPTO_API_URL', server.markets_url)
+    yield server
+    server.shutdown()
+    server.server_close()
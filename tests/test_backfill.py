@@ -0,0 +1,118 @@
+"""NBPBackfillEngine against the local NBP stand-in (fake_nbp_server)"""
+
+from datetime import date, timedelta
+
+import nbp_calendar
+from models import CurrencyRatesModel, DatabaseManager
+from services import NBPBackfillEngine, NBPService
+
+
+def business_days(start: date, end: date):
+    return [day.isoformat() for day in nbp_calendar.business_days(start, end)]
+
+
+def effective_dates(tables):
+    return [effective_date for _, effective_date in tables]
+
+
+def test_split_range_covers_range_in_chunks():
+    engine = NBPBackfillEngine(chunk_days=30)
+    chunks = engine.split_range(date(2024, 1, 1), date(2024, 3, 31))
+
+    assert chunks[0][0] == date(2024, 1, 1)
+    assert chunks[-1][1] == date(2024, 3, 31)
+    for (_, end), (next_start, _) in zip(chunks, chunks[1:]):
+        assert next_start == end + timedelta(days=1)
+    assert all((end - start).days <= 30 for start, end in chunks)
+
+
+def test_fetch_ranges_requests_each_chunk_once(nbp_server):
+    server = nbp_server()
+    engine = NBPBackfillEngine(chunk_days=30)
+    ranges = [(date(2024, 1, 1), date(2024, 3, 31)), (date(2024, 6, 1), date(2024, 6, 30))]
+
+    tables = engine.fetch_ranges(ranges, ('A', 'C'))
+
+    chunks = sum(len(engine.split_range(start, end)) for start, end in ranges)
+    assert server.requests_served == 2 * chunks
+    assert engine.stats.chunks == 2 * chunks
+    expected = business_days(*ranges[0]) + business_days(*ranges[1])
+    for table in ('A', 'C'):
+        assert effective_dates(tables[table]) == expected
+
+
+def test_empty_range_answered_with_404(nbp_server):
+    nbp_server()
+    engine = NBPBackfillEngine()
+
+    # A weekend: no table was published
+    tables = engine.fetch(date(2024, 1, 6), date(2024, 1, 7), ('A',))
+
+    assert tables == {'A': []}
+    assert engine.stats.chunks == 1
+    assert engine.stats.failed_chunks == 0
+
+
+def test_failed_chunk_is_split_and_retried(nbp_server):
+    server = nbp_server(fail_over_days=200)
+    engine = NBPBackfillEngine(min_chunk_days=30)
+
+    tables = engine.fetch(date(2024, 1, 1), date(2024, 12, 31), ('A',))
+
+    assert engine.stats.splits == 1
+    assert engine.stats.failed_chunks == 0
+    assert engine.stats.chunks == 2
+    assert server.requests_served > 3
+    assert effective_dates(tables['A']) == business_days(date(2024, 1, 1), date(2024, 12, 31))
+
+
+def test_chunk_failing_at_minimum_size_is_reported(nbp_server):
+    nbp_server(fail_over_days=5)
+    engine = NBPBackfillEngine(chunk_days=20, min_chunk_days=30)
+
+    tables = engine.fetch(date(2024, 1, 1), date(2024, 1, 21), ('A',))
+
+    assert tables == {'A': []}
+    assert engine.stats.splits == 0
+    assert engine.stats.failed_chunks == 1
+
+
+def test_rate_limited_requests_back_off_and_succeed(nbp_server):
+    server = nbp_server(rate_limit=3)
+    engine = NBPBackfillEngine(chunk_days=9)
+    start, end = date(2024, 1, 1), date(2024, 2, 29)
+
+    tables = engine.fetch(start, end, ('A',))
+
+    chunks = len(engine.split_range(start, end))
+    assert engine.stats.failed_chunks == 0
+    assert engine.stats.chunks == chunks
+    # 429 answers were retried after Retry-After
+    assert server.requests_served > chunks
+    assert effective_dates(tables['A']) == business_days(start, end)
+
+
+def test_upsert_counts_of_fetched_tables(app, nbp_server):
+    nbp_server()
+    start, end = date(2024, 3, 1), date(2024, 3, 31)
+    days = business_days(start, end)
+    tables = NBPBackfillEngine().fetch(start, end, ('A', 'C'))
+
+    counts = CurrencyRatesModel.upsert_rates(NBPService.merge_tables(tables, ['USD', 'EUR']), chunk_size=7)
+    assert counts['inserted'] == 2 * len(days)
+    assert counts['updated'] == 0
+    assert counts['currencies'] == ['EUR', 'USD']
+    assert counts['ranges']['USD'] == (days[0], days[-1])
+
+    # The same tables again write nothing
+    counts = CurrencyRatesModel.upsert_rates(NBPService.merge_tables(tables, ['USD', 'EUR']))
+    assert (counts['inserted'], counts['updated'], counts['currencies']) == (0, 0, [])
+
+    # Table A fills mid rates into existing rows (counted as updates, bid/ask are kept)
+    db = DatabaseManager.get_db()
+    db.execute("UPDATE rates SET mid_rate = NULL WHERE currency_code = 'USD' AND date <= ?", (days[4],))
+    db.commit()
+    counts = CurrencyRatesModel.upsert_rates(NBPService.merge_tables({'A': tables['A']}, ['USD']))
+    assert (counts['inserted'], counts['updated']) == (0, 5)
+    assert counts['currencies'] == ['USD']
+    assert db.execute("SELECT COUNT(*) FROM rates WHERE mid_rate IS NULL OR bid_rate IS NULL").fetchone()[0] == 0
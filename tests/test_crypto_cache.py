@@ -0,0 +1,121 @@
+"""RefreshingCache in front of the local CoinGecko stand-in (fake_coingecko_server)"""
+
+import threading
+import time
+
+import pytest
+
+from cache import RefreshingCache
+from models import CryptoSnapshotModel
+from services import CryptocurrencyService
+
+
+def make_cache(**options) -> RefreshingCache:
+    """Cache over the CoinGecko markets request, falling back to the SQLite snapshot"""
+    options.setdefault('ttl', 60)
+    options.setdefault('stale_ttl', 3600)
+    return RefreshingCache(CryptocurrencyService.fetch_upstream, fallback=CryptocurrencyService.load_snapshot,
+                           **options)
+
+
+def wait_for(condition, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            pytest.fail("condition not met in time")
+        time.sleep(0.01)
+
+
+def get_concurrently(cache: RefreshingCache, key, count: int):
+    results = [None] * count
+    barrier = threading.Barrier(count)
+
+    def get(index):
+        barrier.wait()
+        results[index] = cache.get(key)
+
+    threads = [threading.Thread(target=get, args=(index,)) for index in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_fresh_entry_is_served_without_upstream_calls(app, coingecko_server):
+    cache = make_cache()
+
+    coins, info = cache.get(5)
+    assert len(coins) == 5 and info['source'] == 'fresh'
+    assert [cache.get(5)[1]['source'] for _ in range(3)] == ['fresh'] * 3
+
+    assert coingecko_server.requests_served == 1
+    assert cache.counters['loads'] == 1
+    assert cache.counters['fresh_hits'] == 3
+
+
+def test_stale_entry_is_served_while_one_refresh_runs(app, coingecko_server):
+    cache = make_cache(ttl=0.2)
+    cache.get(5)
+    time.sleep(0.3)
+    coingecko_server.latency = 0.3
+
+    results = get_concurrently(cache, 5, 8)
+
+    assert all(info['source'] == 'stale' for _, info in results)
+    wait_for(lambda: cache.counters['loads'] == 2)
+    assert coingecko_server.requests_served == 2
+    assert cache.get(5)[1]['source'] == 'fresh'
+
+
+def test_concurrent_misses_are_coalesced_into_one_load(app, coingecko_server):
+    calls = []
+
+    def loader(limit):
+        calls.append(limit)
+        return CryptocurrencyService.fetch_upstream(limit)
+
+    coingecko_server.latency = 0.3
+    cache = RefreshingCache(loader, ttl=60, stale_ttl=3600)
+
+    results = get_concurrently(cache, 5, 8)
+
+    assert calls == [5]
+    assert coingecko_server.requests_served == 1
+    assert all(len(coins) == 5 and info['source'] == 'fresh' for coins, info in results)
+    assert cache.counters['misses'] == 8
+    assert cache.counters['coalesced'] == 7
+
+
+def test_failed_load_is_not_retried_during_backoff(app, coingecko_server):
+    cache = make_cache(retry_delay=0.5)
+    coingecko_server.down = True
+
+    assert cache.get(5) == (None, {'source': None, 'fetched_at': None, 'age': None})
+    assert [cache.get(5)[0] for _ in range(3)] == [None] * 3
+    assert coingecko_server.requests_served == 1
+    assert cache.counters['failures'] == 1
+
+    # Retried once the backoff is over
+    coingecko_server.down = False
+    time.sleep(0.5)
+    coins, info = cache.get(5)
+    assert len(coins) == 5 and info['source'] == 'fresh'
+    assert coingecko_server.requests_served == 2
+
+
+def test_cold_failure_falls_back_to_sqlite_snapshot(app, coingecko_server):
+    # A previous process recorded good data (fetch_upstream keeps it in crypto_snapshots)
+    recorded, _ = make_cache().get(5)
+    saved, fetched_at = CryptoSnapshotModel.load('markets:5')
+    assert saved == recorded
+
+    coingecko_server.down = True
+    cache = make_cache()
+    coins, info = cache.get(5)
+
+    assert coins == recorded
+    assert info['fetched_at'] == fetched_at
+    assert cache.counters['failures'] == 1
+    assert cache.counters['fallbacks'] == 1
+    assert coingecko_server.requests_served == 2
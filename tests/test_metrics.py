@@ -0,0 +1,43 @@
+"""SQL timing of the instrumented SQLite connection (metrics.InstrumentedConnection)"""
+
+import sqlite3
+
+import metrics
+
+
+def fetch_seconds(sql: str) -> float:
+    return metrics.FETCH_SECONDS._values.get((metrics.query_label(sql),), 0.0)
+
+
+def connect() -> sqlite3.Connection:
+    db = sqlite3.connect(':memory:', factory=metrics.InstrumentedConnection)
+    db.execute('CREATE TABLE t (x INTEGER)')
+    db.executemany('INSERT INTO t VALUES (?)', [(i,) for i in range(1000)])
+    return db
+
+
+def test_cursor_iteration_is_timed():
+    db = connect()
+    sql = 'SELECT x FROM t WHERE x >= 0'
+    token = metrics.start_request()
+    try:
+        rows = [row[0] for row in db.execute(sql)]
+        timings = metrics.server_timing(0)
+    finally:
+        metrics.end_request(token)
+
+    assert rows == list(range(1000))
+    assert fetch_seconds(sql) > 0
+    assert 'db;' in timings
+
+
+def test_abandoned_iteration_is_reported_by_the_next_statement():
+    db = connect()
+    sql = 'SELECT x FROM t WHERE x < 10'
+    cursor = db.cursor()
+    next(iter(cursor.execute(sql)))
+    before = fetch_seconds(sql)
+
+    cursor.execute('SELECT 1')
+
+    assert fetch_seconds(sql) > before
@@ -0,0 +1,41 @@
+"""Serialized /api/chart bodies (PayloadService) round-trip through json.loads"""
+
+import json
+from datetime import date
+
+from models import CurrencyRatesModel
+from services import NBPBackfillEngine, NBPService, PayloadService
+
+
+def chart_body(currency: str, period: str) -> dict:
+    etag = PayloadService.chart_etag(currency, period, 'json')
+    return json.loads(PayloadService.get_chart_json(currency, period, etag))
+
+
+def test_embed_json_keeps_encoded_members_verbatim():
+    text = PayloadService.embed_json({'name': 'a "quoted" ą', 'n': 1}, raw='[1, 2.5, null]')
+
+    assert json.loads(text) == {'name': 'a "quoted" ą', 'n': 1, 'raw': [1, 2.5, None]}
+
+
+def test_chart_json_without_data(app):
+    body = chart_body('USD', '1month')
+
+    assert body == {'status': 'success',
+                    'data': {'points': 0, 'currency': 'USD', 'period': '1month', 'chart': None}}
+
+
+def test_chart_json_embeds_the_chart_payload(app, nbp_server):
+    nbp_server()
+    tables = NBPBackfillEngine().fetch(date(2024, 1, 1), date.today(), ('A', 'C'))
+    CurrencyRatesModel.upsert_rates(NBPService.merge_tables(tables, ['USD']))
+
+    body = chart_body('USD', 'all')
+    payload = PayloadService.get_chart_payload('USD', 'all')
+
+    assert body['status'] == 'success'
+    assert body['data']['chart'] == json.loads(payload['chart_json'])
+    meta = {key: value for key, value in payload.items() if key != 'chart_json'}
+    assert {key: body['data'][key] for key in meta} == json.loads(json.dumps(meta))
+    assert (body['data']['currency'], body['data']['period']) == ('USD', 'all')
+    assert len(body['data']['chart']['dates']) == payload['chart_points']
@@ -0,0 +1,72 @@
+"""Columnar snapshot files: full writes, in-place appends and failed writes"""
+
+import os
+from datetime import date, timedelta
+
+import pytest
+
+import snapshots
+from cache import RateSeries
+from snapshots import RateSnapshot, SnapshotStore, write_snapshot
+
+
+def make_series(start: date, count: int, currency: str = 'USD') -> RateSeries:
+    rows = [{'date': (start + timedelta(days=i)).isoformat(), 'mid_rate': 4.0 + i / 1000,
+             'bid_rate': None if i % 3 else 3.9 + i / 1000, 'ask_rate': 4.1 + i / 1000}
+            for i in range(count)]
+    return RateSeries.from_rows(currency, rows)
+
+
+def as_lists(series) -> list:
+    """Columns as lists, NaN as None (so they compare equal)"""
+    return [list(series.days)] + [RateSeries.to_list(getattr(series, field)) for field in ('mid', 'bid', 'ask')]
+
+
+def test_appended_rows_are_written_in_place(tmp_path, monkeypatch):
+    monkeypatch.setattr(snapshots, 'SNAPSHOT_RESERVE_ROWS', 10)
+    path = str(tmp_path / 'USD.rates')
+    store = SnapshotStore()
+    full = make_series(date(2024, 1, 1), 25)
+    first = RateSeries('USD', *(column[:20] for column in (full.days, full.mid, full.bid, full.ask)))
+    later = RateSeries('USD', *(column[20:] for column in (full.days, full.mid, full.bid, full.ask)))
+
+    snapshot = store.put(path, first, 1.0)
+    inode, size = os.stat(path).st_ino, os.stat(path).st_size
+    appended = store.append(path, snapshot, later, 2.0)
+
+    assert appended is not None
+    assert (appended.count, appended.capacity, appended.updated_at) == (25, 30, 2.0)
+    assert as_lists(appended.slice()) == as_lists(full)
+    # Same file, same size: nothing but the new rows and the header was written
+    assert (os.stat(path).st_ino, os.stat(path).st_size) == (inode, size)
+    # The previous mapping still sees its own rows
+    assert as_lists(snapshot.slice()) == as_lists(first)
+    assert store.stats()['appends'] == 1 and store.stats()['writes'] == 1
+
+
+def test_append_without_room_or_on_a_replaced_file_writes_nothing(tmp_path, monkeypatch):
+    monkeypatch.setattr(snapshots, 'SNAPSHOT_RESERVE_ROWS', 2)
+    path = str(tmp_path / 'USD.rates')
+    store = SnapshotStore()
+    snapshot = store.put(path, make_series(date(2024, 1, 1), 5), 1.0)
+
+    assert store.append(path, snapshot, make_series(date(2024, 1, 6), 3), 2.0) is None
+
+    store.put(path, make_series(date(2024, 1, 1), 6), 3.0)
+    assert store.append(path, snapshot, make_series(date(2024, 1, 6), 1), 4.0) is None
+    assert RateSnapshot.open(path, 'USD').updated_at == 3.0
+
+
+def test_failed_write_leaves_no_temporary_file(tmp_path, monkeypatch):
+    path = str(tmp_path / 'USD.rates')
+    write_snapshot(path, make_series(date(2024, 1, 1), 5), 1.0)
+
+    def fail(source, target):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(snapshots.os, 'replace', fail)
+    with pytest.raises(OSError):
+        write_snapshot(path, make_series(date(2024, 1, 1), 6), 2.0)
+
+    assert os.listdir(tmp_path) == ['USD.rates']
+    assert RateSnapshot.open(path, 'USD').updated_at == 1.0